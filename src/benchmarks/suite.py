@@ -0,0 +1,450 @@
+"""
+Benchmarks how the stages of the data and feature pipeline scale with the
+amount of keywords, on synthetic data and fully offline. Every stage is timed
+(the best of a few runs) and profiled for its peak memory, and the results are
+compared against a stored baseline, flagging the stages that got slower or
+use more memory.
+
+Usage:
+    python -m src.benchmarks.suite --scales 1 10 100
+    python -m src.benchmarks.suite --scales 1 10 100 --save
+    python -m src.benchmarks.suite --stages adjust_daily --scales 1000
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.benchmarks import synthetic
+from src.data import update_data
+from src.data.client import Client
+from src.data.make_dataset import Trends
+from src.data.scheduler import RateLimiter
+from src.data.stand_in import StandInServer
+from src.features import build_dataset
+from src.features.build_features import panel_features
+from src.models.backtest import backtest
+
+BASELINE = 'reports/benchmarks/baseline.json'
+
+
+def trends(downloads, client):
+    """Trends of the synthetic downloads of a keyword, as if it was pulled."""
+
+    name, frames = downloads
+    keyword = Trends(name, synthetic.START, synthetic.END, client=client)
+    keyword.daily = frames['daily']
+    keyword.weekly = frames['weekly']
+    keyword.monthly = frames['monthly']
+
+    return keyword
+
+
+def adjust_weekly(scale, workspace):
+    """``Trends.adjust_weekly`` of every keyword."""
+
+    client = Client(cache=None)
+    downloads = list(synthetic.keywords(scale))
+
+    def run():
+        # Adjusting replaces the frames instead of changing them, so the
+        # downloads can be adjusted again.
+        for keyword in downloads:
+            trends(keyword, client).adjust_weekly()
+
+    return None, run
+
+
+def adjust_daily(scale, workspace):
+    """``Trends.adjust_daily`` of every keyword, with the weekly adjusted."""
+
+    client = Client(cache=None)
+    downloads = []
+    for name, frames in synthetic.keywords(scale):
+        keyword = trends((name, frames), client)
+        keyword.adjust_weekly()
+        downloads.append((name, {**frames, 'weekly': keyword.weekly}))
+
+    def run():
+        for keyword in downloads:
+            trends(keyword, client).adjust_daily()
+
+    return None, run
+
+
+def update_daily(scale, workspace):
+    """
+    ``update_data.update_daily`` of every keyword, which appends the last 30
+    days, against a stand-in server on localhost.
+    """
+
+    names = [f'keyword_{index}' for index in range(scale)]
+
+    os.makedirs(os.path.join(workspace, 'src', 'data'))
+    with open(os.path.join(workspace, 'src', 'data', 'keywords.txt'),
+              'w') as f:
+        f.write(''.join(f'{name}\n' for name in names))
+
+    # Only the last year, because only the last row is read.
+    end = datetime.date.today() - datetime.timedelta(days=30)
+    dates = pd.date_range(end - datetime.timedelta(days=365), end)
+    stored = os.path.join(workspace, 'stored')
+    os.makedirs(stored)
+    for index, name in enumerate(names):
+        values = np.random.default_rng(index).uniform(0, 1, len(dates))
+        pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'),
+                      'Adjusted': values.round(2)}).to_csv(
+            os.path.join(stored, f'{name}.csv'), index=False)
+
+    server = StandInServer(capacity=1e9, latency=0).start()
+    clients = []
+
+    def prepare():
+        shutil.rmtree(os.path.join(workspace, 'data'), ignore_errors=True)
+        shutil.copytree(stored, os.path.join(workspace, 'data', 'interim',
+                                             'daily'))
+
+        clients[:] = [Client(
+            host=server.url, limiter=RateLimiter(rate=1e9, burst=10 ** 6),
+            cache=None)]
+
+    def run():
+        directory = os.getcwd()
+        os.chdir(workspace)
+        try:
+            update_data.update_daily(clients[0])
+        finally:
+            os.chdir(directory)
+
+    def close():
+        server.stop()
+
+    run.close = close
+    return prepare, run
+
+
+def features(scale, workspace):
+    """``panel_features`` of the weekly data of all keywords."""
+
+    panel = synthetic.panel(scale, 'weekly')
+
+    def run():
+        panel_features(panel, [3])
+
+    return None, run
+
+
+def processed(scale, workspace):
+    """``build_dataset.build`` of all weekly processed datasets."""
+
+    panel = synthetic.panel(scale, 'weekly')
+    dates = pd.date_range(panel.index[0], panel.index[-1], freq='W-MON')
+    close = pd.Series(np.exp(np.cumsum(
+        np.random.default_rng(0).normal(0, 0.02, len(dates)))), index=dates)
+
+    def run():
+        build_dataset.build(panel, close, 'weekly')
+
+    return None, run
+
+
+def daily_returns(periods=4000):
+    """Synthetic daily returns of the DJIA."""
+
+    return np.random.default_rng(0).normal(0.0003, 0.01, periods)
+
+
+def backtest_vectorized(scale, workspace):
+    """``backtest`` of as many random strategies as the scale."""
+
+    returns = daily_returns()
+    signals = np.random.default_rng(1).integers(0, 2, (len(returns), scale))
+
+    def run():
+        backtest(signals, returns)
+
+    return None, run
+
+
+def backtest_loop(scale, workspace):
+    """The backtest loop of the notebooks, once per strategy."""
+
+    changes = pd.Series(1 + daily_returns())
+    signals = np.random.default_rng(1).integers(0, 2, (scale, len(changes)))
+
+    def run():
+        for y_pred in signals:
+            position = 100
+            history = []
+
+            i = 0
+            while i < len(y_pred):
+                if y_pred[i] == 1:
+                    position *= changes[i]
+                else:
+                    position /= changes[i]
+
+                history.append(position)
+                i += 1
+
+    return None, run
+
+
+# Benchmarks, with the largest scale they run at within minutes, if any.
+BENCHMARKS = {
+    'adjust_weekly': (adjust_weekly, None),
+    'adjust_daily': (adjust_daily, None),
+    'update_daily': (update_daily, None),
+    'build_features': (features, None),
+    'build_dataset': (processed, None),
+    'backtest': (backtest_vectorized, None),
+    'backtest_loop': (backtest_loop, 100),
+}
+
+
+def measure(setup, scale, repeat=3):
+    """
+    Times a benchmark and profiles its peak memory.
+
+    Args:
+        setup (callable): Benchmark, which returns a function that prepares
+            every run (or ``None``) and the function to measure.
+        scale (int): Amount of keywords.
+        repeat (int, optional): Amount of timed runs. Defaults to 3.
+
+    Returns:
+        dict: The fastest run in `seconds`, and the `peak_bytes` allocated
+            during a run.
+
+    """
+
+    with tempfile.TemporaryDirectory() as workspace, \
+            contextlib.redirect_stdout(io.StringIO()):
+        prepare, run = setup(scale, workspace)
+
+        try:
+            times = []
+            for _ in range(repeat):
+                if prepare is not None:
+                    prepare()
+                gc.collect()
+
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+
+            # Measured separately, because tracing slows the run down.
+            if prepare is not None:
+                prepare()
+            gc.collect()
+
+            tracemalloc.start()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            if hasattr(run, 'close'):
+                run.close()
+
+    return {'seconds': min(times), 'peak_bytes': peak}
+
+
+def environment():
+    """Versions and machine the results were measured with."""
+
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def run(stages=None, scales=(1, 10, 100), repeat=3):
+    """
+    Runs the benchmarks.
+
+    Args:
+        stages (list, optional): Names of the benchmarks to run. Defaults to
+            all of ``BENCHMARKS``.
+        scales (iterable, optional): Amounts of keywords. Defaults to 1, 10
+            and 100.
+        repeat (int, optional): Amount of timed runs. Defaults to 3.
+
+    Returns:
+        dict: The `environment` and the `results` of every benchmark by
+            scale.
+
+    Raises:
+        ValueError: If a benchmark is unknown.
+
+    """
+
+    if stages is None:
+        stages = list(BENCHMARKS)
+
+    for stage in stages:
+        if stage not in BENCHMARKS:
+            raise ValueError(f'Unknown benchmark `{stage}`.')
+
+    results = {}
+    for stage in stages:
+        setup, max_scale = BENCHMARKS[stage]
+        results[stage] = {}
+
+        for scale in scales:
+            if max_scale is not None and scale > max_scale:
+                continue
+
+            results[stage][str(scale)] = measure(setup, scale, repeat)
+
+            result = results[stage][str(scale)]
+            print(f'{stage:<16} {scale:>6} {result["seconds"]:>10.4f} s '
+                  f'{result["peak_bytes"] / 2 ** 20:>10.1f} MiB',
+                  file=sys.stderr)
+
+    return {'environment': environment(), 'results': results}
+
+
+def compare(current, baseline, tolerance=0.25):
+    """
+    Compares results against a baseline.
+
+    Args:
+        current (dict): Results of ``run``.
+        baseline (dict): Results of ``run`` to compare against.
+        tolerance (float, optional): Relative increase of the time or memory
+            that is flagged as a regression. Defaults to 0.25.
+
+    Returns:
+        pandas.DataFrame: Time, memory and their changes of every benchmark
+            and scale in both, with a `regression` column.
+
+    """
+
+    rows = []
+    for stage, scales in current['results'].items():
+        for scale, result in scales.items():
+            before = baseline['results'].get(stage, {}).get(scale)
+            if before is None:
+                continue
+
+            time_change = result['seconds'] / before['seconds'] - 1
+            memory_change = result['peak_bytes'] / \
+                max(before['peak_bytes'], 1) - 1
+
+            rows.append({
+                'stage': stage,
+                'scale': int(scale),
+                'seconds': result['seconds'],
+                'baseline_seconds': before['seconds'],
+                'time_change': time_change,
+                'peak_mib': result['peak_bytes'] / 2 ** 20,
+                'baseline_peak_mib': before['peak_bytes'] / 2 ** 20,
+                'memory_change': memory_change,
+                'regression': time_change > tolerance
+                or memory_change > tolerance,
+            })
+
+    return pd.DataFrame(rows)
+
+
+def report(comparison, current, baseline):
+    """Formats a comparison as text."""
+
+    lines = []
+    if current['environment'] != baseline['environment']:
+        lines.append('The baseline was measured in another environment:')
+        for key, value in baseline['environment'].items():
+            if current['environment'].get(key) != value:
+                lines.append(f'    {key}: {value} (now '
+                             f'{current["environment"].get(key)})')
+        lines.append('')
+
+    if comparison.empty:
+        lines.append('No benchmarks in common with the baseline.')
+        return '\n'.join(lines)
+
+    lines.append(f'{"stage":<16} {"scale":>6} {"seconds":>10} {"change":>8} '
+                 f'{"MiB":>10} {"change":>8}')
+    for row in comparison.itertuples():
+        flag = '  REGRESSION' if row.regression else ''
+        lines.append(f'{row.stage:<16} {row.scale:>6} {row.seconds:>10.4f} '
+                     f'{row.time_change:>+8.1%} {row.peak_mib:>10.1f} '
+                     f'{row.memory_change:>+8.1%}{flag}')
+
+    regressions = int(comparison['regression'].sum())
+    lines.append('')
+    lines.append(f'{regressions} regression(s) in {len(comparison)} '
+                 f'benchmarks.')
+
+    return '\n'.join(lines)
+
+
+def write(results, path):
+    """Writes results to a JSON-file via a temporary file."""
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    os.replace(temporary, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the pipeline on synthetic data.')
+    parser.add_argument('--stages', nargs='+', default=None,
+                        choices=list(BENCHMARKS))
+    parser.add_argument('--scales', nargs='+', type=int, default=[1, 10, 100],
+                        help='amounts of keywords, up to 10000')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='amount of timed runs of every benchmark')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='JSON-file of the baseline')
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the baseline instead of '
+                             'comparing against it')
+    parser.add_argument('--output', default=None,
+                        help='JSON-file to which the results are written')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative increase flagged as a regression')
+    args = parser.parse_args()
+
+    results = run(args.stages, args.scales, args.repeat)
+
+    if args.output is not None:
+        write(results, args.output)
+
+    if args.save:
+        write(results, args.baseline)
+        print(f'Stored the baseline in {args.baseline}.')
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+        comparison = compare(results, baseline, args.tolerance)
+        print(report(comparison, results, baseline))
+
+        if len(comparison) and comparison['regression'].any():
+            sys.exit(1)
+    else:
+        print(f'There is no baseline in {args.baseline}; store one with '
+              f'--save.')
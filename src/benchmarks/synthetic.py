@@ -0,0 +1,210 @@
+"""
+Synthetic Google Trends data, in the shape in which ``Trends`` downloads it:
+daily data in 6-month windows, weekly data in 5-year windows and monthly data
+in one window, each relative to its own maximum from 0 to 100. The searches
+of every keyword are drawn from a Poisson distribution around a random walk,
+so rarely searched keywords have zeros, like on Google Trends.
+
+Every keyword is generated from its own seed, one at a time, so any amount of
+keywords can be generated without keeping them in memory.
+"""
+
+import datetime
+import functools
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+START = datetime.date(2004, 1, 1)
+END = datetime.date(2020, 6, 30)
+
+
+@functools.lru_cache(maxsize=8)
+def calendar(start=START, end=END):
+    """
+    Dates and windows of the daily, weekly and monthly data, like
+    ``Trends.pull_daily``, ``pull_weekly`` and ``pull_monthly`` request them.
+
+    Returns:
+        dict: Dictionary of the periodicities to the date strings, the
+            position of every day in the periods and the (first, last, kept)
+            positions of the periods of every window.
+
+    """
+
+    days = pd.date_range(start, end, freq='D')
+
+    # Google Trends dates weeks on the Sunday they start with.
+    weeks = days[days.dayofweek == 6]
+    if weeks[0] > days[0]:
+        weeks = weeks.insert(0, weeks[0] - pd.Timedelta(days=7))
+
+    months = pd.date_range(pd.Timestamp(start).replace(day=1), end, freq='MS')
+
+    def windows(dates, period, overlap):
+        result = []
+        first = start
+        while True:
+            last = first + period
+            lower = dates.searchsorted(pd.Timestamp(first))
+            upper = dates.searchsorted(pd.Timestamp(min(last, end)),
+                                       side='right')
+
+            first += period
+            if first > end:
+                result.append((lower, upper, upper))
+                return result
+
+            # The last day of a daily window is the first of the next one,
+            # and is removed from the earlier one.
+            result.append((lower, upper, upper - 1 if overlap else upper))
+
+    return {
+        'daily': (days.strftime('%Y-%m-%d').to_numpy(),
+                  np.arange(len(days)),
+                  windows(days, relativedelta(months=+6), True)),
+        'weekly': (weeks.strftime('%Y-%m-%d').to_numpy(),
+                   weeks.searchsorted(days, side='right') - 1,
+                   windows(weeks, relativedelta(years=+5), False)),
+        'monthly': (months.strftime('%Y-%m').to_numpy(),
+                    months.searchsorted(days, side='right') - 1,
+                    [(0, len(months), len(months))]),
+    }
+
+
+def searches(index, days, seed=0):
+    """
+    Daily amount of searches of a keyword.
+
+    Args:
+        index (int): Index of the keyword; seeds it.
+        days (int): Amount of days.
+        seed (int, optional): Seed of all keywords. Defaults to 0.
+
+    Returns:
+        numpy.ndarray: Amount of searches of every day.
+
+    """
+
+    generator = np.random.default_rng([seed, index])
+
+    # From a few searches a day, with many zeros, to thousands.
+    popularity = 10 ** generator.uniform(-0.5, 3.5)
+    walk = np.cumsum(generator.normal(0, 0.03, days))
+    weekday = 1 + 0.2 * np.sin(2 * np.pi * np.arange(days) / 7)
+
+    return generator.poisson(popularity * np.exp(walk - walk.max() / 2)
+                             * weekday)
+
+
+def relative(counts, windows):
+    """Concatenates windows of counts, each scaled to 0 to 100 by its max."""
+
+    parts = []
+    for first, last, kept in windows:
+        window = counts[first:last]
+        peak = window.max()
+        scaled = np.rint(100 * window / peak) if peak else \
+            np.zeros(len(window))
+        parts.append(scaled[:kept - first])
+
+    return np.concatenate(parts).astype('int64')
+
+
+def keyword(index, seed=0, start=START, end=END):
+    """
+    Synthetic downloads of one keyword.
+
+    Args:
+        index (int): Index of the keyword; seeds it.
+        seed (int, optional): Seed of all keywords. Defaults to 0.
+        start (datetime.date, optional): First date. Defaults to 2004-01-01.
+        end (datetime.date, optional): Last date. Defaults to 2020-06-30.
+
+    Returns:
+        dict: Dictionary of 'daily', 'weekly' and 'monthly' to DataFrames
+            with `Date` and `relative_frequency` columns, like the attributes
+            of ``Trends`` after pulling.
+
+    """
+
+    periods = calendar(start, end)
+    counts = searches(index, len(periods['daily'][0]), seed)
+
+    frames = {}
+    for periodicity, (dates, positions, windows) in periods.items():
+        totals = np.bincount(positions, weights=counts,
+                             minlength=len(dates))
+        values = relative(totals, windows)
+
+        kept = np.concatenate([np.arange(first, kept)
+                               for first, _, kept in windows])
+        frames[periodicity] = pd.DataFrame({
+            'Date': dates[kept],
+            'relative_frequency': values,
+        })
+
+    return frames
+
+
+def keywords(amount, seed=0, start=START, end=END):
+    """
+    Generates the synthetic downloads of keywords one at a time.
+
+    Yields:
+        tuple: Name of the keyword, like `keyword_0`, and its downloads, see
+            ``keyword``.
+
+    """
+
+    for index in range(amount):
+        yield f'keyword_{index}', keyword(index, seed, start, end)
+
+
+def panel(amount, periodicity='weekly', seed=0, start=START, end=END):
+    """
+    Synthetic data of keywords over one window, as a DataFrame of dates by
+    keywords, like ``build_dataset.load``.
+
+    Args:
+        amount (int): Amount of keywords.
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'weekly'.
+
+    Returns:
+        pandas.DataFrame: Values from 0 to 1 of dates by keywords.
+
+    """
+
+    dates, positions, _ = calendar(start, end)[periodicity]
+    values = np.empty((len(dates), amount))
+
+    for index in range(amount):
+        totals = np.bincount(positions,
+                             weights=searches(index, len(positions), seed),
+                             minlength=len(dates))
+        peak = totals.max()
+        values[:, index] = np.round(totals / peak, 2) if peak else 0
+
+    return pd.DataFrame(values, index=pd.DatetimeIndex(dates, name='Date'),
+                        columns=[f'keyword_{index}'
+                                 for index in range(amount)])
+
+
+def close(seed=0, start=START, end=END):
+    """
+    Synthetic closing prices of the DJIA on business days: a random walk of
+    the daily returns, which are independent of the keywords.
+
+    Returns:
+        pandas.Series: Closing prices indexed by date.
+
+    """
+
+    dates = pd.bdate_range(start, end, name='Date')
+    returns = np.random.default_rng([seed, 2 ** 32 - 1]).normal(0.0003, 0.01,
+                                                       len(dates))
+
+    return pd.Series(10000 * np.exp(np.cumsum(returns)), index=dates,
+                     name='Close')
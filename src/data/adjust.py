@@ -0,0 +1,100 @@
+"""
+Chain-links Google Trends increments. Google Trends only returns data that is
+relative within the timespan it was requested for, so every increment is
+rescaled such that it passes through one data point of a coarser periodicity
+(the anchor), and the data points around the anchor follow the percentage
+change of the unadjusted data.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def increments(dates, start_date, period):
+    """
+    Assigns each date to the increment it was downloaded in.
+
+    Args:
+        dates (pandas.Series): Dates of the data points.
+        start_date (datetime.date): Start date of the first increment.
+        period (dateutil.relativedelta.relativedelta): Length of one
+            increment.
+
+    Returns:
+        numpy.ndarray: Index of the increment of each date.
+
+    """
+
+    dates = pd.to_datetime(dates).values.astype('datetime64[D]')
+
+    boundaries = [start_date]
+    while len(dates) and np.datetime64(boundaries[-1], 'D') <= dates.max():
+        boundaries.append(boundaries[-1] + period)
+
+    boundaries = np.array(boundaries, dtype='datetime64[D]')
+
+    return np.searchsorted(boundaries, dates, side='right') - 1
+
+
+def anchors(increment, mask):
+    """
+    Finds the anchor of each data point: the first data point in its
+    increment for which ``mask`` is true. Data points in an increment without
+    such a point are anchored on the next increment, and trailing ones on the
+    previous increment.
+
+    Args:
+        increment (numpy.ndarray): Non-decreasing increment index of each data
+            point.
+        mask (numpy.ndarray): Boolean array, true where a data point can be
+            used as anchor.
+
+    Returns:
+        numpy.ndarray: Position of the anchor of each data point.
+
+    Raises:
+        ValueError: If none of the data points can be used as anchor.
+
+    """
+
+    candidates = np.flatnonzero(mask)
+    if not len(candidates):
+        raise ValueError('There is no data point to anchor the data on.')
+
+    # First candidate of each increment.
+    first = candidates[np.r_[True, np.diff(increment[candidates]) != 0]]
+
+    position = np.searchsorted(increment[first], increment, side='left')
+    position = np.minimum(position, len(first) - 1)
+
+    return first[position]
+
+
+def chain_link(values, anchor, anchor_values):
+    """
+    Computes the anchored cumulative product of the percentage change of
+    ``values``, forward and backward from the anchor of each data point.
+
+    Args:
+        values (numpy.ndarray): Unadjusted data, without zeros.
+        anchor (numpy.ndarray): Position of the anchor of each data point, as
+            returned by ``anchors``.
+        anchor_values (numpy.ndarray): Value that the data point at each
+            position is anchored to. Only the anchor positions are used.
+
+    Returns:
+        numpy.ndarray: The adjusted data.
+
+    """
+
+    values = np.asarray(values, dtype='float64')
+    anchor_values = np.asarray(anchor_values, dtype='float64')
+
+    change = np.ones(len(values))
+    change[1:] = values[1:] / values[:-1]
+
+    # Every run of data points sharing an anchor starts a new product.
+    change[np.r_[True, anchor[1:] != anchor[:-1]]] = 1
+    product = np.cumprod(change)
+
+    return anchor_values[anchor] * product / product[anchor]
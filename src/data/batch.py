@@ -0,0 +1,245 @@
+"""
+Pulls keywords from Google Trends in batches of up to five per request,
+instead of one, which cuts the amount of requests by about four. Every batch
+contains the same anchor keyword next to four others, and every window of a
+batch is rescaled such that the anchor matches the anchor of the first batch,
+so that the values of all keywords are relative to the same maximum and
+comparable across batches. Once adjusted, every keyword is relative to its
+own maximum again, like when it is pulled on its own.
+
+The batches are pulled in the same windows as single keywords (see
+``make_dataset.windows``), and each keyword ends up as a ``Trends`` of which
+the daily, weekly and monthly data is pulled, ready to be adjusted.
+
+Usage:
+    python -m src.data.make_dataset --batch --anchor debt
+"""
+
+import datetime
+
+import pandas as pd
+
+from src.data import telemetry
+from src.data.client import Client
+from src.data.make_dataset import Trends, plan, widget_url
+
+# Google Trends compares up to five keywords per request.
+MAX_KEYWORDS = 5
+
+RESOLUTIONS = {'DAY': 'daily', 'WEEK': 'weekly', 'MONTH': 'monthly'}
+
+
+def groups(keywords, anchor, size=MAX_KEYWORDS):
+    """
+    Packs keywords into groups that all contain the anchor.
+
+    Args:
+        keywords (list): Search terms as one would search them.
+        anchor (str): Search term that is compared with every group.
+        size (int, optional): Amount of keywords per group, including the
+            anchor. Defaults to 5.
+
+    Returns:
+        list: Groups of keywords, each starting with the anchor.
+
+    Raises:
+        ValueError: If ``size`` is less than 2 or greater than 5.
+
+    """
+
+    if not 2 <= size <= MAX_KEYWORDS:
+        raise ValueError(f'`size` must be between 2 and {MAX_KEYWORDS}.')
+
+    others = [keyword for keyword in dict.fromkeys(keywords)
+              if keyword != anchor]
+    if not others:
+        return [[anchor]] if anchor in keywords else []
+
+    return [[anchor] + others[i:i + size - 1]
+            for i in range(0, len(others), size - 1)]
+
+
+def fetch(group, client, start_date=datetime.date(2004, 1, 1),
+          end_date=datetime.date.today()):
+    """
+    Pulls all windows of every resolution of one group.
+
+    Args:
+        group (list): Up to five search terms, the anchor first.
+        client (Client): Client which every request goes through.
+        start_date (datetime.date, optional): The start date from where to
+            pull data. Defaults to 2004-01-01.
+        end_date (datetime.date, optional): The end date to where to pull
+            data. Defaults to today.
+
+    Returns:
+        dict: Dictionary of the resolutions to a list of a (overlap, frame)
+            tuple per window, where the frame has a `Date` column and a
+            column per keyword.
+
+    """
+
+    result = {}
+    for resolution in RESOLUTIONS:
+        result[resolution] = []
+
+        group_windows = plan(client, group, start_date, end_date, resolution)
+        for start, end, overlap in group_windows:
+            token = client.token(group, f'{start} {end}', resolution)
+            frame = client.read_csv(widget_url(client.host, group, start, end,
+                                               resolution, token))
+
+            frame.columns = ['Date'] + list(group)
+
+            # Keywords that are much less searched than the others of the
+            # group are reported as "<1". Those are read as 1, like the
+            # zeros are by ``split``, so that a zero never ranks above a
+            # "<1".
+            for keyword in group:
+                frame[keyword] = pd.to_numeric(
+                    frame[keyword].replace('<1', 1)).astype('float64')
+
+            result[resolution].append((overlap, frame))
+
+        responses = client.responses
+        if responses is not None and not responses.offline:
+            responses.record(group, start_date, resolution, group_windows)
+
+    return result
+
+
+def split(fetched, anchor):
+    """
+    Rescales the windows of every group against those of the first group,
+    and splits them by keyword.
+
+    Zeros are read as 1 before the windows are rescaled, like
+    ``Trends.adjust_weekly`` and ``adjust_daily`` do, so that they stay level
+    with a "<1" in every group. A window of which the anchor is zero in either
+    group can't be rescaled, and is kept as it is.
+
+    The pulled data of all keywords is relative to the same maximum, but the
+    adjusted data isn't: ``Trends.adjust_weekly`` and ``adjust_daily`` divide
+    every keyword by its own maximum, like for a single keyword, so the
+    rescaling cancels out of data/raw.
+
+    Args:
+        fetched (list): (group, result of ``fetch``) of every group. The
+            first is the reference.
+        anchor (str): Search term that is in every group.
+
+    Returns:
+        dict: Dictionary of the keywords to dictionaries of 'daily',
+            'weekly' and 'monthly' to DataFrames with `Date` and
+            `relative_frequency` columns, like the attributes of ``Trends``
+            after pulling.
+
+    """
+
+    if not fetched:
+        return {}
+
+    _, reference = fetched[0]
+
+    chunks = {}
+    for position, (group, result) in enumerate(fetched):
+        for resolution, periodicity in RESOLUTIONS.items():
+            for window, (overlap, frame) in enumerate(result[resolution]):
+                target = reference[resolution][window][1][anchor].sum()
+                own = frame[anchor].sum()
+
+                factor = 1.0
+                if position and target > 0 and own > 0:
+                    factor = target / own
+                elif position:
+                    telemetry.count('unanchored_windows_total')
+
+                if overlap:
+                    frame = frame[:-1]
+
+                for keyword in group:
+                    # The anchor is taken from the reference group.
+                    if position and keyword == anchor:
+                        continue
+
+                    chunks.setdefault(keyword, {}).setdefault(
+                        periodicity, []).append(pd.DataFrame({
+                            'Date': frame['Date'].values,
+                            'relative_frequency':
+                            frame[keyword].replace(0, 1).values * factor,
+                        }))
+
+    return {keyword: {periodicity: pd.concat(parts, ignore_index=True)
+                      for periodicity, parts in frames.items()}
+            for keyword, frames in chunks.items()}
+
+
+def pull(keywords, anchor=None, client=None, scheduler=None,
+         start_date=datetime.date(2004, 1, 1), end_date=datetime.date.today()):
+    """
+    Pulls keywords in groups that share an anchor.
+
+    Args:
+        keywords (list): Search terms as one would search them.
+        anchor (str, optional): Search term that is compared with every
+            group. It should be searched steadily, and about as much as the
+            other keywords, because keywords that are searched far less than
+            the others of their group lose precision. Defaults to the first
+            keyword.
+        client (Client, optional): Client which every request goes through.
+            Defaults to a new one.
+        scheduler (Scheduler, optional): Scheduler that pulls the groups
+            concurrently and retries them. Defaults to pulling them one by
+            one.
+        start_date (datetime.date, optional): The start date from where to
+            pull data. Defaults to 2004-01-01.
+        end_date (datetime.date, optional): The end date to where to pull
+            data. Defaults to today.
+
+    Returns:
+        tuple: Dictionary of the keywords to their pulled ``Trends``, which
+            can be adjusted and downloaded, and dictionary of the keywords
+            that failed to their exceptions.
+
+    Raises:
+        ValueError: If there are no keywords.
+
+    """
+
+    if not keywords:
+        raise ValueError('There are no keywords to pull.')
+
+    if anchor is None:
+        anchor = keywords[0]
+
+    client = client if client is not None else Client()
+    batches = [tuple(group) for group in groups(keywords, anchor)]
+
+    def job(group):
+        return fetch(list(group), client, start_date, end_date)
+
+    if scheduler is None:
+        results = {group: job(group) for group in batches}
+        failed = {}
+    else:
+        results, failed = scheduler.run(job, batches)
+
+    frames = split([(list(group), results[group]) for group in batches
+                    if group in results], anchor)
+
+    trends = {}
+    for keyword in keywords:
+        if keyword not in frames:
+            continue
+
+        keyword_trends = Trends(keyword, start_date, end_date, client=client)
+        keyword_trends.daily = frames[keyword]['daily']
+        keyword_trends.weekly = frames[keyword]['weekly']
+        keyword_trends.monthly = frames[keyword]['monthly']
+        trends[keyword] = keyword_trends
+
+    errors = {keyword: exception for group, exception in failed.items()
+              for keyword in group if keyword in keywords
+              and keyword not in trends}
+
+    return trends, errors
@@ -0,0 +1,256 @@
+"""
+HTTP client for Google Trends, which is shared by all downloads. It keeps the
+connections alive, only fetches a new NID cookie when it has expired, and
+caches the tokens in memory and on disk.
+"""
+
+import io
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.data import telemetry
+from src.data.scheduler import RateLimiter
+
+HOST = 'https://trends.google.com'
+
+
+class Client():
+    """
+    Pooled session to Google Trends with a cookie jar and a token cache.
+
+    Attributes:
+        host (str): Host of Google Trends.
+        limiter (RateLimiter): Rate limiter which every request goes through.
+        cache (str): Path of the on-disk token cache, or ``None`` to only
+            cache in memory.
+        ttl (float): Seconds after which a cached token is evicted.
+        responses (ResponseCache): Cache in which the CSV responses are
+            recorded, or ``None`` to not record them.
+        session (requests.Session): Session with a keep-alive connection
+            pool.
+        requests (int): Amount of requests made.
+
+    """
+
+    def __init__(self, host=HOST, limiter=None,
+                 cache='data/interim/tokens.json', ttl=3600, pool_size=10,
+                 responses=None):
+        """
+        Args:
+            host (str, optional): Host of Google Trends. Defaults to
+                https://trends.google.com.
+            limiter (RateLimiter, optional): Rate limiter which is shared with
+                other clients. Defaults to a new one.
+            cache (str, optional): Path of the on-disk token cache, or
+                ``None`` to only cache in memory. Defaults to
+                data/interim/tokens.json.
+            ttl (float, optional): Seconds after which a cached token is
+                evicted. Defaults to 3600.
+            pool_size (int, optional): Amount of connections that are kept
+                alive. Defaults to 10.
+            responses (ResponseCache, optional): Cache in which the CSV
+                responses are recorded and from which they are replayed.
+                Defaults to not recording them.
+        """
+
+        self.host = host
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.cache = cache
+        self.ttl = ttl
+        self.responses = responses
+        self.requests = 0
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._tokens = self.load()
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        """
+        GET request through the rate limiter, which raises an exception on
+        an error status code.
+
+        Args:
+            url (str): URL to request.
+            **kwargs: Keyword arguments passed to ``requests.Session.get``.
+
+        Returns:
+            requests.Response: The response.
+
+        """
+
+        def get():
+            with self._lock:
+                self.requests += 1
+
+            if telemetry.current is None:
+                response = self.session.get(url, timeout=(2, 5), **kwargs)
+                response.raise_for_status()
+
+                return response
+
+            endpoint = urlparse(url).path
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=(2, 5), **kwargs)
+            except Exception as exception:
+                telemetry.count('http_requests_total', endpoint=endpoint,
+                                status=type(exception).__name__)
+                raise
+
+            telemetry.observe('http_request_seconds',
+                              time.perf_counter() - started, endpoint=endpoint)
+            telemetry.count('http_requests_total', endpoint=endpoint,
+                            status=str(response.status_code))
+            telemetry.count('http_response_bytes_total',
+                            len(response.content), endpoint=endpoint)
+
+            response.raise_for_status()
+            return response
+
+        return self.limiter.request(get)
+
+    def read_csv(self, url):
+        """
+        Reads one CSV-file from Google Trends, or replays it from the
+        response cache.
+
+        Args:
+            url (str): URL of the CSV-file.
+
+        Returns:
+            pandas.DataFrame: The CSV-file, without the category line.
+
+        """
+
+        if self.responses is None:
+            text = self.get(url).text
+        else:
+            text = self.responses.get(url, lambda url: self.get(url).text)
+
+        with telemetry.stage('parse_csv'):
+            frame = pd.read_csv(io.StringIO(text), header=1)
+
+        telemetry.count('rows_total', len(frame), stage='parse_csv')
+        return frame
+
+    def refresh_cookies(self):
+        """Fetches a new NID cookie if there is none or it has expired."""
+
+        with self._lock:
+            for cookie in self.session.cookies:
+                if cookie.name == 'NID' and not cookie.is_expired():
+                    return
+
+        # The lock isn't held during the request, so that other threads can
+        # use cached tokens meanwhile.
+        response = self.get(f'{self.host}/', params={'geo': 'US'})
+
+        with self._lock:
+            self.session.cookies.update(response.cookies)
+
+    def token(self, keyword, timespan, resolution='', geo='US'):
+        """
+        Retrieves a token from Google Trends, based on the keyword and
+        timespan. Tokens are cached until they are ``ttl`` seconds old.
+
+        This function is a deritative of a function within Pytrends by
+        github.com/GeneralMills. Licensed under the Apache license, version
+        2.0. Changes made by github.com/cristianpjensen to fit Njord's use
+        case.
+
+        Args:
+            keyword (str or list): Keyword for which the token should be
+                retrieved, or up to five keywords that are compared.
+            timespan (str): Start and end date of the timespan with a space
+                in between.
+            resolution (str, optional): Resolution of the data the token is
+                used for. Defaults to ''.
+            geo (str, optional): Country code. Defaults to US.
+
+        Returns:
+            str: Token, which can be used in the url for downloading the data.
+                Empty when the responses are only replayed, because then no
+                token is needed.
+
+        """
+
+        if self.responses is not None and self.responses.offline:
+            return ''
+
+        key = json.dumps([keyword, timespan, resolution, geo])
+
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is not None and time.time() - entry[1] < self.ttl:
+                telemetry.count('tokens_total', result='cached')
+                return entry[0]
+
+        telemetry.count('tokens_total', result='fetched')
+
+        self.refresh_cookies()
+
+        keywords = [keyword] if isinstance(keyword, str) else keyword
+        items = ', '.join('{"keyword": ' + f'"{keyword}"' +
+                          ', "time": ' + f'"{timespan}"' +
+                          f', "geo": "{geo}"' + '}' for keyword in keywords)
+
+        response = self.get(
+            f'{self.host}/trends/api/explore',
+            params={'hl': 'en-US', 'tz': -120,
+                    'req': '{"comparisonItem": [' + items +
+                    '], "category": 0, "property": ""}'}
+        )
+
+        content = response.text[4:]
+        token = json.loads(content)['widgets'][0]['token']
+
+        with self._lock:
+            self._tokens[key] = (token, time.time())
+            self.save()
+
+        return token
+
+    def load(self):
+        """Loads the tokens from the on-disk cache that haven't expired."""
+
+        if self.cache is None or not os.path.exists(self.cache):
+            return {}
+
+        try:
+            with open(self.cache, 'r') as f:
+                tokens = json.load(f)
+        except ValueError:
+            return {}
+
+        now = time.time()
+        return {key: tuple(entry) for key, entry in tokens.items()
+                if now - entry[1] < self.ttl}
+
+    def save(self):
+        """Writes the tokens that haven't expired to the on-disk cache."""
+
+        now = time.time()
+        self._tokens = {key: entry for key, entry in self._tokens.items()
+                        if now - entry[1] < self.ttl}
+
+        if self.cache is None:
+            return
+
+        os.makedirs(os.path.dirname(self.cache) or '.', exist_ok=True)
+
+        temporary = f'{self.cache}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self._tokens, f)
+
+        os.replace(temporary, self.cache)
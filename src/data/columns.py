@@ -0,0 +1,199 @@
+"""
+Stores many columns of one date index on disk as float32, in blocks of
+columns. Every block is a NumPy file of columns by rows, so that every column
+is contiguous and reading some columns only reads those from disk, next to a
+JSON-file with the names of its columns. Blocks are appended one at a time,
+so that a store can be written without holding all columns in memory.
+
+Usage:
+    store = ColumnStore('data/interim/blocks/daily/adjusted', dates)
+    store.append(['debt', 'stocks'], values)
+    frame = ColumnStore('data/interim/blocks/daily/adjusted').frame(0, 2)
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class ColumnStore():
+    """
+    Float32 columns of one date index, stored in blocks on disk.
+
+    Attributes:
+        directory (str): Directory of the store.
+        index (pandas.DatetimeIndex): Dates of the rows.
+        columns (list): Names of all columns, in the order of the blocks.
+        sizes (list): Amount of columns of every block.
+
+    """
+
+    def __init__(self, directory, index=None):
+        """
+        Args:
+            directory (str): Directory of the store.
+            index (pandas.DatetimeIndex, optional): Dates of the rows of a new
+                store, which replaces the store in the directory, if any.
+                Defaults to opening the store in the directory.
+
+        Raises:
+            FileNotFoundError: If ``index`` isn't given and there is no store
+                in the directory.
+
+        """
+
+        self.directory = directory
+
+        if index is not None:
+            os.makedirs(directory, exist_ok=True)
+            for name in os.listdir(directory):
+                if name.startswith('block-'):
+                    os.remove(os.path.join(directory, name))
+
+            np.save(os.path.join(directory, 'index.npy'),
+                    np.asarray(index, dtype='datetime64[D]'))
+
+        self.index = pd.DatetimeIndex(
+            np.load(os.path.join(directory, 'index.npy')))
+
+        self.columns = []
+        self.sizes = []
+
+        # A block is complete once its values are written, which happens
+        # after its names.
+        blocks = sorted(name[:-4] for name in os.listdir(directory)
+                        if name.startswith('block-') and name.endswith('.npy'))
+        for block in blocks:
+            with open(os.path.join(directory, f'{block}.json'), 'r') as f:
+                names = json.load(f)
+
+            self.columns += names
+            self.sizes.append(len(names))
+
+    def __len__(self):
+        return len(self.columns)
+
+    @property
+    def nbytes(self):
+        """Amount of bytes of the values of all columns."""
+
+        return 4 * len(self.columns) * len(self.index)
+
+    def path(self, block):
+        """Path of the values of a block, without the extension."""
+
+        return os.path.join(self.directory, f'block-{block:05d}')
+
+    def append(self, names, values):
+        """
+        Writes a block of columns, via temporary files.
+
+        Args:
+            names (list): Names of the columns.
+            values (numpy.ndarray or pandas.DataFrame): Values of rows by
+                columns, in the order of the index.
+
+        Raises:
+            ValueError: If the shape of ``values`` doesn't match the index and
+                names, or a name is already in the store.
+
+        """
+
+        values = np.asarray(values)
+        if values.shape != (len(self.index), len(names)):
+            raise ValueError('The shape of `values` must be rows by names.')
+
+        if len(set(names)) < len(names) or \
+                not set(self.columns).isdisjoint(names):
+            raise ValueError('The names must be unique within the store.')
+
+        path = self.path(len(self.sizes))
+
+        with open(f'{path}.json.tmp', 'w') as f:
+            json.dump(list(names), f)
+        os.replace(f'{path}.json.tmp', f'{path}.json')
+
+        with open(f'{path}.npy.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(values.T, dtype='float32'))
+        os.replace(f'{path}.npy.tmp', f'{path}.npy')
+
+        self.columns += list(names)
+        self.sizes.append(len(names))
+
+    def block(self, block):
+        """
+        Values of a block, memory-mapped.
+
+        Returns:
+            numpy.memmap: Read-only array of columns by rows.
+
+        """
+
+        return np.load(f'{self.path(block)}.npy', mmap_mode='r')
+
+    def blocks(self):
+        """
+        Generates the blocks one at a time.
+
+        Yields:
+            tuple: Names of the columns of the block and its values, see
+                ``block``.
+
+        """
+
+        start = 0
+        for block, size in enumerate(self.sizes):
+            yield self.columns[start:start + size], self.block(block)
+            start += size
+
+    def read(self, start=0, stop=None):
+        """
+        Reads a range of columns, which may span blocks.
+
+        Args:
+            start (int, optional): Position of the first column. Defaults to
+                0.
+            stop (int, optional): Position after the last column. Defaults
+                to all columns.
+
+        Returns:
+            numpy.ndarray: Array of rows by columns, as float64.
+
+        """
+
+        stop = len(self.columns) if stop is None else min(stop,
+                                                           len(self.columns))
+
+        values = np.empty((len(self.index), max(stop - start, 0)))
+        first = 0
+        for block, size in enumerate(self.sizes):
+            lower, upper = max(start, first), min(stop, first + size)
+            if lower < upper:
+                values[:, lower - start:upper - start] = \
+                    self.block(block)[lower - first:upper - first].T
+
+            first += size
+
+        return values
+
+    def frame(self, start=0, stop=None):
+        """
+        Reads a range of columns as a DataFrame of dates by columns.
+
+        Args:
+            start (int, optional): Position of the first column. Defaults to
+                0.
+            stop (int, optional): Position after the last column. Defaults
+                to all columns.
+
+        Returns:
+            pandas.DataFrame: The columns, as float64, indexed by date.
+
+        """
+
+        values = self.read(start, stop)
+        return pd.DataFrame(values, index=self.index,
+                            columns=self.columns[start:start + values.shape[1]],
+                            copy=False)
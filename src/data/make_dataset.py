@@ -1,14 +1,125 @@
+import argparse
 import datetime
 import json
 import os
-import random
-import sys
-from time import sleep
+from urllib.parse import quote
 
 import pandas as pd
-import requests
 from dateutil.relativedelta import relativedelta
 
+from src.data import telemetry
+from src.data.adjust import anchors, chain_link, increments
+from src.data.client import Client
+from src.data.responses import ResponseCache
+from src.data.scheduler import Scheduler
+
+
+# Length of the windows in which every resolution is pulled; Google Trends
+# only returns daily data for windows up to 9 months, and weekly data for
+# windows up to 5 years.
+PERIODS = {
+    'DAY': relativedelta(months=+6),
+    'WEEK': relativedelta(years=+5),
+}
+
+
+def windows(start_date, end_date, resolution):
+    """
+    Windows in which data of a resolution is pulled.
+
+    Args:
+        start_date (datetime.date): The start date from where to pull data.
+        end_date (datetime.date): The end date to where to pull data. Weekly
+            data is pulled up to today.
+        resolution (str): Either 'DAY', 'WEEK' or 'MONTH'.
+
+    Returns:
+        list: Start, end, and whether the last data point is also the first
+            of the next window, of every window.
+
+    """
+
+    if resolution == 'MONTH':
+        return [(start_date, end_date, False)]
+
+    last_date = end_date if resolution == 'DAY' else datetime.date.today()
+
+    start_increment = start_date
+    end_increment = start_date + PERIODS[resolution]
+    result = []
+
+    while True:
+        result.append([start_increment, end_increment, resolution == 'DAY'])
+
+        # Next increment.
+        start_increment += PERIODS[resolution]
+        end_increment += PERIODS[resolution]
+
+        if start_increment > last_date:
+            result[-1][2] = False
+            return [tuple(window) for window in result]
+
+
+def plan(client, keywords, start_date, end_date, resolution):
+    """
+    Windows in which keywords are pulled through a client. A client that only
+    replays the recorded responses uses the windows of the last recorded pull,
+    because the windows that end today change every day.
+
+    Args:
+        client (Client): Client which every request goes through.
+        keywords (list): Search terms that are pulled together.
+        start_date (datetime.date): The start date from where to pull data.
+        end_date (datetime.date): The end date to where to pull data.
+        resolution (str): Either 'DAY', 'WEEK' or 'MONTH'.
+
+    Returns:
+        list: Start, end, and overlap of every window, see ``windows``.
+
+    """
+
+    responses = client.responses
+    if responses is not None and responses.offline:
+        recorded = responses.plan(keywords, start_date, resolution)
+        if recorded is not None:
+            return recorded
+
+    return windows(start_date, end_date, resolution)
+
+
+def widget_url(host, keywords, start, end, resolution, token):
+    """
+    URL of the multiline CSV of Google Trends of up to five keywords.
+
+    Args:
+        host (str): Host of Google Trends.
+        keywords (list): Search terms as one would search them.
+        start (datetime.date): Start of the timespan.
+        end (datetime.date): End of the timespan.
+        resolution (str): Either 'DAY', 'WEEK' or 'MONTH'.
+        token (str): Token of the same keywords and timespan.
+
+    Returns:
+        str: The URL.
+
+    """
+
+    req = {
+        'time': f'{start} {end}',
+        'resolution': resolution,
+        'locale': 'en-US',
+        'comparisonItem': [{
+            'geo': {'country': 'US'},
+            'complexKeywordsRestriction': {
+                'keyword': [{'type': 'BROAD', 'value': keyword}]},
+        } for keyword in keywords],
+        'requestOptions': {'property': '', 'backend': 'IZG', 'category': 0},
+    }
+
+    payload = quote(json.dumps(req, separators=(',', ':')), safe='')
+    return f'{host}/trends/api/widgetdata/multiline/csv?req={payload}' \
+        f'&token={token}&tz=-120'
+
 
 class Trends():
     """
@@ -21,6 +132,7 @@ class Trends():
         keyword (str): Search term as one would search the term.
         keyword_url (str): Search term with spaces replaced by %22.
         keyword_file (str): Search term with spaces replace by underscores.
+        client (Client): Client which every request goes through.
         daily (pandas.DataFrame): DataFrame containing the daily data, which is 
             being adjusted.
         weekly (pandas.DataFrame): DataFrame containing the weekly data, which is
@@ -30,156 +142,117 @@ class Trends():
 
     """
 
-    def __init__(self, start_date=datetime.date(2004, 1, 1),
-                 end_date=datetime.date.today()):
+    def __init__(self, keyword, start_date=datetime.date(2004, 1, 1),
+                 end_date=datetime.date.today(), client=None):
         """
         Args:
+            keyword (str): Search term as one would search the term.
             start_date (datetime.date): The start date from where to pull data.
             end_date (datetime.date): The end date to where to pull data.
+            client (Client, optional): Client which is shared with the other
+                keywords being pulled. Defaults to a new one.
         """
 
         self.start_date = start_date
         self.end_date = end_date
 
-        with open('src/data/keywords.txt', 'r') as f:
-            for line in f:
-                self.keyword = line.strip()
-                self.keyword_url = self.keyword.replace(' ', '%20')
-                self.keyword_file = self.keyword.replace(' ', '_')
-
-                # Make sure that the keyword hasn't already been downloaded.
-                if os.path.exists(f'data/raw/weekly/{self.keyword_file}.csv') and os.path.exists(f'data/raw/daily/{self.keyword_file}.csv'):
-                    continue
-
-                i = 0
-                while True:
-                    if i >= 3:
-                        sys.exit('Too many errors.')
-                    try:
-                        print(self.keyword)
+        self.keyword = keyword
+        self.keyword_url = self.keyword.replace(' ', '%20')
+        self.keyword_file = self.keyword.replace(' ', '_')
 
-                        self.pull_daily()
-                        self.pull_weekly()
-                        self.pull_monthly()
+        self.client = client if client is not None else Client()
 
-                        self.adjust_weekly()
-                        self.adjust_daily()
+    def fetch(self):
+        """Pulls the daily, weekly, and monthly data and adjusts it."""
 
-                        self.download()
+        print(self.keyword)
 
-                        sleep(90)
+        self.pull_daily()
+        self.pull_weekly()
+        self.pull_monthly()
 
-                        break
-                    except:
-                    i += 1
-
-                    print('Error')
-                    sleep(120)
+        self.adjust_weekly()
+        self.adjust_daily()
 
+    @telemetry.timed('pull_daily')
     def pull_daily(self):
         """Pulls the daily data of the keyword specified from Google Trends."""
 
         print('Downloading daily data...')
 
-        # 6-month increments.
-        start_increment = self.start_date
-        end_increment = self.start_date + relativedelta(months=+6)
-        dataframe = False
-
-        while True:
-            token = self.get_token(f'{start_increment} {end_increment}')
-
-            url = f'https://trends.google.com/trends/api/widgetdata/multiline/csv?req=%7B%22time%22%3A%22{str(start_increment)}%20{str(end_increment)}%22%2C%22resolution%22%3A%22DAY%22%2C%22locale%22%3A%22en-US%22%2C%22comparisonItem%22%3A%5B%7B%22geo%22%3A%7B%22country%22%3A%22US%22%7D%2C%22complexKeywordsRestriction%22%3A%7B%22keyword%22%3A%5B%7B%22type%22%3A%22BROAD%22%2C%22value%22%3A%22{self.keyword_url}%22%7D%5D%7D%7D%5D%2C%22requestOptions%22%3A%7B%22property%22%3A%22%22%2C%22backend%22%3A%22IZG%22%2C%22category%22%3A0%7D%7D&token={token}&tz=-120'
-
-            if not dataframe:
-                self.daily = pd.read_csv(url, header=1)
-                dataframe = True
-            else:
-                temp = pd.read_csv(url, header=1)
-                self.daily = self.daily.append(temp, ignore_index=True)
-
-            # Next increment.
-            start_increment += relativedelta(months=+6)
-            end_increment += relativedelta(months=+6)
-
-            if start_increment > self.end_date:
-                self.daily = self.daily.rename(
-                    columns={'Day': 'Date', f'{self.keyword}: (United States)': 'relative_frequency'})
-                return
-            else:
-                # Remove overlap.
-                self.daily = self.daily[:-1]
+        self.daily = self.pull('DAY').rename(columns={'Day': 'Date'})
+        telemetry.count('rows_total', len(self.daily), stage='pull_daily')
 
+    @telemetry.timed('pull_weekly')
     def pull_weekly(self):
         """Pulls the weekly data of the keyword specified from Google Trends."""
 
         print('Downloading weekly data...')
 
-        # 5-year increments.
-        start_increment = self.start_date
-        end_increment = self.start_date + relativedelta(years=+5)
-        dataframe = False
+        self.weekly = self.pull('WEEK').rename(columns={'Week': 'Date'})
+        telemetry.count('rows_total', len(self.weekly), stage='pull_weekly')
 
-        while True:
-            token = self.get_token(f'{start_increment} {end_increment}')
+    @telemetry.timed('pull_monthly')
+    def pull_monthly(self):
+        """Pulls the monthly data of the keyword specified from Google Trends."""
 
-            url = f'https://trends.google.com/trends/api/widgetdata/multiline/csv?req=%7B%22time%22%3A%22{str(start_increment)}%20{str(end_increment)}%22%2C%22resolution%22%3A%22WEEK%22%2C%22locale%22%3A%22en-US%22%2C%22comparisonItem%22%3A%5B%7B%22geo%22%3A%7B%22country%22%3A%22US%22%7D%2C%22complexKeywordsRestriction%22%3A%7B%22keyword%22%3A%5B%7B%22type%22%3A%22BROAD%22%2C%22value%22%3A%22{self.keyword_url}%22%7D%5D%7D%7D%5D%2C%22requestOptions%22%3A%7B%22property%22%3A%22%22%2C%22backend%22%3A%22IZG%22%2C%22category%22%3A0%7D%7D&token={token}&tz=-120'
+        print('Downloading monthly data...')
 
-            if not dataframe:
-                self.weekly = pd.read_csv(url, header=1)
-                dataframe = True
-            else:
-                temp = pd.read_csv(url, header=1)
-                self.weekly = self.weekly.append(temp, ignore_index=True)
+        self.monthly = self.pull('MONTH').rename(columns={'Month': 'Date'})
+        telemetry.count('rows_total', len(self.monthly), stage='pull_monthly')
 
-            # Next increment.
-            start_increment += relativedelta(years=+5)
-            end_increment += relativedelta(years=+5)
+    def pull(self, resolution):
+        """
+        Pulls all windows of one resolution and concatenates them.
 
-            if start_increment > datetime.date.today():
-                self.weekly = self.weekly.rename(
-                    columns={'Week': 'Date', f'{self.keyword}: (United States)': 'relative_frequency'})
-                return
+        Args:
+            resolution (str): Either 'DAY', 'WEEK' or 'MONTH'.
 
-    def pull_monthly(self):
-        """Pulls the monthly data of the keyword specified from Google Trends."""
+        Returns:
+            pandas.DataFrame: The date column and a `relative_frequency`
+                column.
 
-        print('Downloading monthly data...')
+        """
 
-        token = self.get_token(f'{self.start_date} {self.end_date}')
+        keyword_windows = plan(self.client, [self.keyword], self.start_date,
+                               self.end_date, resolution)
 
-        url = f'https://trends.google.com/trends/api/widgetdata/multiline/csv?req=%7B%22time%22%3A%22{str(self.start_date)}%20{str(self.end_date)}%22%2C%22resolution%22%3A%22MONTH%22%2C%22locale%22%3A%22en-US%22%2C%22comparisonItem%22%3A%5B%7B%22geo%22%3A%7B%22country%22%3A%22US%22%7D%2C%22complexKeywordsRestriction%22%3A%7B%22keyword%22%3A%5B%7B%22type%22%3A%22BROAD%22%2C%22value%22%3A%22{self.keyword_url}%22%7D%5D%7D%7D%5D%2C%22requestOptions%22%3A%7B%22property%22%3A%22%22%2C%22backend%22%3A%22IZG%22%2C%22category%22%3A0%7D%7D&token={token}&tz=-120'
+        chunks = []
+        for start, end, overlap in keyword_windows:
+            token = self.get_token(f'{start} {end}', resolution)
+            chunk = self.client.read_csv(widget_url(
+                self.client.host, [self.keyword], start, end, resolution,
+                token))
 
-        self.monthly = pd.read_csv(url, header=1)
-        self.monthly = self.monthly.rename(
-            columns={'Month': 'Date', f'{self.keyword}: (United States)': 'relative_frequency'})
+            # Remove overlap.
+            chunks.append(chunk[:-1] if overlap else chunk)
 
-    def get_token(self, timespan):
+        responses = self.client.responses
+        if responses is not None and not responses.offline:
+            responses.record([self.keyword], self.start_date, resolution,
+                             keyword_windows)
+
+        return pd.concat(chunks, ignore_index=True).rename(
+            columns={f'{self.keyword}: (United States)': 'relative_frequency'})
+
+    def get_token(self, timespan, resolution=''):
         """
         Retrieves a token from Google Trends, based on the keyword and timespan.
 
-        This function is a deritative of a function within Pytrends by github.com/GeneralMills.
-        Licensed under the Apache license, version 2.0.
-        Changes made by github.com/cristianpjensen to fit Njord's use case.
-        """
-        sleep(random.randint(0, 2))
+        Args:
+            timespan (str): Start and end date of the timespan with a space in
+                between.
+            resolution (str, optional): Resolution of the data the token is
+                used for. Defaults to ''.
 
-        session = requests.session()
+        Returns:
+            str: Token, which can be used in the url for downloading the data.
 
-        response = session.get(
-            url='https://trends.google.com/trends/api/explore',
-            timeout=(2, 5),
-            cookies=dict(filter(lambda i: i[0] == 'NID', requests.get(
-                'https://trends.google.com/?geo=US',
-                timeout=(2, 5)
-            ).cookies.items())),
-            params={'hl': 'en-US', 'tz': -120,
-                    'req': '{"comparisonItem": [{"keyword": ' + f'"{self.keyword}"' + ', "time": ' + f'"{timespan}"' + ', "geo": "US"}], "category": 0, "property": ""}'}
-        )
+        """
 
-        content = response.text[4:]
-        return json.loads(content)['widgets'][0]['token']
+        return self.client.token(self.keyword, timespan, resolution)
 
+    @telemetry.timed('adjust_weekly')
     def adjust_weekly(self):
         """
         Adjusts the weekly data, based on the monthly data.
@@ -192,39 +265,33 @@ class Trends():
         print('Adjusting weekly data...')
 
         # 0's to 1's, because you can't divide by 0.
-        self.monthly.replace(0, 1)
-        self.weekly.replace(0, 1)
-
-        self.weekly['percentage_change'] = \
-            1 + self.weekly['relative_frequency'].pct_change()
-        self.weekly['Adjusted'] = ''
-
-        # Put in monthtly data point in each 5-year increment.
-        i = 0
-        while True:
-            try:
-                self.weekly.loc[i * 261, 'Adjusted'] = \
-                    self.monthly.loc[i * 60, 'relative_frequency']
-                i += 1
-            except ValueError:
-                break
-
-        for i in range(len(self.weekly)):
-            if self.weekly['Adjusted'][i] == '':
-                prc = float(self.weekly['percentage_change'][i])
-                prev_value = float(self.weekly['Adjusted'][i-1])
-                new_value = prev_value * prc
-                self.weekly.loc[i, 'Adjusted'] = new_value
+        self.monthly = self.monthly.replace(0, 1)
+        self.weekly = self.weekly.replace(0, 1)
+
+        # Put in the monthly data point of the month in which each 5-year
+        # increment starts.
+        increment = increments(
+            self.weekly['Date'], self.start_date, relativedelta(years=+5))
+        months = pd.to_datetime(self.weekly['Date']).dt.to_period('M')
+        monthly = self.monthly.set_index(
+            pd.to_datetime(self.monthly['Date']).dt.to_period('M')
+        )['relative_frequency'].astype('float64')
+
+        anchor = anchors(increment, months.isin(monthly.index).values)
+        anchor_values = months.map(monthly).values
+
+        self.weekly['Adjusted'] = chain_link(
+            self.weekly['relative_frequency'].values, anchor, anchor_values)
 
         self.weekly['Adjusted'] = (
             self.weekly['Adjusted'] / self.weekly['Adjusted'].max())
 
-        self.weekly['Adjusted'] = self.weekly['Adjusted'].astype('float64')
         self.weekly['Adjusted'] = self.weekly['Adjusted'].round(2)
 
-        self.weekly = self.weekly.drop(
-            ['relative_frequency', 'percentage_change'], axis=1)
+        self.weekly = self.weekly.drop(['relative_frequency'], axis=1)
+        telemetry.count('rows_total', len(self.weekly), stage='adjust_weekly')
 
+    @telemetry.timed('adjust_daily')
     def adjust_daily(self):
         """
         Adjusts the daily data, based on the weekly data.
@@ -236,81 +303,28 @@ class Trends():
 
         print('Adjusting daily data...')
         self.daily = self.daily.replace(0, 1)
-        self.daily['percentage_change'] = 1 + \
-            self.daily['relative_frequency'].pct_change()
-        self.daily['Adjusted'] = ''
-
-        start_increment = self.start_date
-        end_increment = start_increment + relativedelta(months=+6)
-        end = self.end_date
-
-        # Compute all values after the data point, within it's increment.
-        i = 0
-        while True:
-            imported = False
-            while True:
-                if i >= len(self.daily):
-                    break
-
-                # Insert the weekly data points in each 6-month increment.
-                if not imported:
-                    try:
-                        self.daily.loc[i, 'Adjusted'] = self.weekly['Adjusted'].where(
-                            self.weekly['Date'] == str(start_increment)).dropna().values[0]
-                        imported = True
-                    except ValueError:
-                        pass
-                else:
-                    prc = float(self.daily['percentage_change'][i])
-                    prev_value = float(self.daily['Adjusted'][i-1])
-                    new_value = prev_value * prc
-                    self.daily.loc[i, 'Adjusted'] = new_value
-
-                start_increment += relativedelta(days=+1)
-                i += 1
-
-                if start_increment >= end_increment:
-                    break
-
-            start_increment = end_increment
-            end_increment += relativedelta(months=+6)
-
-            if start_increment > end:
-                break
-
-        # Compute all values before the data point, within it's increment.
-        i = 0
-        while True:
-            if i >= len(self.daily) - 1:
-                break
-
-            if self.daily.loc[i, 'Adjusted'] == '':
-                j = 0
-                while True:
-                    if self.daily.loc[i+j, 'Adjusted'] == '':
-                        j += 1
-                    else:
-                        prc = float(self.daily['percentage_change'][i+j])
-                        new_value = float(self.daily['Adjusted'][i+j])
-                        prev_value = new_value / prc
-                        self.daily.loc[i+j-1, 'Adjusted'] = prev_value
-
-                        j -= 1
-
-                    if j <= 0:
-                        break
-
-            i += 1
-
-        self.daily = self.daily.drop(
-            ['relative_frequency', 'percentage_change'], axis=1)
+
+        increment = increments(
+            self.daily['Date'], self.start_date, relativedelta(months=+6))
+        weekly = self.weekly.set_index('Date')['Adjusted']
+
+        anchor = anchors(
+            increment, self.daily['Date'].isin(weekly.index).values)
+        anchor_values = self.daily['Date'].map(weekly).values
+
+        self.daily['Adjusted'] = chain_link(
+            self.daily['relative_frequency'].values, anchor, anchor_values)
+
+        self.daily = self.daily.drop(['relative_frequency'], axis=1)
 
         self.daily['Adjusted'] = (
             self.daily['Adjusted'] / self.daily['Adjusted'].max())
 
         self.daily['Adjusted'] = self.daily['Adjusted'].astype('float64')
         self.daily['Adjusted'] = self.daily['Adjusted'].round(2)
+        telemetry.count('rows_total', len(self.daily), stage='adjust_daily')
 
+    @telemetry.timed('write_csv')
     def download(self):
         """Download the daily and weekly data into CSV-files."""
         print('Converting to CSV format...')
@@ -321,5 +335,104 @@ class Trends():
             f'data/raw/daily/{self.keyword_file}.csv', index=False)
 
 
+def main(workers=4, rate=0.5, retries=5, offline=False, metrics=None,
+         batch=False, anchor=None):
+    """
+    Pulls all keywords in ``keywords.txt`` that haven't been downloaded yet.
+    The raw responses are recorded in ``data/external/responses``.
+
+    Args:
+        workers (int, optional): Amount of keywords that are pulled at once.
+            Defaults to 4.
+        rate (float, optional): Amount of requests per second, shared by all
+            workers. Defaults to 0.5.
+        retries (int, optional): Amount of times a keyword is retried.
+            Defaults to 5.
+        offline (bool, optional): Whether to rebuild all keywords from the
+            recorded responses only, without any requests. Defaults to False.
+        metrics (str, optional): File to which the telemetry of the run is
+            written, as JSON lines or, if it ends with `.prom`, in the
+            Prometheus text format. Defaults to not recording any.
+        batch (bool, optional): Whether to pull the keywords in groups of
+            five that share an anchor, see ``batch.pull``, which takes about
+            four times fewer requests. Defaults to False.
+        anchor (str, optional): Keyword that is in every group when pulling
+            in batches. Defaults to the first keyword.
+
+    """
+
+    if metrics is not None:
+        telemetry.enable()
+
+    keywords = []
+    with open('src/data/keywords.txt', 'r') as f:
+        for line in f:
+            keyword = line.strip()
+            keyword_file = keyword.replace(' ', '_')
+
+            # Make sure that the keyword hasn't already been downloaded.
+            if not offline and os.path.exists(f'data/raw/weekly/{keyword_file}.csv') and os.path.exists(f'data/raw/daily/{keyword_file}.csv'):
+                continue
+
+            keywords.append(keyword)
+
+    scheduler = Scheduler(workers=workers, rate=rate,
+                          retries=0 if offline else retries)
+    client = Client(limiter=scheduler.limiter, pool_size=workers,
+                    responses=ResponseCache(offline=offline))
+
+    def job(keyword):
+        with telemetry.stage('keyword', keyword=keyword):
+            trends = Trends(keyword, client=client)
+            trends.fetch()
+            trends.download()
+
+    with telemetry.stage('make_dataset'):
+        if batch and keywords:
+            # Imported here, because the batches are pulled into ``Trends``.
+            from src.data.batch import pull
+
+            pulled, failed = pull(keywords, anchor, client, scheduler)
+            for keyword, trends in pulled.items():
+                # One keyword that fails doesn't stop the others, like with
+                # the scheduler.
+                try:
+                    with telemetry.stage('keyword', keyword=keyword):
+                        trends.adjust_weekly()
+                        trends.adjust_daily()
+                        trends.download()
+                except Exception as exception:
+                    failed[keyword] = exception
+        else:
+            _, failed = scheduler.run(job, keywords)
+
+    for keyword, exception in failed.items():
+        print(f'Failed ({keyword}): {exception!r}')
+
+    if metrics is not None:
+        telemetry.disable().write(metrics)
+
+
 if __name__ == '__main__':
-    Trends()
+    parser = argparse.ArgumentParser(
+        description='Pulls the keywords in src/data/keywords.txt.')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='amount of keywords that are pulled at once')
+    parser.add_argument('--rate', type=float, default=0.5,
+                        help='amount of requests per second')
+    parser.add_argument('--retries', type=int, default=5,
+                        help='amount of times a keyword is retried')
+    parser.add_argument('--offline', action='store_true',
+                        help='rebuild from the recorded responses only')
+    parser.add_argument('--telemetry', default=None,
+                        help='file to which the timings and request counts '
+                             'are written, as JSON lines or .prom')
+    parser.add_argument('--batch', action='store_true',
+                        help='pull five keywords per request')
+    parser.add_argument('--anchor', default=None,
+                        help='keyword in every batch; defaults to the first')
+    args = parser.parse_args()
+
+    main(workers=args.workers, rate=args.rate, retries=args.retries,
+         offline=args.offline, metrics=args.telemetry, batch=args.batch,
+         anchor=args.anchor)
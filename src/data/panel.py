@@ -0,0 +1,237 @@
+"""
+Stores the adjusted data of all keywords in one panel of keywords by dates,
+instead of one CSV-file per keyword. The panel is a NumPy array that is
+memory-mapped when loaded, so loading all keywords doesn't parse anything and
+selections are views of the file.
+
+Usage:
+    python -m src.data.panel
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def read(periodicity='daily', source='data/raw', keywords=None):
+    """
+    Reads the CSV-files of keywords of one periodicity into one array.
+
+    Args:
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'daily'.
+        source (str, optional): Directory containing the directory of the
+            periodicity with one CSV-file per keyword. Defaults to data/raw.
+        keywords (list, optional): Keywords to read, in order, with spaces
+            replaced by underscores. Defaults to all CSV-files, sorted.
+
+    Returns:
+        tuple: Array of keywords by dates, the dates and the keywords.
+
+    """
+
+    directory = os.path.join(source, periodicity)
+    if keywords is None:
+        keywords = sorted(name[:-4] for name in os.listdir(directory)
+                          if name.endswith('.csv'))
+
+    frames = {keyword: pd.read_csv(os.path.join(directory, f'{keyword}.csv'),
+                                   index_col='Date')['Adjusted']
+              for keyword in keywords}
+
+    dates = pd.to_datetime(sorted(set().union(*(frame.index
+                                                for frame in frames.values()))))
+
+    values = np.full((len(frames), len(dates)), np.nan)
+    for i, frame in enumerate(frames.values()):
+        values[i, dates.get_indexer(pd.to_datetime(frame.index))] = frame.values
+
+    return values, dates, list(frames)
+
+
+def convert(periodicity='daily', source='data/raw',
+            destination='data/interim/panel'):
+    """
+    Converts the CSV-files of all keywords of one periodicity to a panel.
+
+    Args:
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'daily'.
+        source (str, optional): Directory containing the directory of the
+            periodicity with one CSV-file per keyword. Defaults to data/raw.
+        destination (str, optional): Directory to which the panel is written.
+            Defaults to data/interim/panel.
+
+    Returns:
+        Panel: The converted panel.
+
+    """
+
+    values, dates, keywords = read(periodicity, source)
+    return write(values, dates, keywords, periodicity, destination)
+
+
+def write(values, dates, keywords, periodicity='daily',
+          directory='data/interim/panel'):
+    """
+    Writes a panel to disk.
+
+    Args:
+        values (numpy.ndarray): Array of keywords by dates.
+        dates (pandas.DatetimeIndex): Dates of the columns.
+        keywords (list): Keywords of the rows, with spaces replaced by
+            underscores.
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'daily'.
+        directory (str, optional): Directory to which the panel is written.
+            Defaults to data/interim/panel.
+
+    Returns:
+        Panel: The written panel, memory-mapped.
+
+    Raises:
+        ValueError: If the shape of ``values`` doesn't match the keywords and
+            dates.
+
+    """
+
+    if values.shape != (len(keywords), len(dates)):
+        raise ValueError('The shape of `values` must be keywords by dates.')
+
+    path = os.path.join(directory, periodicity)
+    os.makedirs(path, exist_ok=True)
+
+    np.save(os.path.join(path, 'values.npy'),
+            np.ascontiguousarray(values, dtype='float64'))
+    np.save(os.path.join(path, 'dates.npy'),
+            np.asarray(dates, dtype='datetime64[D]'))
+
+    with open(os.path.join(path, 'keywords.json'), 'w') as f:
+        json.dump(list(keywords), f)
+
+    return Panel(periodicity, directory)
+
+
+class Panel():
+    """
+    Adjusted data of all keywords of one periodicity, memory-mapped.
+
+    Attributes:
+        values (numpy.memmap): Read-only array of keywords by dates. Dates on
+            which a keyword has no data are NaN.
+        dates (pandas.DatetimeIndex): Dates shared by all keywords.
+        keywords (list): Keywords, with spaces replaced by underscores.
+
+    """
+
+    def __init__(self, periodicity='daily', directory='data/interim/panel'):
+        """
+        Args:
+            periodicity (str, optional): Either 'daily' or 'weekly'. Defaults
+                to 'daily'.
+            directory (str, optional): Directory to which the panel was
+                written. Defaults to data/interim/panel.
+        """
+
+        path = os.path.join(directory, periodicity)
+
+        self.values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        self.dates = pd.DatetimeIndex(np.load(os.path.join(path, 'dates.npy')))
+
+        with open(os.path.join(path, 'keywords.json'), 'r') as f:
+            self.keywords = json.load(f)
+
+        self._positions = {keyword: i for i, keyword
+                           in enumerate(self.keywords)}
+
+    def rows(self, keywords=None):
+        """
+        Rows of the keywords; a slice when they are evenly spaced, so that
+        selecting them doesn't copy.
+
+        Raises:
+            KeyError: If a keyword isn't in the panel.
+
+        """
+
+        if keywords is None:
+            return slice(None)
+
+        if isinstance(keywords, str):
+            return self._positions[keywords]
+
+        positions = [self._positions[keyword] for keyword in keywords]
+        if len(positions) == 1:
+            return slice(positions[0], positions[0] + 1)
+
+        step = positions[1] - positions[0]
+        if step > 0 and (np.diff(positions) == step).all():
+            return slice(positions[0], positions[-1] + 1, step)
+
+        return positions
+
+    def columns(self, start=None, end=None):
+        """Slice of the columns of the dates from ``start`` to ``end``."""
+
+        return self.dates.slice_indexer(start, end)
+
+    def get(self, keywords=None, start=None, end=None):
+        """
+        Selects keywords and dates from the panel.
+
+        Args:
+            keywords (str or list, optional): Keyword or keywords to select.
+                Defaults to all keywords.
+            start (str, optional): First date to select. Defaults to the
+                first date.
+            end (str, optional): Last date to select. Defaults to the last
+                date.
+
+        Returns:
+            numpy.ndarray: Array of keywords by dates (or of dates, if a
+                single keyword is given). This is a view of the file, unless
+                the keywords are not evenly spaced in the panel.
+
+        """
+
+        return self.values[self.rows(keywords), self.columns(start, end)]
+
+    def frame(self, keywords=None, start=None, end=None):
+        """
+        Selects keywords and dates from the panel as a DataFrame of dates by
+        keywords, like the CSV-files.
+
+        Args:
+            keywords (str or list, optional): Keyword or keywords to select.
+                Defaults to all keywords.
+            start (str, optional): First date to select. Defaults to the
+                first date.
+            end (str, optional): Last date to select. Defaults to the last
+                date.
+
+        Returns:
+            pandas.DataFrame or pandas.Series: The selection, indexed by date.
+
+        """
+
+        columns = self.columns(start, end)
+        values = self.get(keywords, start, end)
+
+        if isinstance(keywords, str):
+            return pd.Series(values, index=self.dates[columns], name=keywords)
+
+        rows = self.rows(keywords)
+        names = self.keywords[rows] if isinstance(rows, slice) \
+            else [self.keywords[i] for i in rows]
+
+        return pd.DataFrame(values.T, index=self.dates[columns],
+                            columns=names, copy=False)
+
+
+if __name__ == '__main__':
+    for periodicity in ['daily', 'weekly']:
+        panel = convert(periodicity)
+        print(f'{periodicity}: {len(panel.keywords)} keywords, '
+              f'{len(panel.dates)} dates.')
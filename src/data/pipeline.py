@@ -0,0 +1,703 @@
+"""
+Builds the data from Google Trends to data/processed as a pipeline of stages
+with declared inputs and outputs. Every file is hashed, and a task only runs
+when its inputs or parameters changed since it last ran, or its outputs are
+missing, so changing one keyword only rebuilds what depends on it. Tasks of
+which the inputs are ready run in parallel.
+
+Usage:
+    python -m src.data.pipeline --dry-run
+    python -m src.data.pipeline processed --workers 8
+    python -m src.data.pipeline --force update prices
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from src.data import telemetry, update_data
+from src.data.client import Client
+from src.data.make_dataset import Trends
+from src.data.prices import PriceStore
+from src.data.responses import ResponseCache
+from src.data.scheduler import RateLimiter
+from src.features import build_dataset
+from src.features.build_dataset import INTERVALS, align
+from src.features.build_features import LagMatrix, delta, sma, target_binary
+from src.features.select_features import screen
+
+
+def digest(path):
+    """SHA-256 hash of the contents of a file."""
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2 ** 20), b''):
+            sha.update(block)
+
+    return sha.hexdigest()
+
+
+class Stage():
+    """
+    Step of the pipeline, which runs a task per set of parameters.
+
+    Attributes:
+        name (str): Name of the stage.
+        action (callable): Function that runs one task, called with the
+            parameters of the task as keyword arguments.
+        inputs (list or callable): Paths read by a task, as templates that
+            are formatted with its parameters, or a function of its
+            parameters that returns them.
+        outputs (list or callable): Paths written by a task, like ``inputs``.
+        each (list): Parameters of every task, e.g. one dictionary per
+            keyword.
+
+    """
+
+    def __init__(self, name, action, inputs=(), outputs=(), each=({},)):
+        self.name = name
+        self.action = action
+        self.inputs = inputs
+        self.outputs = outputs
+        self.each = list(each)
+
+    def paths(self, templates, parameters):
+        if callable(templates):
+            return list(templates(**parameters))
+
+        return [template.format(**parameters) for template in templates]
+
+    def tasks(self):
+        """Tasks of the stage."""
+
+        return [Task(self, parameters) for parameters in self.each]
+
+
+class Task():
+    """
+    One run of the action of a stage.
+
+    Attributes:
+        stage (Stage): Stage of the task.
+        parameters (dict): Parameters of the task.
+        name (str): Name of the stage and parameters, like
+            'features[daily, debt]'.
+        inputs (list): Paths read by the task.
+        outputs (list): Paths written by the task.
+
+    """
+
+    def __init__(self, stage, parameters):
+        self.stage = stage
+        self.parameters = parameters
+        self.inputs = stage.paths(stage.inputs, parameters)
+        self.outputs = stage.paths(stage.outputs, parameters)
+
+        values = ', '.join(str(value) for value in parameters.values())
+        self.name = f'{stage.name}[{values}]' if values else stage.name
+
+    def run(self):
+        for path in self.outputs:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        self.stage.action(**self.parameters)
+
+
+class Pipeline():
+    """
+    Runs stages in order, skipping the tasks that are up to date.
+
+    Attributes:
+        stages (list): Stages, each of which only reads outputs of the stages
+            before it.
+        state (str): JSON-file in which the hashes of the inputs and outputs
+            of every task are kept.
+        workers (int): Amount of tasks that run at once.
+
+    """
+
+    def __init__(self, stages, state='data/interim/pipeline.json', workers=4):
+        """
+        Args:
+            stages (list): Stages, in the order in which they depend on each
+                other.
+            state (str, optional): JSON-file in which the hashes are kept.
+                Defaults to data/interim/pipeline.json.
+            workers (int, optional): Amount of tasks that run at once.
+                Defaults to 4.
+
+        Raises:
+            ValueError: If a path is written by multiple tasks, or read before
+                the task that writes it.
+
+        """
+
+        self.stages = stages
+        self.state = state
+        self.workers = workers
+
+        self.tasks = [task for stage in stages for task in stage.tasks()]
+
+        # Task that writes every path.
+        self.producers = {}
+        written = {path for task in self.tasks for path in task.outputs}
+        for task in self.tasks:
+            for path in task.inputs:
+                if path in written and path not in self.producers:
+                    raise ValueError(f'`{task.name}` reads {path} before it '
+                                     f'is written.')
+
+            for path in task.outputs:
+                if path in self.producers:
+                    raise ValueError(f'{path} is written by multiple tasks.')
+                self.producers[path] = task
+
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self._records = {}
+
+        if os.path.exists(state):
+            with open(state, 'r') as f:
+                saved = json.load(f)
+
+            self._hashes = saved['hashes']
+            self._records = saved['tasks']
+
+    def hash(self, path):
+        """
+        Hash of a file, or ``None`` if it doesn't exist. Files of which the
+        size and modification time didn't change aren't read again.
+        """
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            size, modified, known = self._hashes.get(path, (None, None, None))
+        if (size, modified) == (stat.st_size, stat.st_mtime_ns):
+            return known
+
+        value = digest(path)
+        with self._lock:
+            self._hashes[path] = (stat.st_size, stat.st_mtime_ns, value)
+
+        return value
+
+    def save(self):
+        """Writes the hashes to the state file."""
+
+        os.makedirs(os.path.dirname(self.state) or '.', exist_ok=True)
+
+        with self._lock:
+            saved = {'hashes': self._hashes, 'tasks': self._records}
+
+            temporary = f'{self.state}.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(saved, f, indent=1, sort_keys=True)
+
+            os.replace(temporary, self.state)
+
+    def record(self, task):
+        """Remembers the hashes of the inputs and outputs of a task."""
+
+        record = {
+            'parameters': task.parameters,
+            'inputs': {path: self.hash(path) for path in task.inputs},
+            'outputs': {path: self.hash(path) for path in task.outputs},
+        }
+
+        with self._lock:
+            self._records[task.name] = record
+
+    def status(self, task, upstream=(), force=()):
+        """
+        Whether a task has to run, with the current files.
+
+        Returns:
+            tuple: One of 'run', 'adopt' (the outputs exist, but weren't
+                written by the pipeline) or 'skip', and the reason.
+
+        """
+
+        if task.stage.name in force:
+            return 'run', 'forced'
+
+        outputs = {path: self.hash(path) for path in task.outputs}
+        if any(value is None for value in outputs.values()):
+            return 'run', 'outputs missing'
+
+        record = self._records.get(task.name)
+        if record is None:
+            for path in task.inputs:
+                if path in upstream:
+                    return 'run', f'{self.producers[path].name} runs'
+
+            return 'adopt', 'outputs exist'
+
+        if record['parameters'] != task.parameters:
+            return 'run', 'parameters changed'
+
+        for path in task.inputs:
+            if path in upstream:
+                return 'run', f'{self.producers[path].name} runs'
+
+            # Missing inputs are intermediate files of which the outputs are
+            # still up to date.
+            value = self.hash(path)
+            if value is not None and value != record['inputs'].get(path):
+                return 'run', f'{path} changed'
+
+        # Outputs that were changed outside of the pipeline, e.g. data/raw by
+        # make_dataset.py, are kept, and the tasks after it rebuilt.
+        if record['outputs'] != outputs:
+            return 'adopt', 'outputs changed'
+
+        return 'skip', 'up to date'
+
+    def selection(self, targets=None):
+        """Tasks of the target stages and the tasks they depend on."""
+
+        if targets is None:
+            return list(self.tasks)
+
+        names = {stage.name for stage in self.stages}
+        for target in targets:
+            if target not in names:
+                raise ValueError(f'Unknown stage `{target}`.')
+
+        selected = set()
+        pending = [task for task in self.tasks if task.stage.name in targets]
+        while pending:
+            task = pending.pop()
+            if task.name in selected:
+                continue
+
+            selected.add(task.name)
+            pending.extend(self.producers[path] for path in task.inputs
+                           if path in self.producers)
+
+        return [task for task in self.tasks if task.name in selected]
+
+    def plan(self, targets=None, force=(), skip=()):
+        """
+        Decides which tasks run. Tasks of which the outputs are missing only
+        run when a task that reads them runs, or when nothing reads them, so
+        intermediate files like the unadjusted downloads may be deleted.
+
+        Args:
+            targets (list, optional): Stages to build. Defaults to all.
+            force (iterable, optional): Stages of which all tasks run.
+            skip (iterable, optional): Stages of which no task runs; their
+                outputs are used as they are.
+
+        Returns:
+            list: (task, decision, reason) of every selected task, in order.
+
+        """
+
+        tasks = self.selection(targets)
+
+        decisions = {}
+        upstream = set()
+        for task in tasks:
+            if task.stage.name in skip:
+                decision, reason = 'skip', 'skipped'
+            else:
+                decision, reason = self.status(task, upstream, force)
+
+            decisions[task.name] = [decision, reason]
+
+            # Missing outputs are only written when they're needed.
+            if decision == 'run' and reason != 'outputs missing':
+                upstream.update(task.outputs)
+
+        consumed = {self.producers[path].name for task in tasks
+                    for path in task.inputs if path in self.producers}
+
+        # Tasks that run need their missing inputs, even when the tasks that
+        # write them are up to date otherwise.
+        needed = set()
+        for task in reversed(tasks):
+            decision, reason = decisions[task.name]
+            if reason == 'outputs missing' and task.name in consumed and \
+                    task.name not in needed:
+                decisions[task.name] = ['skip', 'not needed']
+
+            if decisions[task.name][0] != 'run':
+                continue
+
+            for path in task.inputs:
+                producer = self.producers.get(path)
+                if producer is None or os.path.exists(path) or \
+                        producer.stage.name in skip:
+                    continue
+
+                needed.add(producer.name)
+                if decisions[producer.name][0] != 'run':
+                    decisions[producer.name] = ['run', f'{task.name} needs '
+                                                       f'{path}']
+
+        return [(task, *decisions[task.name]) for task in tasks]
+
+    def run(self, targets=None, force=(), skip=(), dry_run=False):
+        """
+        Runs the tasks that aren't up to date, in parallel where possible.
+
+        Args:
+            targets (list, optional): Stages to build. Defaults to all.
+            force (iterable, optional): Stages of which all tasks run.
+            skip (iterable, optional): Stages of which no task runs.
+            dry_run (bool, optional): Whether to only print the plan.
+                Defaults to False.
+
+        Returns:
+            dict: Dictionary of the names of the tasks to what happened:
+                'ran', 'adopted', 'skipped', 'failed' or 'blocked'.
+
+        """
+
+        plan = self.plan(targets, force, skip)
+
+        if dry_run:
+            for task, decision, reason in plan:
+                print(f'{decision:<6} {task.name:<40} {reason}')
+
+            return {task.name: decision for task, decision, _ in plan}
+
+        planned = {task.name: (decision, reason)
+                   for task, decision, reason in plan}
+        tasks = [task for task, _, _ in plan]
+        names = set(planned)
+
+        dependencies = {
+            task.name: {self.producers[path].name for path in task.inputs
+                        if path in self.producers
+                        and self.producers[path].name in names}
+            for task in tasks
+        }
+
+        results = {}
+
+        def execute(task):
+            decision, reason = planned[task.name]
+
+            if reason == 'skipped':
+                return 'skipped'
+
+            # Decided again with the files written by the tasks before it,
+            # which may not have changed anything after all.
+            ran = any(results[name] == 'ran'
+                      for name in dependencies[task.name])
+            if reason.endswith(' runs') or (decision != 'run' and ran):
+                decision, reason = self.status(task, force=force)
+
+            if decision == 'adopt':
+                self.record(task)
+                return 'adopted'
+
+            if decision == 'skip':
+                return 'skipped'
+
+            print(f'Running {task.name} ({reason})...')
+            with telemetry.stage(task.stage.name, task=task.name):
+                task.run()
+
+            missing = [path for path in task.outputs
+                       if not os.path.exists(path)]
+            if missing:
+                raise FileNotFoundError(f'`{task.name}` did not write '
+                                        f'{", ".join(missing)}.')
+
+            self.record(task)
+            return 'ran'
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {}
+
+            while len(results) < len(tasks):
+                for task in tasks:
+                    if task.name in results or task in running.values():
+                        continue
+
+                    states = [results.get(name)
+                              for name in dependencies[task.name]]
+                    if None in states:
+                        continue
+
+                    if 'failed' in states or 'blocked' in states:
+                        results[task.name] = 'blocked'
+                        continue
+
+                    running[pool.submit(execute, task)] = task
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+
+                    try:
+                        results[task.name] = future.result()
+                    except Exception as exception:
+                        print(f'Failed ({task.name}): {exception!r}')
+                        results[task.name] = 'failed'
+
+                self.save()
+
+        self.save()
+        return results
+
+
+def keywords(path='src/data/keywords.txt'):
+    """
+    Keywords in ``keywords.txt``, with spaces replaced by underscores,
+    without duplicates.
+    """
+
+    # A keyword that is listed twice would be two tasks with the same
+    # outputs.
+    with open(path, 'r') as f:
+        return list(dict.fromkeys(line.strip().replace(' ', '_')
+                                  for line in f if line.strip()))
+
+
+def stages(keywords, periodicities=('daily', 'weekly'), client=None,
+           store=None, top=50, offline=False):
+    """
+    Stages from Google Trends to data/processed.
+
+    Args:
+        keywords (list): Keywords, with spaces replaced by underscores.
+        periodicities (iterable, optional): Periodicities to build. Defaults
+            to daily and weekly.
+        client (Client, optional): Client through which Google Trends is
+            requested. Defaults to a new one.
+        store (PriceStore, optional): Store of the DJIA prices. Defaults to
+            the one in data/external/prices.
+        top (int, optional): Amount of features selected. Defaults to 50.
+        offline (bool, optional): Whether the prices stage only uses the
+            stored prices, instead of fetching them. Defaults to False.
+
+    Returns:
+        list: Stages, in order.
+
+    """
+
+    client = client if client is not None else Client()
+    store = store if store is not None else PriceStore()
+
+    def download(keyword):
+        trends = Trends(keyword.replace('_', ' '), client=client)
+        trends.pull_daily()
+        trends.pull_weekly()
+        trends.pull_monthly()
+
+        frames = {'daily': trends.daily, 'weekly': trends.weekly,
+                  'monthly': trends.monthly}
+        write_pickle(frames, f'data/interim/unadjusted/{keyword}.pkl')
+
+    def adjust(keyword):
+        frames = pd.read_pickle(f'data/interim/unadjusted/{keyword}.pkl')
+
+        trends = Trends(keyword.replace('_', ' '), client=client)
+        trends.daily = frames['daily']
+        trends.weekly = frames['weekly']
+        trends.monthly = frames['monthly']
+
+        trends.adjust_weekly()
+        trends.adjust_daily()
+        trends.download()
+
+    def update(periodicity, keyword):
+        # Starts again from the raw data, which has changed.
+        shutil.copyfile(f'data/raw/{periodicity}/{keyword}.csv',
+                        f'data/interim/{periodicity}/{keyword}.csv')
+
+        if periodicity == 'daily':
+            update_data.update(keyword.replace('_', ' '), 'daily', 'DAY',
+                               relativedelta(days=0), client)
+        else:
+            update_data.update(keyword.replace('_', ' '), 'weekly', 'WEEK',
+                               relativedelta(years=+5), client)
+
+    def prices(periodicity):
+        if offline:
+            # Raises if the prices aren't stored yet.
+            store.load('DJIA', INTERVALS[periodicity])
+        else:
+            store.refresh('DJIA', INTERVALS[periodicity])
+
+    def features(periodicity, keyword):
+        write_pickle(keyword_features(
+            f'data/interim/{periodicity}/{keyword}.csv'),
+            f'data/interim/features/{periodicity}/{keyword}.pkl')
+
+    def select(periodicity):
+        panel = pd.concat({keyword: pd.read_pickle(
+            f'data/interim/features/{periodicity}/{keyword}.pkl')
+            for keyword in keywords}, axis=1)
+        panel.columns = [f'{variant}-{keyword}'
+                         for keyword, variant in panel.columns]
+
+        target = target_binary(store.load('DJIA', INTERVALS[periodicity]).Close)
+        target = align(target, panel.index, periodicity).dropna()
+
+        selected = screen(LagMatrix(panel), target, top=top)
+        write_json(list(selected.index),
+                   f'data/interim/selected/{periodicity}.json')
+
+    def processed(periodicity):
+        panel = build_dataset.load(periodicity, 'data/interim', keywords)
+        build_dataset.write(build_dataset.build(
+            panel, store.load('DJIA', INTERVALS[periodicity]).Close,
+            periodicity))
+
+    each_keyword = [{'keyword': keyword} for keyword in keywords]
+    each_series = [{'periodicity': periodicity, 'keyword': keyword}
+                   for periodicity in periodicities for keyword in keywords]
+    each_periodicity = [{'periodicity': periodicity}
+                        for periodicity in periodicities]
+
+    def series_paths(periodicity):
+        return [f'data/interim/{periodicity}/{keyword}.csv'
+                for keyword in keywords] + \
+            [f'data/external/prices/DJIA-{INTERVALS[periodicity]}.npz']
+
+    def feature_paths(periodicity, **_):
+        return [f'data/interim/features/{periodicity}/{keyword}.pkl'
+                for keyword in keywords] + \
+            [f'data/external/prices/DJIA-{INTERVALS[periodicity]}.npz']
+
+    return [
+        Stage('download', download, [],
+              ['data/interim/unadjusted/{keyword}.pkl'], each_keyword),
+        Stage('adjust', adjust, ['data/interim/unadjusted/{keyword}.pkl'],
+              ['data/raw/daily/{keyword}.csv', 'data/raw/weekly/{keyword}.csv'],
+              each_keyword),
+        Stage('update', update, ['data/raw/{periodicity}/{keyword}.csv'],
+              ['data/interim/{periodicity}/{keyword}.csv'], each_series),
+        Stage('prices', prices, [],
+              lambda periodicity: [
+                  f'data/external/prices/DJIA-{INTERVALS[periodicity]}.npz'],
+              each_periodicity),
+        Stage('features', features,
+              ['data/interim/{periodicity}/{keyword}.csv'],
+              ['data/interim/features/{periodicity}/{keyword}.pkl'],
+              each_series),
+        Stage('select', select, feature_paths,
+              ['data/interim/selected/{periodicity}.json'], each_periodicity),
+        Stage('processed', processed, series_paths,
+              lambda periodicity: [
+                  f'data/processed/{periodicity}-{variant}-binary{suffix}.csv'
+                  for variant in build_dataset.VARIANTS
+                  for suffix in ('', '-curated')],
+              each_periodicity),
+    ]
+
+
+def keyword_features(path, length=3):
+    """
+    Features of the processed datasets of one keyword.
+
+    Args:
+        path (str): CSV-file of the keyword, with ``Date`` and ``Adjusted``
+            columns.
+        length (int, optional): Length of the features. Defaults to 3.
+
+    Returns:
+        pandas.DataFrame: The `rolling` mean, `delta` and `pct_change` (the
+            delta relative to the current value) of every date.
+
+    """
+
+    series = pd.read_csv(path, index_col='Date', parse_dates=['Date'])
+    series = series['Adjusted'].astype('float64')
+
+    change = delta(series, length)
+
+    return pd.DataFrame({
+        'rolling': sma(series, length),
+        'delta': change,
+        'pct_change': change / series,
+    })
+
+
+def write_pickle(data, path):
+    """Pickles an object via a temporary file, so it's never partial."""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    temporary = f'{path}.tmp'
+    pd.to_pickle(data, temporary, compression=None)
+    os.replace(temporary, path)
+
+
+def write_json(data, path):
+    """Writes JSON via a temporary file."""
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+
+    os.replace(temporary, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Builds the data from Google Trends to data/processed.')
+    parser.add_argument('targets', nargs='*',
+                        help='stages to build, with the stages they depend '
+                             'on; defaults to all')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only print which tasks would run')
+    parser.add_argument('--force', nargs='+', default=[],
+                        help='stages of which all tasks run, e.g. update and '
+                             'prices to fetch the newest data')
+    parser.add_argument('--skip', nargs='+', default=[],
+                        help='stages of which no task runs')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='amount of tasks that run at once')
+    parser.add_argument('--rate', type=float, default=0.5,
+                        help='amount of requests per second')
+    parser.add_argument('--offline', action='store_true',
+                        help='only use the recorded responses and stored '
+                             'prices, without any requests')
+    parser.add_argument('--telemetry', default=None,
+                        help='file to which the timings and request counts '
+                             'are written, as JSON lines or .prom')
+    args = parser.parse_args()
+
+    if args.telemetry is not None:
+        telemetry.enable()
+
+    client = Client(limiter=RateLimiter(rate=args.rate),
+                    pool_size=args.workers,
+                    responses=ResponseCache(offline=args.offline))
+
+    pipeline = Pipeline(stages(keywords(), client=client,
+                               offline=args.offline),
+                        workers=args.workers)
+    results = pipeline.run(args.targets or None, force=args.force,
+                           skip=args.skip, dry_run=args.dry_run)
+
+    if not args.dry_run:
+        for outcome in ['ran', 'adopted', 'skipped', 'failed', 'blocked']:
+            count = sum(result == outcome for result in results.values())
+            if count:
+                print(f'{outcome}: {count}')
+
+    if args.telemetry is not None:
+        telemetry.disable().write(args.telemetry)
@@ -0,0 +1,235 @@
+"""
+Local store of market prices, so that scoring and joining features don't
+download the prices again on every call, and work offline. The prices of every
+ticker and interval are stored in one compressed NumPy file with an array per
+column, and refreshing only fetches the bars after the last stored one.
+
+Usage:
+    python -m src.data.prices DJIA ^DJI
+    python -m src.data.prices DJIA --source data/external/csv
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def yahoo(ticker, interval='1d', start=None, end=None):
+    """
+    Downloads prices from Yahoo Finance.
+
+    Args:
+        ticker (str): Ticker, like 'DJIA'.
+        interval (str, optional): Interval of the bars, like '1d' or '1wk'.
+            Defaults to '1d'.
+        start (str, optional): First date. Defaults to the first available.
+        end (str, optional): Date before which to stop. Defaults to today.
+
+    Returns:
+        pandas.DataFrame: Prices indexed by date.
+
+    """
+
+    # Only imported when downloading, so that reading the store works
+    # without it.
+    import yfinance as yf
+
+    if start is None:
+        return yf.download(ticker, period='max', interval=interval, end=end)
+
+    return yf.download(ticker, start=start, end=end, interval=interval)
+
+
+class CSVSource():
+    """
+    Reads prices from CSV-files in the layout of ``yf.download(...).to_csv``
+    instead of downloading them, e.g. to refresh the store offline.
+
+    Attributes:
+        directory (str): Directory with a `{ticker}-{interval}.csv` file per
+            ticker and interval.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __call__(self, ticker, interval='1d', start=None, end=None):
+        path = os.path.join(self.directory, f'{ticker}-{interval}.csv')
+        prices = pd.read_csv(path, index_col='Date', parse_dates=['Date'])
+
+        prices = prices[start:]
+        if end is not None:
+            prices = prices[prices.index < pd.Timestamp(end)]
+
+        return prices
+
+
+class PriceStore():
+    """
+    Prices of tickers, stored per ticker and interval.
+
+    Attributes:
+        directory (str): Directory of the stored prices.
+        source (callable): Function that fetches prices like ``yahoo``.
+
+    """
+
+    def __init__(self, directory='data/external/prices', source=yahoo):
+        """
+        Args:
+            directory (str, optional): Directory of the stored prices.
+                Defaults to data/external/prices.
+            source (callable, optional): Fetches the prices of a ticker,
+                interval, start and end, like ``yahoo`` or a ``CSVSource``.
+                Defaults to Yahoo Finance.
+        """
+
+        self.directory = directory
+        self.source = source
+
+    def path(self, ticker, interval='1d'):
+        """Path of the stored prices of a ticker and interval."""
+
+        return os.path.join(self.directory, f'{ticker}-{interval}.npz')
+
+    def read(self, ticker, interval='1d'):
+        """All stored prices, or ``None`` if there are none."""
+
+        try:
+            with np.load(self.path(ticker, interval)) as arrays:
+                columns = [column for column in COLUMNS if column in arrays]
+                return pd.DataFrame(
+                    {column: arrays[column] for column in columns},
+                    index=pd.DatetimeIndex(arrays['Date'], name='Date'))
+        except FileNotFoundError:
+            return None
+
+    def write(self, ticker, interval, prices):
+        """Stores prices, replacing the stored ones."""
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        arrays = {column: prices[column].to_numpy()
+                  for column in COLUMNS if column in prices}
+        arrays['Date'] = prices.index.to_numpy(dtype='datetime64[ns]')
+
+        path = self.path(ticker, interval)
+        temporary = f'{path}.tmp.npz'
+        np.savez_compressed(temporary, **arrays)
+        os.replace(temporary, path)
+
+    def load(self, ticker, interval='1d', start=None, end=None):
+        """
+        Reads stored prices, without downloading anything. Takes the same
+        arguments as ``yf.download``.
+
+        Args:
+            ticker (str): Ticker, like 'DJIA'.
+            interval (str, optional): Interval of the bars. Defaults to '1d'.
+            start (str, optional): First date. Defaults to the first stored.
+            end (str, optional): Date before which to stop, like in
+                ``yf.download``. Defaults to the last stored.
+
+        Returns:
+            pandas.DataFrame: Prices indexed by date.
+
+        Raises:
+            KeyError: If the prices of the ticker and interval aren't stored.
+
+        """
+
+        prices = self.read(ticker, interval)
+        if prices is None:
+            raise KeyError(f'No prices of `{ticker}` ({interval}) are stored; '
+                           f'refresh them first.')
+
+        prices = prices[start:end]
+        if end is not None:
+            prices = prices[prices.index < pd.Timestamp(end)]
+
+        return prices
+
+    def returns(self, ticker, interval='1d', start=None, end=None,
+                column='Close'):
+        """
+        Relative price change of every bar, like ``Close.pct_change()``, for
+        ``backtest``.
+
+        Returns:
+            pandas.Series: Relative change of the column, indexed by date.
+
+        """
+
+        return self.load(ticker, interval, start, end)[column].pct_change()
+
+    def refresh(self, ticker, interval='1d', start='2004-01-01', end=None):
+        """
+        Fetches the prices that aren't stored yet: those from the last
+        stored bar on, and those before the first if ``start`` is earlier.
+        The last stored bar is fetched again, because it may have been
+        partial, like the close of a day or week that hadn't ended.
+
+        Args:
+            ticker (str): Ticker, like 'DJIA'.
+            interval (str, optional): Interval of the bars. Defaults to '1d'.
+            start (str, optional): First date to store. Defaults to
+                2004-01-01.
+            end (str, optional): Date before which to stop. Defaults to today.
+
+        Returns:
+            int: Amount of new bars.
+
+        """
+
+        stored = self.read(ticker, interval)
+
+        if stored is None or stored.empty:
+            parts = [self.source(ticker, interval, start, end)]
+        else:
+            parts = [stored]
+
+            first = stored.index[0]
+            if start is not None and pd.Timestamp(start) < first:
+                parts.insert(0, self.source(ticker, interval, start,
+                                            first.strftime('%Y-%m-%d')))
+
+            # The fetched bars replace the stored ones of the same date.
+            last = stored.index[-1]
+            if end is None or last < pd.Timestamp(end):
+                parts.append(self.source(ticker, interval,
+                                         last.strftime('%Y-%m-%d'), end))
+
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return 0
+
+        prices = pd.concat(parts)
+        prices = prices[~prices.index.duplicated(keep='last')].sort_index()
+
+        self.write(ticker, interval, prices)
+
+        return len(prices) - (0 if stored is None else len(stored))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('tickers', nargs='+')
+    parser.add_argument('--intervals', nargs='+', default=['1d', '1wk'])
+    parser.add_argument('--start', default='2004-01-01')
+    parser.add_argument('--source', default=None,
+                        help='Directory of CSV-files to read instead of '
+                             'downloading.')
+    arguments = parser.parse_args()
+
+    store = PriceStore(source=yahoo if arguments.source is None
+                       else CSVSource(arguments.source))
+
+    for ticker in arguments.tickers:
+        for interval in arguments.intervals:
+            new = store.refresh(ticker, interval, arguments.start)
+            print(f'{ticker} ({interval}): {new} new bars.')
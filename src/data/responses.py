@@ -0,0 +1,276 @@
+"""
+Records the raw CSV responses of Google Trends on disk, so that the data can
+be adjusted again without downloading it again. Responses are stored under
+the hash of the decoded request payload (time window, resolution, keywords,
+and geo), so the token and the order of the query parameters don't matter.
+
+The windows of the last complete pull of every keyword (or group of keywords)
+and resolution are written to ``plans.json`` next to the responses. The last
+window ends on the day of the pull, so offline replays take the windows from
+this manifest instead of planning them from the date of the replay.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import parse_qs, urlparse
+
+from src.data import telemetry
+
+
+def payload(url):
+    """
+    Decodes the request payload of a Google Trends CSV url.
+
+    Args:
+        url (str): URL of the CSV-file.
+
+    Returns:
+        dict: Time window, resolution, keywords, and geo of the request.
+
+    Raises:
+        ValueError: If the url has no request payload.
+
+    """
+
+    query = parse_qs(urlparse(url).query)
+    if 'req' not in query:
+        raise ValueError('The url has no request payload.')
+
+    req = json.loads(query['req'][0])
+    items = req.get('comparisonItem', [])
+
+    return {
+        'time': req.get('time'),
+        'resolution': req.get('resolution'),
+        'keyword': [item['complexKeywordsRestriction']['keyword'][0]['value']
+                    for item in items],
+        'geo': [item.get('geo', {}).get('country') for item in items],
+    }
+
+
+def complete(url, today=None):
+    """
+    Whether the time window of a url ended before today. The data of a
+    window that reaches today or later still changes.
+
+    Args:
+        url (str): URL of the CSV-file.
+        today (datetime.date, optional): Defaults to today.
+
+    Returns:
+        bool: Whether the window ended, false if its end can't be read.
+
+    """
+
+    today = today if today is not None else datetime.date.today()
+
+    try:
+        end = datetime.date.fromisoformat(payload(url)['time'].split(' ')[-1])
+    except (AttributeError, ValueError):
+        return False
+
+    return end < today
+
+
+def key(url):
+    """Hash of the decoded request payload of a url."""
+
+    payload_json = json.dumps(payload(url), sort_keys=True)
+    return hashlib.sha256(payload_json.encode()).hexdigest()
+
+
+class ResponseCache():
+    """
+    Content-addressed on-disk cache of raw responses, which evicts the least
+    recently used responses when it grows beyond its size.
+
+    Attributes:
+        directory (str): Directory in which the responses are stored.
+        max_size (int): Maximum amount of bytes stored.
+        offline (bool): Whether responses may only be replayed, in which case
+            a response that isn't cached raises an error instead of being
+            downloaded.
+        size (int): Amount of bytes stored.
+        manifest (str): Path of the windows in which every keyword was last
+            pulled.
+        hits (int): Amount of replayed responses.
+        misses (int): Amount of responses that weren't cached.
+
+    """
+
+    def __init__(self, directory='data/external/responses',
+                 max_size=2 ** 30, offline=False):
+        """
+        Args:
+            directory (str, optional): Directory in which the responses are
+                stored. Defaults to data/external/responses.
+            max_size (int, optional): Maximum amount of bytes stored.
+                Defaults to 1 GiB.
+            offline (bool, optional): Whether responses may only be replayed.
+                Defaults to False.
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self.paths())
+
+        self.manifest = os.path.join(directory, 'plans.json')
+        try:
+            with open(self.manifest, 'r') as f:
+                self._plans = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._plans = {}
+
+    def paths(self):
+        """Paths of all stored responses."""
+
+        return [os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith('.csv')]
+
+    def path(self, url):
+        """Path at which the response of a url is stored."""
+
+        return os.path.join(self.directory, f'{key(url)}.csv')
+
+    def plan(self, keywords, start_date, resolution):
+        """
+        Windows in which keywords were last pulled.
+
+        Args:
+            keywords (list): Search terms of the requests.
+            start_date (datetime.date): Start date of the pull.
+            resolution (str): Either 'DAY', 'WEEK' or 'MONTH'.
+
+        Returns:
+            list: Start, end, and overlap of every window, like
+                ``make_dataset.windows``, or ``None`` if they were never
+                recorded.
+
+        """
+
+        with self._lock:
+            recorded = self._plans.get(
+                json.dumps([list(keywords), str(start_date), resolution]))
+
+        if recorded is None:
+            return None
+
+        return [(datetime.date.fromisoformat(start),
+                 datetime.date.fromisoformat(end), overlap)
+                for start, end, overlap in recorded]
+
+    def record(self, keywords, start_date, resolution, windows):
+        """
+        Writes the windows in which keywords were pulled to the manifest, once
+        all of them are recorded.
+
+        Args:
+            keywords (list): Search terms of the requests.
+            start_date (datetime.date): Start date of the pull.
+            resolution (str): Either 'DAY', 'WEEK' or 'MONTH'.
+            windows (list): Start, end, and overlap of every window.
+
+        """
+
+        key = json.dumps([list(keywords), str(start_date), resolution])
+
+        with self._lock:
+            self._plans[key] = [[str(start), str(end), overlap]
+                                for start, end, overlap in windows]
+
+            temporary = f'{self.manifest}.{threading.get_ident()}.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(self._plans, f)
+
+            os.replace(temporary, self.manifest)
+
+    def get(self, url, download):
+        """
+        Replays the response of a url, or downloads and records it. Windows
+        that haven't ended yet are downloaded again whenever the cache isn't
+        offline, because their data still changes.
+
+        Args:
+            url (str): URL of the CSV-file.
+            download (callable): Function that downloads the url and returns
+                the response text.
+
+        Returns:
+            str: The response text.
+
+        Raises:
+            LookupError: If the response isn't cached and the cache is
+                offline.
+
+        """
+
+        path = self.path(url)
+
+        if self.offline or complete(url):
+            try:
+                with open(path, 'r') as f:
+                    text = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                # Mark as recently used.
+                os.utime(path)
+                self.hits += 1
+                telemetry.count('responses_total', result='hit')
+                return text
+
+            self.misses += 1
+            telemetry.count('responses_total', result='miss')
+        else:
+            telemetry.count('responses_total', result='refresh')
+
+        if self.offline:
+            raise LookupError(f'No recorded response for {payload(url)}.')
+
+        text = download(url)
+        self.put(path, text)
+
+        return text
+
+    def put(self, path, text):
+        """Stores a response and evicts old responses if needed."""
+
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(text)
+
+        size = os.path.getsize(temporary)
+
+        with self._lock:
+            # A refreshed response replaces the one that was counted.
+            if os.path.exists(path):
+                size -= os.path.getsize(path)
+
+            os.replace(temporary, path)
+            self.size += size
+            if self.size > self.max_size:
+                self.evict()
+
+    def evict(self):
+        """Removes the least recently used responses until it fits."""
+
+        paths = sorted(self.paths(), key=os.path.getmtime)
+
+        self.size = sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            if self.size <= self.max_size:
+                break
+
+            self.size -= os.path.getsize(path)
+            os.remove(path)
@@ -0,0 +1,290 @@
+"""
+Runs download jobs concurrently. All workers share one token-bucket rate
+limiter, which backs off when Google Trends answers with HTTP 429 (too many
+requests), and failed jobs are retried with jittered exponential backoff
+instead of terminating the whole run.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.data import telemetry
+
+
+def is_throttled(exception):
+    """
+    Checks whether an exception was caused by an HTTP 429 response.
+
+    Args:
+        exception (Exception): Exception raised by ``requests`` or
+            ``urllib`` (which is used by ``pandas.read_csv``).
+
+    Returns:
+        bool: Whether the request was throttled.
+
+    """
+
+    if getattr(exception, 'code', None) == 429:
+        return True
+
+    response = getattr(exception, 'response', None)
+    return getattr(response, 'status_code', None) == 429
+
+
+class RateLimiter():
+    """
+    Token bucket that is shared by all workers. Every request takes one
+    token. The rate is halved on every throttled request and recovers
+    additively on every successful request, up to the configured rate.
+
+    Attributes:
+        max_rate (float): Configured amount of requests per second.
+        rate (float): Current amount of requests per second.
+        min_rate (float): Rate to which the limiter backs off at most.
+        burst (int): Maximum amount of tokens in the bucket.
+        retries (int): Amount of times a throttled request is retried.
+        throttled (int): Amount of throttled requests.
+
+    """
+
+    def __init__(self, rate=0.5, burst=1, min_rate=0.01, retries=3):
+        """
+        Args:
+            rate (float, optional): Amount of requests per second. Defaults
+                to 0.5.
+            burst (int, optional): Maximum amount of requests that can be made
+                at once. Defaults to 1.
+            min_rate (float, optional): Rate to which the limiter backs off at
+                most. Defaults to 0.01.
+            retries (int, optional): Amount of times a throttled request is
+                retried. Defaults to 3.
+
+        Raises:
+            ValueError: If ``rate`` or ``min_rate`` is not positive, or
+                ``burst`` is less than 1.
+
+        """
+
+        if rate <= 0 or min_rate <= 0:
+            raise ValueError('`rate` and `min_rate` must be positive.')
+
+        if burst < 1:
+            raise ValueError('`burst` may not be less than 1.')
+
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+        self.retries = retries
+        self.throttled = 0
+
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            telemetry.count('rate_limit_wait_seconds_total', wait)
+            time.sleep(wait)
+
+    def throttle(self):
+        """Halves the rate and empties the bucket."""
+
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0)
+            self.throttled += 1
+
+        telemetry.count('throttled_total')
+
+    def recover(self):
+        """Increases the rate by a hundredth of the configured rate."""
+
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+
+    def request(self, function, *args, **kwargs):
+        """
+        Makes a request once a token is available. Throttled requests are
+        retried at the lowered rate.
+
+        Args:
+            function (callable): Function that makes the request.
+            *args: Arguments passed to ``function``.
+            **kwargs: Keyword arguments passed to ``function``.
+
+        Returns:
+            The return value of ``function``.
+
+        Raises:
+            Exception: The exception raised by ``function``, if it isn't
+                caused by throttling or the request was throttled more than
+                ``retries`` times.
+
+        """
+
+        attempt = 0
+        while True:
+            self.acquire()
+
+            try:
+                result = function(*args, **kwargs)
+            except Exception as exception:
+                if not is_throttled(exception):
+                    raise
+
+                self.throttle()
+
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+
+                telemetry.count('retries_total', scope='request')
+            else:
+                self.recover()
+                return result
+
+
+class Scheduler():
+    """
+    Runs jobs in a thread pool and retries failed jobs with jittered
+    exponential backoff.
+
+    Attributes:
+        workers (int): Amount of jobs that run at once.
+        retries (int): Amount of times a job is retried before it is given up
+            on.
+        backoff (float): Seconds to wait before the first retry.
+        max_backoff (float): Maximum seconds to wait before a retry.
+        limiter (RateLimiter): Rate limiter shared by all jobs.
+
+    """
+
+    def __init__(self, workers=4, rate=0.5, burst=1, retries=5, backoff=30,
+                 max_backoff=600):
+        """
+        Args:
+            workers (int, optional): Amount of jobs that run at once. Defaults
+                to 4.
+            rate (float, optional): Amount of requests per second, shared by
+                all workers. Defaults to 0.5.
+            burst (int, optional): Maximum amount of requests that can be made
+                at once. Defaults to 1.
+            retries (int, optional): Amount of times a job is retried.
+                Defaults to 5.
+            backoff (float, optional): Seconds to wait before the first retry.
+                Defaults to 30.
+            max_backoff (float, optional): Maximum seconds to wait before a
+                retry. Defaults to 600.
+
+        Raises:
+            ValueError: If ``workers`` is less than 1 or ``retries`` is
+                negative.
+
+        """
+
+        if workers < 1:
+            raise ValueError('`workers` may not be less than 1.')
+
+        if retries < 0:
+            raise ValueError('`retries` may not be negative.')
+
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = RateLimiter(rate=rate, burst=burst)
+
+    def delay(self, attempt):
+        """
+        Seconds to wait before retrying a job.
+
+        Args:
+            attempt (int): Amount of failed attempts so far.
+
+        Returns:
+            float: Exponential backoff with full jitter.
+
+        """
+
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def attempt(self, job, item):
+        """
+        Runs ``job(item)`` until it succeeds or runs out of retries.
+
+        Returns:
+            tuple: The result and ``None``, or ``None`` and the last
+                exception.
+
+        """
+
+        attempt = 0
+        while True:
+            try:
+                result = job(item)
+            except Exception as exception:
+                attempt += 1
+
+                if attempt > self.retries:
+                    telemetry.count('jobs_total', result='failed')
+                    return None, exception
+
+                print(f'Error ({item}): {exception!r}')
+
+                delay = self.delay(attempt)
+                telemetry.count('retries_total', scope='job')
+                telemetry.count('backoff_seconds_total', delay)
+                time.sleep(delay)
+            else:
+                telemetry.count('jobs_total', result='succeeded')
+                return result, None
+
+    def run(self, job, items):
+        """
+        Runs ``job`` for every item.
+
+        Args:
+            job (callable): Function that takes one item.
+            items (iterable): Items to run the job for.
+
+        Returns:
+            tuple: Dictionary of the results of the succeeded items and
+                dictionary of the exceptions of the failed items.
+
+        """
+
+        results = {}
+        failed = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {item: executor.submit(self.attempt, job, item)
+                       for item in items}
+
+            for item, future in futures.items():
+                result, exception = future.result()
+
+                if exception is None:
+                    results[item] = result
+                else:
+                    failed[item] = exception
+
+        return results, failed
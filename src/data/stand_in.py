@@ -0,0 +1,265 @@
+"""
+Local stand-in for the Google Trends endpoints used by ``make_dataset.py``.
+It answers with synthetic data in the same format as Google Trends, and
+answers with HTTP 429 when requests come in faster than the configured
+capacity, so the throughput of the scheduler can be measured without
+touching Google.
+
+Usage:
+    python -m src.data.stand_in --keywords 20 --workers 8 --rate 50
+"""
+
+import argparse
+import datetime
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+
+def synthetic_series(keyword, start='2004-01-01', end=None):
+    """
+    Daily search volume of a keyword, which is the same on every call.
+
+    Args:
+        keyword (str): Search term; seeds the random walk.
+        start (str, optional): First date. Defaults to 2004-01-01.
+        end (str, optional): Last date. Defaults to today.
+
+    Returns:
+        pandas.Series: Positive search volume indexed by date.
+
+    """
+
+    if end is None:
+        end = datetime.date.today()
+
+    dates = pd.date_range(start, end, freq='D')
+    rng = np.random.RandomState(zlib.crc32(keyword.encode()))
+
+    walk = np.cumsum(rng.normal(0, 0.05, len(dates)))
+    weekday = 1 + 0.2 * np.sin(2 * np.pi * dates.dayofweek.values / 7)
+
+    return pd.Series(np.exp(walk) * weekday, index=dates)
+
+
+def widget_csv(keyword, start, end, resolution):
+    """
+    Formats the search volume of a keyword, or of up to five compared
+    keywords, within a timespan like the multiline CSV of Google Trends:
+    relative to the maximum of all keywords within the timespan, from 0 to
+    100.
+    """
+
+    keywords = [keyword] if isinstance(keyword, str) else keyword
+    frame = pd.DataFrame({keyword: synthetic_series(keyword)[start:end]
+                          for keyword in keywords})
+
+    if resolution == 'WEEK':
+        frame = frame.resample('W-SAT').mean()
+        frame.index = frame.index - pd.Timedelta(days=6)
+        frame = frame[start:]
+        column, fmt = 'Week', '%Y-%m-%d'
+    elif resolution == 'MONTH':
+        frame = frame.resample('MS').mean()
+        column, fmt = 'Month', '%Y-%m'
+    else:
+        column, fmt = 'Day', '%Y-%m-%d'
+
+    values = np.round(100 * frame / frame.max().max()).astype(int)
+
+    lines = ['Category: All categories', '',
+             ','.join([column] + [f'{keyword}: (United States)'
+                                  for keyword in keywords])]
+    lines += [','.join([date.strftime(fmt)] + [str(value) for value in row])
+              for date, row in zip(values.index, values.to_numpy())]
+
+    return '\n'.join(lines) + '\n'
+
+
+class StandInServer():
+    """
+    Serves the stand-in endpoints on localhost in a background thread.
+
+    Attributes:
+        capacity (float): Amount of requests per second that are answered
+            before the server starts answering with HTTP 429.
+        latency (float): Seconds each response is delayed.
+        requests (int): Amount of requests received.
+        throttled (int): Amount of requests answered with HTTP 429.
+        url (str): Host to pass to ``Trends``.
+
+    """
+
+    def __init__(self, capacity=50, latency=0.05):
+        """
+        Args:
+            capacity (float, optional): Amount of requests per second that
+                are answered. Defaults to 50.
+            latency (float, optional): Seconds each response is delayed.
+                Defaults to 0.05.
+        """
+
+        self.capacity = capacity
+        self.latency = latency
+        self.requests = 0
+        self.throttled = 0
+
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._httpd.server_address[1]}'
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True)
+
+    def start(self):
+        """Starts serving in a background thread."""
+
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving."""
+
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def admit(self):
+        """Takes a token from the bucket of the server, if there is one."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.capacity)
+            self._updated = now
+            self.requests += 1
+
+            if self._tokens < 1:
+                self.throttled += 1
+                return False
+
+            self._tokens -= 1
+            return True
+
+    def handle(self, request):
+        """Answers one request."""
+
+        time.sleep(self.latency)
+
+        if not self.admit():
+            self.respond(request, 429, 'Too Many Requests')
+            return
+
+        url = urlparse(request.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/':
+            self.respond(request, 200, '', {'Set-Cookie': 'NID=stand-in'})
+        elif url.path == '/trends/api/explore':
+            body = json.dumps({'widgets': [{'token': 'stand-in'}]})
+            self.respond(request, 200, ")]}'\n" + body)
+        elif url.path == '/trends/api/widgetdata/multiline/csv':
+            req = json.loads(query['req'][0])
+            start, end = req['time'].split(' ')
+            keywords = [item['complexKeywordsRestriction']['keyword'][0]
+                        ['value'] for item in req['comparisonItem']]
+
+            self.respond(request, 200, widget_csv(
+                keywords, start, end, req['resolution']))
+        else:
+            self.respond(request, 404, 'Not Found')
+
+    def respond(self, request, status, body, headers={}):
+        body = body.encode()
+
+        request.send_response(status)
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+
+def main(keywords=20, workers=8, rate=50, capacity=50, latency=0.05,
+         metrics=None):
+    """
+    Pulls synthetic keywords from the stand-in server and prints the
+    throughput of the scheduler. The telemetry of the run is written to
+    ``metrics``, if given.
+    """
+
+    from src.data import telemetry
+    from src.data.client import Client
+    from src.data.make_dataset import Trends
+    from src.data.scheduler import Scheduler
+
+    scheduler = Scheduler(workers=workers, rate=rate, burst=workers,
+                          backoff=0.5, max_backoff=5)
+
+    def job(keyword):
+        Trends(keyword, client=client).fetch()
+
+    if metrics is not None:
+        telemetry.enable()
+
+    with StandInServer(capacity=capacity, latency=latency) as server:
+        client = Client(host=server.url, limiter=scheduler.limiter, cache=None,
+                        pool_size=workers)
+
+        start = time.perf_counter()
+        results, failed = scheduler.run(
+            job, [f'keyword {i}' for i in range(keywords)])
+        seconds = time.perf_counter() - start
+
+    print(f'{len(results)} keywords in {seconds:.1f} s '
+          f'({len(results) / seconds:.2f} keywords/s), '
+          f'{server.requests / seconds:.1f} requests/s, '
+          f'{server.throttled} throttled, {len(failed)} failed.')
+
+    if metrics is not None:
+        telemetry.disable().write(metrics)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Measures the scheduler against a stand-in server.')
+    parser.add_argument('--keywords', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=50,
+                        help='requests per second of the scheduler')
+    parser.add_argument('--capacity', type=float, default=50,
+                        help='requests per second the server answers')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--telemetry', default=None,
+                        help='file to which the timings and request counts '
+                             'are written, as JSON lines or .prom')
+    args = parser.parse_args()
+
+    main(keywords=args.keywords, workers=args.workers, rate=args.rate,
+         capacity=args.capacity, latency=args.latency,
+         metrics=args.telemetry)
@@ -0,0 +1,288 @@
+"""
+Records where the time of a run goes: the wall time of every stage, the HTTP
+requests with their latency, size and status, the retries and backoff, and
+the amount of rows processed. The metrics are exported as JSON lines or in the
+Prometheus text format.
+
+Recording is disabled until ``enable`` is called. The hooks in the code then
+only check a global, so they cost close to nothing.
+
+Usage:
+    telemetry.enable()
+    ...
+    telemetry.current.write('reports/telemetry.jsonl')
+"""
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+           300)
+
+# Recorder of the hooks, or ``None`` when recording is disabled.
+current = None
+
+
+class Telemetry():
+    """
+    Thread-safe recorder of counters, histograms and stage spans.
+
+    Attributes:
+        counters (dict): Dictionary of (name, labels) to totals.
+        histograms (dict): Dictionary of (name, labels) to the bucket counts,
+            sum and count of the observations.
+        spans (list): Every stage that ran, with its labels, start and wall
+            time, in the order in which they ended.
+
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        """
+        Args:
+            buckets (tuple, optional): Upper bounds of the histogram buckets.
+                Defaults to ``BUCKETS``.
+        """
+
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self.spans = []
+
+        self._lock = threading.Lock()
+
+    def count(self, name, value=1, **labels):
+        """Adds a value to a counter."""
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Adds an observation to a histogram."""
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = \
+                    [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            histogram[0][bisect.bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def span(self, name, start, seconds, **labels):
+        """
+        Records the wall time of a stage, in the ``stage_seconds`` histogram
+        by stage, and as a span with all labels.
+        """
+
+        self.observe('stage_seconds', seconds, stage=name)
+        with self._lock:
+            self.spans.append({'stage': name, **labels, 'start': start,
+                               'seconds': seconds})
+
+    def records(self):
+        """
+        All metrics as dictionaries, the spans first.
+
+        Returns:
+            list: Dictionaries with a `type` of either 'span', 'counter' or
+                'histogram'.
+
+        """
+
+        with self._lock:
+            records = [{'type': 'span', **span} for span in self.spans]
+
+            for (name, labels), value in sorted(self.counters.items()):
+                records.append({'type': 'counter', 'name': name,
+                                'labels': dict(labels), 'value': value})
+
+            for (name, labels), (counts, total, count) in \
+                    sorted(self.histograms.items()):
+                records.append({
+                    'type': 'histogram', 'name': name, 'labels': dict(labels),
+                    'buckets': dict(zip([*map(str, self.buckets), '+Inf'],
+                                        counts)),
+                    'sum': total, 'count': count,
+                })
+
+        return records
+
+    def jsonl(self):
+        """The metrics as JSON lines."""
+
+        return ''.join(f'{json.dumps(record)}\n' for record in self.records())
+
+    def prometheus(self):
+        """The counters and histograms in the Prometheus text format."""
+
+        def labelled(name, labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return name
+
+            text = ','.join('{}="{}"'.format(
+                key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                for key, value in pairs)
+            return f'{name}{{{text}}}'
+
+        lines = []
+        with self._lock:
+            declared = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in declared:
+                    lines.append(f'# TYPE {name} counter')
+                    declared.add(name)
+
+                lines.append(f'{labelled(name, labels)} {value}')
+
+            for (name, labels), (counts, total, count) in \
+                    sorted(self.histograms.items()):
+                if name not in declared:
+                    lines.append(f'# TYPE {name} histogram')
+                    declared.add(name)
+
+                cumulative = 0
+                for bound, amount in zip([*map(str, self.buckets), '+Inf'],
+                                         counts):
+                    cumulative += amount
+                    bucket = labelled(name + '_bucket', labels,
+                                      [('le', bound)])
+                    lines.append(f'{bucket} {cumulative}')
+
+                lines.append(f'{labelled(name + "_sum", labels)} {total}')
+                lines.append(f'{labelled(name + "_count", labels)} {count}')
+
+        return ''.join(f'{line}\n' for line in lines)
+
+    def write(self, path):
+        """
+        Writes the metrics to a file via a temporary file: in the Prometheus
+        text format if it ends with `.prom`, and as JSON lines otherwise.
+        """
+
+        text = self.prometheus() if path.endswith('.prom') else self.jsonl()
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            f.write(text)
+
+        os.replace(temporary, path)
+
+
+class Stage():
+    """Context manager that records the wall time of a stage."""
+
+    __slots__ = ('name', 'labels', 'start', 'started')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        recorder = current
+        if recorder is not None:
+            recorder.span(self.name, self.start,
+                          time.perf_counter() - self.started, **self.labels)
+
+
+class Disabled():
+    """Context manager that records nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        pass
+
+
+DISABLED = Disabled()
+
+
+def enable(recorder=None):
+    """
+    Starts recording.
+
+    Args:
+        recorder (Telemetry, optional): Recorder of the hooks. Defaults to a
+            new one.
+
+    Returns:
+        Telemetry: The recorder.
+
+    """
+
+    global current
+    current = recorder if recorder is not None else Telemetry()
+    return current
+
+
+def disable():
+    """Stops recording, and returns the recorder that was used."""
+
+    global current
+    recorder, current = current, None
+    return recorder
+
+
+def count(name, value=1, **labels):
+    """Adds a value to a counter, if recording."""
+
+    if current is not None:
+        current.count(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    """Adds an observation to a histogram, if recording."""
+
+    if current is not None:
+        current.observe(name, value, **labels)
+
+
+def stage(name, **labels):
+    """
+    Context manager that records the wall time of a stage, if recording.
+
+    Args:
+        name (str): Name of the stage, like 'adjust_daily'.
+        **labels: Labels of the span, like the keyword.
+
+    """
+
+    if current is None:
+        return DISABLED
+
+    return Stage(name, labels)
+
+
+def timed(name):
+    """Decorator that records the wall time of every call as a stage."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if current is None:
+                return function(*args, **kwargs)
+
+            with Stage(name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -5,115 +5,231 @@ input for the machine learning algorithm.
 """
 
 import datetime
-import json
 import os
-import random
-import sys
-from time import sleep
+import shutil
 
-import pandas as pd
-import requests
+import numpy as np
 from dateutil.relativedelta import relativedelta
 
+from src.data import telemetry
+from src.data.adjust import chain_link
+from src.data.client import Client
+from src.data.make_dataset import widget_url
+from src.data.responses import ResponseCache
 
-def main():
-    update_daily()
-    update_weekly()
 
+def main(client=None):
+    # Shared by all requests, so that connections and tokens are reused.
+    client = client if client is not None else \
+        Client(responses=ResponseCache())
 
-def update_daily():
+    update_daily(client)
+    update_weekly(client)
+
+
+def keywords():
+    """Keywords of ``keywords.txt``, without duplicates."""
+
+    with open('src/data/keywords.txt', 'r') as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+def update_daily(client=None):
     """
     Updates the daily Google Trends data.
+
+    Args:
+        client (Client, optional): Client which every request goes through.
+            Defaults to a new one that records the responses.
     """
 
-    with open('src/data/keywords.txt', 'r') as f:
-        for line in f:
-            keyword = line.strip()
-            keyword_url = keyword.replace(' ', '%20')
-            keyword_file = keyword.replace(' ', '_')
-
-            current = pd.read_csv(f'data/raw/daily/{keyword_file}.csv')
-
-            start_date = datetime.datetime.strptime(
-                current.loc[len(current)-1, 'Date'], '%Y-%m-%d').date()
-            end_date = datetime.date.today()
-
-            token = get_token(keyword, f'{start_date} {end_date}')
-
-            url = 'https://trends.google.com/trends/api/widgetdata/multilin' \
-                f'e/csv?req=%7B%22time%22%3A%22{str(start_date)}%20' \
-                f'{str(end_date)}%22%2C%22resolution%22%3A%22DAY%22%2C%22locale' \
-                '%22%3A%22en-US%22%2C%22comparisonItem%22%3A%5B%7B%22geo%22%3A%' \
-                '7B%22country%22%3A%22US%22%7D%2C%22complexKeywordsRestriction%' \
-                '22%3A%7B%22keyword%22%3A%5B%7B%22type%22%3A%22BROAD%22%2C%22va' \
-                f'lue%22%3A%22{keyword_url}%22%7D%5D%7D%7D%5D%2C%22requestOptio' \
-                'ns%22%3A%7B%22property%22%3A%22%22%2C%22backend%22%3A%22IZG%22' \
-                f'%2C%22category%22%3A0%7D%7D&token={token}&tz=-120'
-
-            new = pd.read_csv(url, header=1)
-            new = new.rename(
-                columns={f'{keyword}: (United States)': 'Adjusted'})
-            new['change'] = 1 + new['Adjusted'].pct_change()
-            new = new[1:]
-
-            length = len(current)
-            for index, row in new.iterrows():
-                index += length
-                current.loc[index-1, 'Date'] = row['Day']
-                current.loc[index-1, 'Adjusted'] = \
-                    current.loc[index-2, 'Adjusted'] * row['change']
-
-            current.to_csv(
-                f'data/interim/daily/{keyword_file}.csv', index=False)
-
-
-def update_weekly():
+    client = client if client is not None else \
+        Client(responses=ResponseCache())
+
+    for keyword in keywords():
+        update(keyword, 'daily', 'DAY', relativedelta(days=0), client)
+
+
+def update_weekly(client=None):
     """
     Updates the weekly Google Trends data.
+
+    Args:
+        client (Client, optional): Client which every request goes through.
+            Defaults to a new one that records the responses.
     """
 
-    with open('src/data/keywords.txt', 'r') as f:
-        for line in f:
-            keyword = line.strip()
-            keyword_url = keyword.replace(' ', '%20')
-            keyword_file = keyword.replace(' ', '_')
-
-            current = pd.read_csv(f'data/raw/daily/{keyword_file}.csv')
-
-            start_date = datetime.datetime.strptime(
-                current.loc[len(current)-1, 'Date'], '%Y-%m-%d').date()
-            end_date = start_date + relativedelta(years=+5)
-
-            token = get_token(keyword, f'{start_date} {end_date}')
-
-            url = 'https://trends.google.com/trends/api/widgetdata/multilin' \
-                f'e/csv?req=%7B%22time%22%3A%22{str(start_date)}%20' \
-                f'{str(end_date)}%22%2C%22resolution%22%3A%22WEEK%22%2C%22locale' \
-                '%22%3A%22en-US%22%2C%22comparisonItem%22%3A%5B%7B%22geo%22%3A%' \
-                '7B%22country%22%3A%22US%22%7D%2C%22complexKeywordsRestriction%' \
-                '22%3A%7B%22keyword%22%3A%5B%7B%22type%22%3A%22BROAD%22%2C%22va' \
-                f'lue%22%3A%22{keyword_url}%22%7D%5D%7D%7D%5D%2C%22requestOptio' \
-                'ns%22%3A%7B%22property%22%3A%22%22%2C%22backend%22%3A%22IZG%22' \
-                f'%2C%22category%22%3A0%7D%7D&token={token}&tz=-120'
-
-            new = pd.read_csv(url, header=1)
-            new = new.rename(
-                columns={f'{keyword}: (United States)': 'Adjusted'})
-            new['change'] = 1 + new['Adjusted'].pct_change()
-            new = new[1:]
-
-            length = len(current)
-            for index, row in new.iterrows():
-                index += length
-                current.loc[index-1, 'Date'] = row['Week']
-                current.loc[index-1, 'Adjusted'] = \
-                    current.loc[index-2, 'Adjusted'] * row['change']
-
-            current.to_csv(
-                f'data/interim/weekly/{keyword_file}.csv', index=False)
-
-
-def get_token(keyword, timespan):
+    client = client if client is not None else \
+        Client(responses=ResponseCache())
+
+    for keyword in keywords():
+        update(keyword, 'weekly', 'WEEK', relativedelta(years=+5), client)
+
+
+@telemetry.timed('update_keyword')
+def update(keyword, periodicity, resolution, window, client=None):
+    """
+    Appends the data points since the last stored date of a keyword. The raw
+    data is copied to ``data/interim`` once; after that, only the missing
+    data points are downloaded and appended to it.
+
+    Args:
+        keyword (str): Keyword of which the data is updated.
+        periodicity (str): Either 'daily' or 'weekly'.
+        resolution (str): Resolution of the Google Trends request, either
+            'DAY' or 'WEEK'.
+        window (dateutil.relativedelta.relativedelta): Minimum length of the
+            timespan requested, measured from the last stored date, because
+            Google Trends only returns weekly data for long timespans.
+        client (Client, optional): Client which every request goes through.
+            Defaults to a new one that records the responses.
+
+    Returns:
+        int: Amount of data points appended.
+
+    Raises:
+        ValueError: If the stored data has no data points to extend.
+
+    """
+
+    client = client if client is not None else \
+        Client(responses=ResponseCache())
+
+    keyword_file = keyword.replace(' ', '_')
+
+    path = f'data/interim/{periodicity}/{keyword_file}.csv'
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(f'data/raw/{periodicity}/{keyword_file}.csv', path)
+
+    row = last_row(path)
+    if row is None:
+        raise ValueError(f'{path} has no data points to extend; pull '
+                         f'`{keyword}` with make_dataset.py first.')
+
+    last_date, last_value = row
+
+    start_date = datetime.datetime.strptime(last_date, '%Y-%m-%d').date()
+    end_date = max(start_date + window, datetime.date.today())
+
+    if start_date >= datetime.date.today():
+        return 0
+
+    token = get_token(keyword, f'{start_date} {end_date}', resolution, client)
+
+    new = client.read_csv(widget_url(client.host, [keyword], start_date,
+                                     end_date, resolution, token))
+    new.columns = ['Date', 'relative_frequency']
+
+    new = extend(new, last_date, float(last_value))
+    append(path, new)
+
+    telemetry.count('rows_total', len(new), stage='update_keyword')
+    return len(new)
+
+
+def last_row(path):
+    """
+    Reads the last row of a CSV-file, without parsing the whole file.
+
+    Args:
+        path (str): Path of the CSV-file.
+
+    Returns:
+        list: Values of the last row as strings, or ``None`` if the file has
+            no rows after its header.
+
+    """
+
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        block = min(size, 1024)
+
+        while True:
+            f.seek(size - block)
+            lines = f.read(block).rstrip(b'\r\n').split(b'\n')
+
+            if len(lines) > 1:
+                return lines[-1].decode().strip().split(',')
+
+            # Only the header, if any.
+            if block == size:
+                return None
+
+            block = min(size, block * 2)
+
+
+def extend(new, last_date, last_value):
+    """
+    Chain-links newly downloaded data onto the stored data.
+
+    Args:
+        new (pandas.DataFrame): Downloaded data with ``Date`` and
+            ``relative_frequency`` columns, starting at the last stored date.
+        last_date (str): Last stored date.
+        last_value (float): Last stored adjusted value.
+
+    Returns:
+        pandas.DataFrame: The data points after ``last_date``, with ``Date``
+            and ``Adjusted`` columns.
+
+    Raises:
+        ValueError: If the downloaded data doesn't contain the last stored
+            date.
+
+    """
+
+    new = new.replace(0, 1)
+
+    overlap = (new['Date'] == last_date).values
+    if not overlap.any():
+        raise ValueError(f'The new data does not contain {last_date}.')
+
+    anchor = np.full(len(new), overlap.argmax())
+    anchor_values = np.full(len(new), last_value)
+
+    new['Adjusted'] = chain_link(
+        new['relative_frequency'].values, anchor, anchor_values)
+
+    return new.loc[new['Date'] > last_date, ['Date', 'Adjusted']]
+
+
+def append(path, new):
+    """
+    Appends rows to a CSV-file in one write. If the write fails, the file is
+    truncated back to its original size.
+
+    Args:
+        path (str): Path of the CSV-file.
+        new (pandas.DataFrame): Rows to append, in the column order of the
+            file.
+
+    """
+
+    if not len(new):
+        return
+
+    rows = new.to_csv(header=False, index=False).encode()
+
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+
+        # Make sure the last row ends with a newline.
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b'\n':
+                rows = b'\n' + rows
+
+        try:
+            f.write(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(size)
+            raise
+
+
+def get_token(keyword, timespan, resolution='', client=None):
     """
     Retrieves a token from Google Trends, based on the keyword and timespan.
 
@@ -125,6 +241,10 @@ def get_token(keyword, timespan):
         keyword (str): Keyword for which the token should be retrieved.
         timespan (str): Start and end date of the timespan with a space in
             between.
+        resolution (str, optional): Resolution of the data the token is used
+            for. Defaults to ''.
+        client (Client, optional): Client which the request goes through.
+            Defaults to a new one.
 
     Returns:
         str: Token, which can be used in the url for downloading the data.
@@ -137,23 +257,8 @@ def get_token(keyword, timespan):
     if not isinstance(keyword, str) or not isinstance(timespan, str):
         raise TypeError('keyword or timespan is not of type string.')
 
-    session = requests.session()
-
-    response = session.get(
-        url='https://trends.google.com/trends/api/explore',
-        timeout=(2, 5),
-        cookies=dict(filter(lambda i: i[0] == 'NID', requests.get(
-            'https://trends.google.com/?geo=US',
-            timeout=(2, 5)
-        ).cookies.items())),
-        params={'hl': 'en-US', 'tz': -120,
-                'req': '{"comparisonItem": [{"keyword": ' + f'"{keyword}"' +
-                ', "time": ' + f'"{timespan}"' +
-                ', "geo": "US"}], "category": 0, "property": ""}'}
-    )
-
-    content = response.text[4:]
-    return json.loads(content)['widgets'][0]['token']
+    client = client if client is not None else Client()
+    return client.token(keyword, timespan, resolution)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,271 @@
+"""
+Builds all processed datasets of data/processed in one pass: the keywords are
+read into one panel once, and the target, its alignment to the dates of the
+keywords and the rolling statistics are computed once for every dataset,
+instead of once per dataset. Every variant, and every subset of keywords like
+the curated one, is then a selection of these.
+
+Usage:
+    python -m src.features.build_dataset weekly daily
+    python -m src.features.build_dataset weekly --variants rolling delta \
+        --order alphabetical --subset curated=debt,stocks,markets
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data import telemetry
+from src.data.panel import read
+from src.features.build_features import block, target_binary
+
+VARIANTS = ['rolling', 'delta', 'pct_change']
+
+# Keywords of the curated datasets.
+CURATED = ['debt', 'stocks', 'dow_jones', 'markets', 'unemployment', 'money',
+           'stock_market', 'crisis', 'nasdaq', 'finance', 'invest']
+
+INTERVALS = {'daily': '1d', 'weekly': '1wk'}
+
+
+@telemetry.timed('load_panel')
+def load(periodicity, source='data/interim', keywords=None):
+    """
+    Reads the CSV-files of keywords into one panel.
+
+    Args:
+        periodicity (str): Either 'daily' or 'weekly'.
+        source (str, optional): Directory containing the directory of the
+            periodicity with one CSV-file per keyword. Defaults to
+            data/interim, the updated data.
+        keywords (list, optional): Keywords to read, in order. Defaults to
+            all CSV-files, sorted.
+
+    Returns:
+        pandas.DataFrame: Google Trends data of dates by keywords.
+
+    """
+
+    values, dates, keywords = read(periodicity, source, keywords)
+    telemetry.count('rows_total', values.size, stage='load_panel')
+
+    return pd.DataFrame(values.T, index=pd.DatetimeIndex(dates, name='Date'),
+                        columns=keywords)
+
+
+def align(target, dates, periodicity):
+    """
+    Target of every date of the Google Trends data. Weekly Google Trends data
+    is dated on Sundays, and weekly prices on the next trading day.
+    """
+
+    tolerance = pd.Timedelta(days=6 if periodicity == 'weekly' else 0)
+    return target.reindex(dates, method='bfill', tolerance=tolerance)
+
+
+def statistics(panel, variants=VARIANTS, length=3):
+    """
+    Rolling statistics of all keywords at once.
+
+    Args:
+        panel (pandas.DataFrame): Google Trends data of dates by keywords.
+        variants (list, optional): Any of 'rolling' (the mean), 'delta' and
+            'pct_change' (the delta relative to the current value). Defaults
+            to all.
+        length (int, optional): Length of the statistics. Defaults to 3.
+
+    Returns:
+        dict: Dictionary of the variants to DataFrames of dates by keywords.
+
+    Raises:
+        ValueError: If a variant is unknown.
+
+    """
+
+    for variant in variants:
+        if variant not in VARIANTS:
+            raise ValueError(f'Unknown variant `{variant}`.')
+
+    result = {}
+    if 'rolling' in variants:
+        result['rolling'] = block(panel, 'sma', length)
+
+    if 'delta' in variants or 'pct_change' in variants:
+        change = block(panel, 'delta', length)
+        if 'delta' in variants:
+            result['delta'] = change
+        if 'pct_change' in variants:
+            result['pct_change'] = change / panel
+
+    return {variant: result[variant].round(3) for variant in variants}
+
+
+def order_keywords(keywords, order=None):
+    """
+    Orders the keyword columns.
+
+    Args:
+        keywords (list): Keywords of the panel.
+        order (str or list, optional): Either 'alphabetical', or a list of the
+            keywords in order, of which keywords that aren't in it follow in
+            their own order. Defaults to the order of the panel.
+
+    Returns:
+        list: Ordered keywords.
+
+    Raises:
+        ValueError: If the order is unknown, or lists a keyword that isn't in
+            the panel.
+
+    """
+
+    if order is None:
+        return list(keywords)
+
+    if order == 'alphabetical':
+        return sorted(keywords)
+
+    if isinstance(order, str):
+        raise ValueError(f'Unknown order `{order}`.')
+
+    missing = [keyword for keyword in order if keyword not in keywords]
+    if missing:
+        raise ValueError(f'Keywords {missing} are not in the panel.')
+
+    return list(order) + [keyword for keyword in keywords
+                          if keyword not in order]
+
+
+@telemetry.timed('build_dataset')
+def build(panel, close, periodicity, variants=VARIANTS, order=None,
+          subsets=None, length=3):
+    """
+    Builds processed datasets of one periodicity.
+
+    Args:
+        panel (pandas.DataFrame): Google Trends data of dates by keywords,
+            like ``load``.
+        close (pandas.Series): Closing prices of the DJIA of the periodicity.
+        periodicity (str): Either 'daily' or 'weekly'.
+        variants (list, optional): Variants to build. Defaults to all of
+            ``VARIANTS``.
+        order (str or list, optional): Order of the keyword columns, see
+            ``order_keywords``. Defaults to the order of the panel.
+        subsets (dict, optional): Dictionary of names to lists of keywords,
+            of which a dataset is built next to the one of all keywords.
+            Keywords that aren't in the panel are left out, and the columns
+            follow the order of the list. Defaults to the curated keywords.
+        length (int, optional): Length of the statistics. Defaults to 3.
+
+    Returns:
+        dict: Dictionary of names, like 'weekly-rolling-binary' or
+            'weekly-rolling-binary-curated', to datasets with `Target`,
+            `index` and `lag_1` columns followed by a column per keyword, of
+            the dates that have all of them.
+
+    Raises:
+        TypeError: If `panel` is not of pandas.DataFrame type or `close` is
+            not of pandas.Series type.
+
+    """
+
+    if not isinstance(panel, pd.DataFrame):
+        raise TypeError('`panel` must be of type pandas.DataFrame.')
+
+    if not isinstance(close, pd.Series):
+        raise TypeError('`close` must be of type pandas.Series.')
+
+    if subsets is None:
+        subsets = {'curated': CURATED}
+
+    panel = panel[order_keywords(list(panel.columns), order)]
+
+    # Shared by all variants.
+    target = align(target_binary(close), panel.index, periodicity)
+    labelled = target.notna().to_numpy()
+
+    datasets = {}
+    for variant, values in statistics(panel, variants, length).items():
+        rows = labelled & values.notna().all(axis=1).to_numpy()
+        rows_target = target[rows].astype(int)
+
+        frame = pd.concat([pd.DataFrame({
+            'Target': rows_target.to_numpy(),
+            'index': np.arange(len(rows_target)),
+            'lag_1': rows_target.shift(1).fillna(0).astype(int).to_numpy(),
+        }, index=rows_target.index), values[rows]], axis=1)
+
+        name = f'{periodicity}-{variant}-binary'
+        datasets[name] = frame
+        telemetry.count('rows_total', len(frame), stage='build_dataset')
+
+        for subset, keywords in subsets.items():
+            datasets[f'{name}-{subset}'] = frame[
+                ['Target', 'index', 'lag_1']
+                + [keyword for keyword in keywords if keyword in frame]]
+
+    return datasets
+
+
+def write(datasets, directory='data/processed'):
+    """Writes datasets to CSV-files, each via a temporary file."""
+
+    os.makedirs(directory, exist_ok=True)
+
+    for name, frame in datasets.items():
+        path = os.path.join(directory, f'{name}.csv')
+        temporary = f'{path}.tmp'
+        frame.to_csv(temporary, index=False)
+        os.replace(temporary, path)
+
+
+if __name__ == '__main__':
+    # Only needed here, so that building from a panel works without the
+    # stored prices.
+    from src.data.prices import PriceStore
+
+    parser = argparse.ArgumentParser(
+        description='Builds the processed datasets in one pass.')
+    parser.add_argument('periodicities', nargs='*',
+                        default=['daily', 'weekly'])
+    parser.add_argument('--source', default='data/interim',
+                        help='directory of the keyword CSV-files')
+    parser.add_argument('--keywords', default='src/data/keywords.txt',
+                        help='file of the keywords, in the order of the '
+                             'columns')
+    parser.add_argument('--destination', default='data/processed')
+    parser.add_argument('--variants', nargs='+', default=VARIANTS)
+    parser.add_argument('--order', nargs='+', default=None,
+                        help="'alphabetical', or keywords that come first")
+    parser.add_argument('--subset', nargs='+', default=None,
+                        help='subsets of keywords like name=debt,stocks; '
+                             'defaults to the curated keywords')
+    arguments = parser.parse_args()
+
+    order = arguments.order
+    if order is not None and order == ['alphabetical']:
+        order = 'alphabetical'
+
+    subsets = None
+    if arguments.subset is not None:
+        subsets = {}
+        for subset in arguments.subset:
+            name, _, keywords = subset.partition('=')
+            subsets[name] = keywords.split(',')
+
+    with open(arguments.keywords, 'r') as f:
+        keywords = [line.strip().replace(' ', '_') for line in f
+                    if line.strip()]
+
+    store = PriceStore()
+    for periodicity in arguments.periodicities:
+        panel = load(periodicity, arguments.source, keywords)
+        datasets = build(panel,
+                         store.load('DJIA', INTERVALS[periodicity]).Close,
+                         periodicity, arguments.variants, order, subsets)
+        write(datasets, arguments.destination)
+
+        print(f'{periodicity}: {len(datasets)} datasets of '
+              f'{panel.shape[1]} keywords.')
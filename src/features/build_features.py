@@ -1,17 +1,21 @@
+import numpy as np
 import pandas as pd
 
+from src.data import telemetry
 
-def research(series, length=3):
-    """
-    The feature which is also used in the research paper by Tobias Preis et al.
+# Feature functions and the names of their columns.
+FEATURES = {
+    'research': 'SMA_delta',
+    'delta': 'delta',
+    'pct_change': 'pct_change',
+    'sma': 'SMA',
+    'ema': 'EMA',
+}
 
-    Args:
-        series (pandas.Series): Series of the Google Trends data.
-        length (int, optional): Length of the moving average used in the
-            calculation. Defaults to 3.
 
-    Returns:
-        pandas.Series: Series containing the feature.
+def validate(series, length):
+    """
+    Validates the arguments of a feature function.
 
     Raises:
         ValueError: If length is less than 1 or greater than the length of the
@@ -31,10 +35,128 @@ def research(series, length=3):
         raise ValueError('`length` may not be less than 1 or greater than the \
                           size of the series.')
 
-    N = series.rolling(window=length).mean().shift(1)
-    delta_n = series - N
 
-    return delta_n
+def block(data, feature, length, sma=None):
+    """
+    Computes one feature of a series, or of every column of a DataFrame.
+
+    Args:
+        data (pandas.Series or pandas.DataFrame): Google Trends data.
+        feature (str): Name of the feature function.
+        length (int): Length of the feature.
+        sma (pandas.Series or pandas.DataFrame, optional): Simple moving
+            average of ``data`` with the same length, if it is already
+            computed.
+
+    Returns:
+        pandas.Series or pandas.DataFrame: The feature.
+
+    """
+
+    if feature in ('research', 'sma') and sma is None:
+        sma = data.rolling(window=length).mean()
+
+    if feature == 'research':
+        return data - sma.shift(1)
+    elif feature == 'delta':
+        return data.diff(periods=length)
+    elif feature == 'pct_change':
+        return data.pct_change(periods=length)
+    elif feature == 'sma':
+        return sma
+    elif feature == 'ema':
+        return data.ewm(span=length, adjust=False).mean()
+
+    raise ValueError(f'Unknown feature `{feature}`.')
+
+
+@telemetry.timed('panel_features')
+def panel_features(panel, lengths, names=None):
+    """
+    Computes features of all keywords of a panel at once. The results are the
+    same as those of the functions of the single features.
+
+    Args:
+        panel (pandas.DataFrame): Google Trends data of dates by keywords.
+        lengths (list): Lengths for which every feature is computed.
+        names (list, optional): Names of the feature functions to compute.
+            Defaults to all of ``FEATURES``.
+
+    Returns:
+        pandas.DataFrame: DataFrame of dates by (feature, keyword) columns,
+            where the feature is named like `SMA_delta-3`.
+
+    Raises:
+        ValueError: If a length is less than 1 or greater than the length of
+            the panel, or a feature is unknown.
+        TypeError: If `panel` is not of pandas.DataFrame type or a length is
+            not an integer.
+
+    """
+
+    if names is None:
+        names = list(FEATURES)
+
+    if not isinstance(panel, pd.DataFrame):
+        raise TypeError('`panel` must be of type pandas.DataFrame.')
+
+    for length in lengths:
+        if not isinstance(length, int):
+            raise TypeError('`length` has to be of type int.')
+
+        if length < 1 or length > len(panel):
+            raise ValueError('`length` may not be less than 1 or greater than \
+                              the length of the panel.')
+
+    for name in names:
+        if name not in FEATURES:
+            raise ValueError(f'Unknown feature `{name}`.')
+
+    keywords = panel.shape[1]
+    values = np.empty((len(panel), len(lengths) * len(names) * keywords))
+    labels = []
+
+    column = 0
+    for length in lengths:
+        sma = None
+        if 'research' in names or 'sma' in names:
+            sma = panel.rolling(window=length).mean()
+
+        for name in names:
+            values[:, column:column + keywords] = \
+                block(panel, name, length, sma).values
+            labels.append(f'{FEATURES[name]}-{length}')
+            column += keywords
+
+    telemetry.count('rows_total', len(panel), stage='panel_features')
+
+    columns = pd.MultiIndex.from_product([labels, panel.columns])
+    return pd.DataFrame(values, index=panel.index, columns=columns, copy=False)
+
+
+def research(series, length=3):
+    """
+    The feature which is also used in the research paper by Tobias Preis et al.
+
+    Args:
+        series (pandas.Series): Series of the Google Trends data.
+        length (int, optional): Length of the moving average used in the
+            calculation. Defaults to 3.
+
+    Returns:
+        pandas.Series: Series containing the feature.
+
+    Raises:
+        ValueError: If length is less than 1 or greater than the length of the
+            series.
+        TypeError: If `series` is not of pandas.Series type or `length` is not an
+            integer.
+
+    """
+
+    validate(series, length)
+
+    return block(series, 'research', length)
 
 
 def delta(series, length=3):
@@ -57,17 +179,9 @@ def delta(series, length=3):
 
     """
 
-    if not isinstance(length, int):
-        raise TypeError(f'`length` has to be of type int.')
-
-    if not isinstance(series, pd.Series):
-        raise TypeError(f'`series` must be of type pandas.Series.')
-
-    if length < 1 or length > series.size:
-        raise ValueError('`length` may not be less than 1 or greater than the \
-                          size of the series.')
+    validate(series, length)
 
-    return series.diff(periods=length)
+    return block(series, 'delta', length)
 
 
 def pct_change(series, length=3):
@@ -90,17 +204,9 @@ def pct_change(series, length=3):
 
     """
 
-    if not isinstance(length, int):
-        raise TypeError(f'`length` has to be of type int.')
-
-    if not isinstance(series, pd.Series):
-        raise TypeError(f'`series` must be of type pandas.Series.')
-
-    if length < 1 or length > series.size:
-        raise ValueError('`length` may not be less than 1 or greater than the \
-                          size of the series.')
+    validate(series, length)
 
-    return series.pct_change(periods=length)
+    return block(series, 'pct_change', length)
 
 
 def sma(series, length=6):
@@ -122,17 +228,9 @@ def sma(series, length=6):
 
     """
 
-    if not isinstance(length, int):
-        raise TypeError(f'`length` has to be of type int.')
-
-    if not isinstance(series, pd.Series):
-        raise TypeError(f'`series` must be of type pandas.Series.')
-
-    if length < 1 or length > series.size:
-        raise ValueError('`length` may not be less than 1 or greater than the \
-                          size of the series.')
+    validate(series, length)
 
-    return series.rolling(window=length).mean()
+    return block(series, 'sma', length)
 
 
 def ema(series, length=6):
@@ -154,17 +252,153 @@ def ema(series, length=6):
 
     """
 
-    if not isinstance(length, int):
-        raise TypeError(f'`length` has to be of type int.')
+    validate(series, length)
 
-    if not isinstance(series, pd.Series):
-        raise TypeError(f'`series` must be of type pandas.Series.')
+    return block(series, 'ema', length)
 
-    if length < 1 or length > series.size:
-        raise ValueError('`length` may not be less than 1 or greater than the \
-                          size of the series.')
 
-    return series.ewm(span=length, adjust=False).mean()
+class LagMatrix():
+    """
+    Lagged copies of the columns of a DataFrame, without copying them: every
+    lag is a strided view of the same NaN-padded array. Only the columns that
+    are selected are materialized.
+
+    Attributes:
+        lags (list): Lags, in periods.
+        index (pandas.Index): Index of the DataFrame.
+        columns (list): Names of all lagged columns, ordered by lag and then
+            by column, like shifting and concatenating the DataFrame per lag.
+        windows (numpy.ndarray): Read-only view of rows by offsets by columns,
+            where offset ``max(lags) - lag`` holds the columns lagged by
+            ``lag``.
+
+    """
+
+    def __init__(self, frame, lags=range(3, 11),
+                 name='{column}_shifted_by_{lag}'):
+        """
+        Args:
+            frame (pandas.DataFrame): DataFrame of numeric columns.
+            lags (iterable, optional): Lags, in periods. Defaults to 3 through
+                10.
+            name (str, optional): Format of the names of the lagged columns,
+                with ``column`` and ``lag`` fields. Defaults to
+                '{column}_shifted_by_{lag}'.
+
+        Raises:
+            ValueError: If a lag is negative or there are no lags.
+            TypeError: If `frame` is not of pandas.DataFrame type or a lag is
+                not an integer.
+
+        """
+
+        if not isinstance(frame, pd.DataFrame):
+            raise TypeError('`frame` must be of type pandas.DataFrame.')
+
+        self.lags = list(lags)
+        if not self.lags:
+            raise ValueError('`lags` may not be empty.')
+
+        for lag in self.lags:
+            if not isinstance(lag, (int, np.integer)):
+                raise TypeError('`lags` must be integers.')
+
+            if lag < 0:
+                raise ValueError('`lags` may not be negative.')
+
+        self.index = frame.index
+        self.depth = max(self.lags)
+
+        rows, width = frame.shape
+        padded = np.full((self.depth + rows, width), np.nan)
+        padded[self.depth:] = frame.to_numpy(dtype='float64')
+
+        self.windows = np.lib.stride_tricks.as_strided(
+            padded, shape=(rows, self.depth + 1, width),
+            strides=(padded.strides[0],) + padded.strides, writeable=False)
+
+        self.columns = []
+        self._positions = {}
+        for lag in self.lags:
+            for i, column in enumerate(frame.columns):
+                label = name.format(column=column, lag=lag)
+                self.columns.append(label)
+                self._positions[label] = (self.depth - lag, i)
+
+        self._complete = ~np.isnan(padded).any(axis=1)
+
+    def view(self, lag):
+        """
+        All columns lagged by ``lag``.
+
+        Returns:
+            numpy.ndarray: Read-only view of rows by columns.
+
+        """
+
+        return self.windows[:, self.depth - lag, :]
+
+    def column(self, name):
+        """
+        One lagged column.
+
+        Returns:
+            numpy.ndarray: Read-only view of the column.
+
+        Raises:
+            KeyError: If there is no lagged column with that name.
+
+        """
+
+        offset, i = self._positions[name]
+        return self.windows[:, offset, i]
+
+    def valid(self):
+        """
+        Rows in which none of the lagged columns are NaN; the rows that
+        ``dropna`` keeps after concatenating all lagged columns.
+
+        Returns:
+            numpy.ndarray: Boolean mask of the rows.
+
+        """
+
+        rows = len(self.index)
+        mask = np.ones(rows, dtype=bool)
+
+        for lag in set(self.lags):
+            offset = self.depth - lag
+            mask &= self._complete[offset:offset + rows]
+
+        return mask
+
+    def select(self, names=None, dropna=True):
+        """
+        Materializes lagged columns.
+
+        Args:
+            names (list, optional): Names of the lagged columns. Defaults to
+                all of ``columns``.
+            dropna (bool, optional): Whether to only keep the rows in which
+                none of the lagged columns, including those not selected, are
+                NaN. Defaults to True.
+
+        Returns:
+            pandas.DataFrame: DataFrame of the selected columns.
+
+        """
+
+        if names is None:
+            names = self.columns
+
+        rows = self.valid() if dropna else slice(None)
+        index = self.index[rows]
+
+        values = np.empty((len(index), len(names)))
+        for j, name in enumerate(names):
+            values[:, j] = self.column(name)[rows]
+
+        return pd.DataFrame(values, index=index, columns=names, copy=False)
 
 
 def lag(series, length=1):
@@ -186,21 +420,13 @@ def lag(series, length=1):
 
     """
 
-    if not isinstance(length, int):
-        raise TypeError(f'`length` has to be of type int.')
-
-    if not isinstance(series, pd.Series):
-        raise TypeError(f'`series` must be of type pandas.Series.')
-
-    if length < 1 or length > series.size:
-        raise ValueError('`length` may not be less than 1 or greater than the \
-                          size of the series.')
+    validate(series, length)
 
-    lag_df = pd.DataFrame()
-    for i in range(1, length):
-        lag_df[f'lag_{i}'] = series.shift(i)
+    if length == 1:
+        return pd.DataFrame()
 
-    return lag_df
+    lags = LagMatrix(series.to_frame(), range(1, length), name='lag_{lag}')
+    return lags.select(dropna=False)
 
 
 def target_binary(series):
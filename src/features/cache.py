@@ -0,0 +1,405 @@
+"""
+Memoizes the functions of ``build_features.py`` in memory and on disk, so
+that a notebook run only computes the features of which the input data or
+parameters have changed.
+
+Results are stored under the hash of the input data, the function and its
+parameters. A changed file in data/raw has a different hash, so its old
+features are never returned; they are evicted once they are the least
+recently used.
+
+The input data is hashed once per pandas object, and files that are read
+through the cache aren't hashed at all, but identified by their path,
+modification time and size. A warm call then costs a lookup.
+"""
+
+import collections
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+# From pandas 3.0 on, modifying a shallow copy never changes the original.
+COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3
+
+
+def fingerprint(data):
+    """
+    Hash of the contents of a pandas object, including its index and names.
+
+    Args:
+        data (pandas.Series or pandas.DataFrame): Object to hash.
+
+    Returns:
+        str: Hexadecimal SHA-256 hash.
+
+    """
+
+    digest = hashlib.sha256()
+    digest.update(type(data).__name__.encode())
+
+    if isinstance(data, pd.DataFrame):
+        digest.update(repr(list(data.columns)).encode())
+        columns = [data.iloc[:, i] for i in range(data.shape[1])]
+    else:
+        digest.update(repr(data.name).encode())
+        columns = [data]
+
+    for values in [data.index] + columns:
+        digest.update(str(values.dtype).encode())
+        digest.update(content(values))
+
+    return digest.hexdigest()
+
+
+def content(values):
+    """Bytes of the values of an index or series."""
+
+    if values.dtype.kind in 'biufcmM':
+        array = np.asarray(values)
+        if array.dtype.kind in 'mM':
+            array = array.view('int64')
+
+        return np.ascontiguousarray(array).tobytes()
+
+    if pd.api.types.is_string_dtype(values.dtype) and not values.hasnans:
+        return '\x00'.join(np.asarray(values, dtype=object)).encode()
+
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return np.ascontiguousarray(hashes).tobytes()
+
+
+def identity(function):
+    """Name and source of a function, so that changing it invalidates it."""
+
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        source = ''
+
+    return f'{function.__module__}.{function.__qualname__}\n{source}'
+
+
+def size(result):
+    """Amount of bytes of a cached result."""
+
+    if isinstance(result, (pd.Series, pd.DataFrame)):
+        return int(np.sum(result.memory_usage(index=False, deep=True)))
+
+    return int(getattr(result, 'nbytes', 0))
+
+
+class FeatureCache():
+    """
+    Two-level cache of feature results: an in-memory LRU in front of an
+    on-disk store, both of which evict the least recently used results when
+    they grow beyond their size.
+
+    Attributes:
+        directory (str): Directory in which the results are stored, or
+            ``None`` to only cache in memory.
+        max_size (int): Maximum amount of bytes stored on disk.
+        memory_size (int): Maximum amount of bytes kept in memory.
+        hits (int): Amount of results returned from memory.
+        disk_hits (int): Amount of results read from disk.
+        misses (int): Amount of results that had to be computed.
+        copy (bool): Whether copies of the cached results are returned, so
+            that modifying them doesn't change the cache.
+
+    """
+
+    def __init__(self, directory='data/interim/features', max_size=2 ** 30,
+                 memory_size=2 ** 28, copy=True):
+        """
+        Args:
+            directory (str, optional): Directory in which the results are
+                stored, or ``None`` to only cache in memory. Defaults to
+                data/interim/features.
+            max_size (int, optional): Maximum amount of bytes stored on disk.
+                Defaults to 1 GiB.
+            memory_size (int, optional): Maximum amount of bytes kept in
+                memory. Defaults to 256 MiB.
+            copy (bool, optional): Whether copies of the cached results are
+                returned. Returning the cached results themselves is faster
+                for large results, but they may then not be modified.
+                Defaults to True.
+        """
+
+        self.directory = directory
+        self.max_size = max_size
+        self.memory_size = memory_size
+        self.copy = copy
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._functions = {}
+        self._fingerprints = {}
+        self._lock = threading.RLock()
+
+        self.size = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self.size = sum(os.path.getsize(path) for path in self.paths())
+
+    def paths(self):
+        """Paths of all stored results."""
+
+        return [os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith('.pkl')]
+
+    def fingerprint(self, data):
+        """
+        Hash of the contents of a pandas object, which is only computed the
+        first time the object is passed. An object that is modified in place
+        afterward must therefore be passed as a copy.
+
+        Args:
+            data (pandas.Series or pandas.DataFrame): Object to hash.
+
+        Returns:
+            str: Hexadecimal SHA-256 hash.
+
+        """
+
+        with self._lock:
+            known = self._fingerprints.get(id(data))
+
+        if known is not None:
+            return known
+
+        digest = fingerprint(data)
+        self.register(data, digest)
+
+        return digest
+
+    def register(self, data, digest):
+        """Remembers the hash of a pandas object for as long as it exists."""
+
+        with self._lock:
+            self._fingerprints[id(data)] = digest
+
+        # The id of an object is reused once it is gone.
+        weakref.finalize(data, self._fingerprints.pop, id(data), None)
+
+    def read(self, path, column=None, **kwargs):
+        """
+        Reads a CSV-file, like one in data/raw, of which the hash is that of
+        its path, modification time and size instead of its contents. An
+        edited file gets a new hash, so its features are computed again.
+
+        Args:
+            path (str): Path of the CSV-file.
+            column (str, optional): Column that is returned, e.g. 'Adjusted'.
+                Defaults to all columns.
+            **kwargs: Keyword arguments passed to ``pandas.read_csv``, e.g.
+                ``index_col='Date'``.
+
+        Returns:
+            pandas.DataFrame or pandas.Series: The data, which may not be
+                modified in place.
+
+        """
+
+        stat = os.stat(path)
+
+        data = pd.read_csv(path, **kwargs)
+        if column is not None:
+            data = data[column]
+
+        source = json.dumps([os.path.abspath(path), stat.st_mtime_ns,
+                             stat.st_size, column, kwargs],
+                            sort_keys=True, default=repr)
+        self.register(data, hashlib.sha256(source.encode()).hexdigest())
+
+        return data
+
+    def key(self, function, *args, **kwargs):
+        """
+        Hash of a call: of the function, its pandas arguments by content and
+        its other arguments by value, with the defaults filled in.
+
+        Raises:
+            TypeError: If the arguments don't match the function.
+
+        """
+
+        with self._lock:
+            if function not in self._functions:
+                self._functions[function] = (identity(function),
+                                             inspect.signature(function))
+            name, signature = self._functions[function]
+
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+
+        parameters = {}
+        for parameter, value in bound.arguments.items():
+            if isinstance(value, (pd.Series, pd.DataFrame)):
+                parameters[parameter] = self.fingerprint(value)
+            elif isinstance(value, range):
+                parameters[parameter] = list(value)
+            else:
+                parameters[parameter] = value
+
+        call = json.dumps([name, parameters], sort_keys=True, default=repr)
+        return hashlib.sha256(call.encode()).hexdigest()
+
+    def __call__(self, function, *args, **kwargs):
+        """
+        Returns the cached result of ``function(*args, **kwargs)``, or
+        computes and caches it.
+
+        Args:
+            function (callable): Feature function, like ``sma``.
+            *args: Arguments passed to the function.
+            **kwargs: Keyword arguments passed to the function.
+
+        Returns:
+            The result of the function; a copy of it if ``copy`` is set.
+
+        """
+
+        key = self.key(function, *args, **kwargs)
+
+        result = self.get(key)
+        if result is None:
+            result = function(*args, **kwargs)
+            self.put(key, result)
+
+        if self.copy and isinstance(result, (pd.Series, pd.DataFrame)):
+            return result.copy(deep=not COPY_ON_WRITE)
+
+        if self.copy and hasattr(result, 'copy'):
+            return result.copy()
+
+        return result
+
+    def memoize(self, function):
+        """Wraps a function so that every call goes through the cache."""
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return self(function, *args, **kwargs)
+
+        return wrapper
+
+    def get(self, key):
+        """Result stored under a key, or ``None`` if there is none."""
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+        if self.directory is not None:
+            path = os.path.join(self.directory, f'{key}.pkl')
+
+            try:
+                result = pd.read_pickle(path)
+            except FileNotFoundError:
+                pass
+            else:
+                # Mark as recently used.
+                os.utime(path)
+                self.disk_hits += 1
+                self.remember(key, result)
+                return result
+
+        self.misses += 1
+        return None
+
+    def put(self, key, result):
+        """Stores a result in memory and on disk."""
+
+        self.remember(key, result)
+
+        if self.directory is None:
+            return
+
+        path = os.path.join(self.directory, f'{key}.pkl')
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        pd.to_pickle(result, temporary)
+
+        stored = os.path.getsize(temporary)
+
+        with self._lock:
+            # An overwritten result replaces the one that was counted.
+            if os.path.exists(path):
+                stored -= os.path.getsize(path)
+
+            os.replace(temporary, path)
+            self.size += stored
+            if self.size > self.max_size:
+                self.evict()
+
+    def remember(self, key, result):
+        """Keeps a result in memory and forgets the least recently used."""
+
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+
+            self._memory[key] = result
+            self._memory_bytes += size(result)
+
+            while self._memory_bytes > self.memory_size and self._memory:
+                _, oldest = self._memory.popitem(last=False)
+                self._memory_bytes -= size(oldest)
+
+    def evict(self):
+        """Removes the least recently used results until they fit on disk."""
+
+        paths = sorted(self.paths(), key=os.path.getmtime)
+
+        self.size = sum(os.path.getsize(path) for path in paths)
+        for path in paths:
+            if self.size <= self.max_size:
+                break
+
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+
+    def clear(self):
+        """Removes all results from memory and disk."""
+
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+            if self.directory is not None:
+                for path in self.paths():
+                    os.remove(path)
+                self.size = 0
+
+    def stats(self):
+        """
+        Hit and miss statistics.
+
+        Returns:
+            dict: Amount of hits from memory and disk, misses, hit rate, and
+                bytes used in memory and on disk.
+
+        """
+
+        calls = self.hits + self.disk_hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / calls if calls else 0.0,
+            'memory_bytes': self._memory_bytes,
+            'disk_bytes': self.size,
+        }
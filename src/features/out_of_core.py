@@ -0,0 +1,539 @@
+"""
+Out-of-core mode for keyword universes that don't fit in memory at once, like
+tens of thousands of keywords. The adjustment, the feature building and the
+screening each stream blocks of keywords through a memory budget: a block is
+read, processed and spilled to disk as float32 columns (see ``columns.py``)
+before the next one is read, so that the peak memory depends on the budget
+instead of on the amount of keywords. The wall time and peak resident set
+size of every stage are reported.
+
+The stores are written to ``{directory}/{periodicity}/adjusted`` and
+``{directory}/{periodicity}/features``, and the selected features to
+``{directory}/{periodicity}/selected.csv``.
+
+Usage:
+    python -m src.features.out_of_core --memory 1G
+    python -m src.features.out_of_core --synthetic 10000 --memory 512M
+"""
+
+import argparse
+import contextlib
+import datetime
+import heapq
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data import telemetry
+from src.data.client import Client
+from src.data.columns import ColumnStore
+from src.data.make_dataset import Trends
+from src.features.build_features import FEATURES, LagMatrix, panel_features
+from src.features.select_features import screen as screen_block
+
+UNITS = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30}
+
+# Memory that a block is given at least, even if the budget is used up.
+MINIMUM = 2 ** 24
+
+
+def parse_size(text):
+    """
+    Amount of bytes of a size like '512M' or '2G'.
+
+    Raises:
+        ValueError: If the size can't be parsed.
+
+    """
+
+    size = str(text).strip().upper().rstrip('B')
+    factor = UNITS.get(size[-1:], 1)
+    number = size[:-1] if size[-1:] in UNITS else size
+
+    try:
+        return int(float(number) * factor)
+    except ValueError:
+        raise ValueError(f'Unknown size `{text}`.') from None
+
+
+def memory():
+    """
+    Current and peak resident set size of the process, in bytes.
+
+    Returns:
+        tuple: The current and the peak size. Without /proc, both are the
+            peak since the process started.
+
+    """
+
+    try:
+        with open('/proc/self/status', 'r') as f:
+            status = dict(line.split(':', 1) for line in f if ':' in line)
+
+        return (int(status['VmRSS'].split()[0]) * 1024,
+                int(status['VmHWM'].split()[0]) * 1024)
+    except (OSError, KeyError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return peak, peak
+
+
+def reset_peak():
+    """
+    Resets the peak resident set size to the current one, which is only
+    possible on Linux.
+
+    Returns:
+        bool: Whether the peak was reset.
+
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+
+    return True
+
+
+class Monitor():
+    """
+    Memory budget of the stages, and the wall time and peak resident set size
+    of every stage that ran.
+
+    Attributes:
+        budget (int): Peak resident set size of the process that the blocks
+            are sized for, in bytes.
+        stages (dict): Dictionary of the stages to dictionaries of their
+            `seconds`, `peak` resident set size, amount of `blocks` and
+            `columns` written, and whether the peak is of the stage only
+            (`exact`) or since the process started.
+
+    """
+
+    def __init__(self, budget=2 ** 30):
+        """
+        Args:
+            budget (int, optional): Peak resident set size of the process that
+                the blocks are sized for, in bytes. Defaults to 1 GiB.
+        """
+
+        self.budget = budget
+        self.stages = {}
+
+    def available(self):
+        """Bytes that a block may use: what is left of the budget."""
+
+        return max(self.budget - memory()[0], MINIMUM)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager that records a stage. Yields the dictionary of the
+        stage, of which the `blocks` and `columns` are counted by the stage.
+        """
+
+        record = {'seconds': 0.0, 'peak': 0, 'blocks': 0, 'columns': 0,
+                  'exact': reset_peak()}
+
+        start = time.perf_counter()
+        with telemetry.stage(name):
+            yield record
+
+        record['seconds'] = time.perf_counter() - start
+        record['peak'] = memory()[1]
+        self.stages[name] = record
+
+        telemetry.count('blocks_total', record['blocks'], stage=name)
+
+    def report(self):
+        """One line per stage with its wall time and peak memory."""
+
+        lines = []
+        for name, record in self.stages.items():
+            peak = f'{record["peak"] / 2 ** 20:.0f} MiB'
+            if not record['exact']:
+                peak += ' (since the start)'
+            if record['peak'] > self.budget:
+                peak += ' over budget'
+
+            lines.append(f'{name}: {record["seconds"]:.1f} s, '
+                         f'{record["columns"]} columns in '
+                         f'{record["blocks"]} blocks, peak RSS {peak} of '
+                         f'{self.budget / 2 ** 20:.0f} MiB')
+
+        return '\n'.join(lines)
+
+
+def recorded(keywords, client, start_date=datetime.date(2004, 1, 1),
+             end_date=datetime.date.today()):
+    """
+    Pulls keywords one at a time, like from the recorded responses with an
+    offline client. Keywords that fail are skipped.
+
+    Yields:
+        tuple: Keyword and a dictionary of 'daily', 'weekly' and 'monthly' to
+            its pulled data.
+
+    """
+
+    for keyword in keywords:
+        trends = Trends(keyword, start_date, end_date, client=client)
+
+        try:
+            with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+                trends.pull_daily()
+                trends.pull_weekly()
+                trends.pull_monthly()
+        except Exception as exception:
+            print(f'Failed ({keyword}): {exception!r}')
+            continue
+
+        yield keyword, {'daily': trends.daily, 'weekly': trends.weekly,
+                        'monthly': trends.monthly}
+
+
+def adjust(pulled, monitor, directory='data/interim/blocks',
+           start_date=datetime.date(2004, 1, 1), client=None):
+    """
+    Adjusts keywords one at a time, and spills their daily and weekly data in
+    blocks of keywords. The dates of the first keyword are those of the
+    stores; dates that other keywords don't have are NaN. Keywords that fail
+    to adjust, or that were already adjusted, are skipped.
+
+    Args:
+        pulled (iterable): (keyword, frames) of every keyword, where the
+            frames are a dictionary of 'daily', 'weekly' and 'monthly' to
+            their pulled data, like ``recorded`` or ``synthetic.keywords``.
+        monitor (Monitor): Memory budget and record of the stages.
+        directory (str, optional): Directory of the stores. Defaults to
+            data/interim/blocks.
+        start_date (datetime.date, optional): The start date from where the
+            data was pulled. Defaults to 2004-01-01.
+        client (Client, optional): Client of the ``Trends``, which doesn't
+            send any requests. Defaults to a new one without a token cache.
+
+    Returns:
+        dict: Dictionary of 'daily' and 'weekly' to their ``ColumnStore``.
+
+    Raises:
+        ValueError: If there are no keywords.
+
+    """
+
+    client = client if client is not None else Client(cache=None)
+
+    stores = {}
+    buffers = {}
+    names = []
+    seen = set()
+    failed = {}
+
+    def spill():
+        for periodicity, store in stores.items():
+            store.append(names, buffers[periodicity][:, :len(names)])
+            buffers[periodicity][:] = np.nan
+
+        record['blocks'] += 1
+        record['columns'] += len(names)
+        names.clear()
+
+    with monitor.stage('adjust') as record, \
+            open(os.devnull, 'w') as devnull, \
+            contextlib.redirect_stdout(devnull):
+        for keyword, frames in pulled:
+            trends = Trends(keyword, start_date, client=client)
+            if trends.keyword_file in seen:
+                continue
+
+            trends.daily = frames['daily']
+            trends.weekly = frames['weekly']
+            trends.monthly = frames['monthly']
+
+            try:
+                trends.adjust_weekly()
+                trends.adjust_daily()
+            except Exception as exception:
+                failed[keyword] = exception
+                continue
+
+            seen.add(trends.keyword_file)
+
+            adjusted = {periodicity: getattr(trends, periodicity)
+                        for periodicity in ['daily', 'weekly']}
+
+            if not stores:
+                for periodicity, frame in adjusted.items():
+                    stores[periodicity] = ColumnStore(
+                        os.path.join(directory, periodicity, 'adjusted'),
+                        pd.to_datetime(frame['Date']))
+
+                # Float32 buffers of both periodicities, in half of the
+                # memory; the other half is left for adjusting.
+                rows = sum(len(store.index) for store in stores.values())
+                width = max(1, monitor.available() // (8 * rows))
+                buffers = {periodicity: np.full((len(store.index), width),
+                                                np.nan, dtype='float32')
+                           for periodicity, store in stores.items()}
+
+            for periodicity, frame in adjusted.items():
+                positions = stores[periodicity].index.get_indexer(
+                    pd.to_datetime(frame['Date']))
+                found = positions >= 0
+                buffers[periodicity][positions[found], len(names)] = \
+                    frame['Adjusted'].to_numpy()[found]
+
+            names.append(trends.keyword_file)
+            if len(names) == width:
+                spill()
+
+        if names:
+            spill()
+
+    for keyword, exception in failed.items():
+        print(f'Failed ({keyword}): {exception!r}')
+
+    if not stores:
+        raise ValueError('There are no keywords to adjust.')
+
+    return stores
+
+
+def features(monitor, directory='data/interim/blocks', periodicity='daily',
+             lengths=(3,), names=None):
+    """
+    Builds the features of the adjusted data in blocks of keywords, with
+    ``panel_features``, and spills them. The features of a keyword are named
+    like `debt_SMA-3`.
+
+    Args:
+        monitor (Monitor): Memory budget and record of the stages.
+        directory (str, optional): Directory of the stores. Defaults to
+            data/interim/blocks.
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'daily'.
+        lengths (iterable, optional): Lengths for which every feature is
+            computed. Defaults to 3.
+        names (list, optional): Names of the feature functions to compute.
+            Defaults to all of ``FEATURES``.
+
+    Returns:
+        ColumnStore: Store of the features.
+
+    """
+
+    if names is None:
+        names = list(FEATURES)
+
+    source = ColumnStore(os.path.join(directory, periodicity, 'adjusted'))
+    destination = ColumnStore(os.path.join(directory, periodicity, 'features'),
+                              source.index)
+
+    # Per keyword, the float64 panel, rolling mean and the temporary frames
+    # of the features, and every feature as float64 and its float32 copy.
+    columns = len(list(lengths)) * len(names)
+    width = max(1, monitor.available()
+                // (len(source.index) * (48 + 20 * columns)))
+
+    with monitor.stage('features') as record:
+        for start in range(0, len(source), width):
+            result = panel_features(source.frame(start, start + width),
+                                    list(lengths), names)
+
+            destination.append([f'{keyword}_{feature}'
+                                for feature, keyword in result.columns],
+                               result.to_numpy())
+
+            record['blocks'] += 1
+            record['columns'] += result.shape[1]
+
+    return destination
+
+
+def complete(store, width):
+    """Rows in which none of the columns of a store are NaN."""
+
+    mask = np.ones(len(store.index), dtype=bool)
+    for _, values in store.blocks():
+        for start in range(0, len(values), width):
+            mask &= ~np.isnan(values[start:start + width]).any(axis=0)
+
+    return mask
+
+
+def screen(target, monitor, directory='data/interim/blocks',
+           periodicity='daily', lags=range(3, 11), top=50, workers=None,
+           dropna=False):
+    """
+    Finds the lagged features with the highest absolute correlation with the
+    target, in blocks of features. The result is the same as that of
+    ``select_features.screen`` of a ``LagMatrix`` of all features: every
+    lagged feature is correlated over the rows in which it isn't NaN.
+
+    Args:
+        target (pandas.Series): Target of the dates of the stores, like
+            ``target_binary`` aligned with ``build_dataset.align``. Dates
+            that are not in the target, or are NaN, are left out, so passing
+            the training target screens the training rows.
+        monitor (Monitor): Memory budget and record of the stages.
+        directory (str, optional): Directory of the stores. Defaults to
+            data/interim/blocks.
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'daily'.
+        lags (iterable, optional): Lags, in periods. Defaults to 3 through
+            10.
+        top (int, optional): Amount of features to keep. Defaults to 50.
+        workers (int, optional): Amount of threads. Defaults to the amount
+            of cores.
+        dropna (bool, optional): Whether to only screen the rows in which
+            none of the lagged features are NaN, like the notebook does.
+            With many keywords, few or no rows are left. Defaults to False.
+
+    Returns:
+        pandas.Series: Absolute correlations of the best lagged features,
+            from high to low, indexed by their names.
+
+    Raises:
+        TypeError: If `target` is not of pandas.Series type.
+
+    """
+
+    if not isinstance(target, pd.Series):
+        raise TypeError('`target` must be of type pandas.Series.')
+
+    store = ColumnStore(os.path.join(directory, periodicity, 'features'))
+    lags = list(lags)
+    rows = len(store.index)
+
+    workers = workers or os.cpu_count()
+    available = monitor.available()
+
+    # A quarter of the memory goes to the chunks that the workers correlate,
+    # which take about six float64 copies, and the rest to the float64 block
+    # and the copies that its LagMatrix takes.
+    chunk_size = int(max(1, min(512, available // (4 * workers * rows * 48))))
+    width = int(max(1, (available * 3 // 4) // (rows * 32)))
+
+    with monitor.stage('screen') as record:
+        target = target.dropna()
+
+        if dropna:
+            # Rows that ``dropna`` keeps after lagging all features.
+            padded = np.r_[np.zeros(max(lags), dtype=bool),
+                           complete(store, width)]
+            valid = np.ones(rows, dtype=bool)
+            for lag in set(lags):
+                valid &= padded[max(lags) - lag:max(lags) - lag + rows]
+
+            target = target[target.index.isin(store.index[valid])]
+
+        best = []
+        for start in range(0, len(store), width):
+            frame = store.frame(start, start + width)
+            matrix = LagMatrix(frame, lags)
+
+            correlations = screen_block(matrix, target, top, chunk_size,
+                                        workers)
+
+            # Ties are broken by the position in a LagMatrix of all features,
+            # of which the columns are ordered by lag and then by feature.
+            positions = {name: i for i, name in enumerate(matrix.columns)}
+            for name, correlation in correlations.items():
+                lag, column = divmod(positions[name], frame.shape[1])
+                item = (correlation, -lag, -(start + column), name)
+
+                if len(best) < top:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+
+            record['blocks'] += 1
+            record['columns'] += len(matrix.columns)
+
+    best.sort(reverse=True)
+    return pd.Series([item[0] for item in best],
+                     index=[item[-1] for item in best], dtype='float64')
+
+
+if __name__ == '__main__':
+    # Only needed here, so that the stages work without the stored prices or
+    # the synthetic data.
+    from src.benchmarks import synthetic
+    from src.data.prices import PriceStore
+    from src.data.responses import ResponseCache
+    from src.features.build_dataset import INTERVALS, align
+    from src.features.build_features import target_binary
+
+    parser = argparse.ArgumentParser(
+        description='Adjusts, builds and screens keywords out of core.')
+    parser.add_argument('--stages', nargs='+',
+                        default=['adjust', 'features', 'screen'],
+                        choices=['adjust', 'features', 'screen'])
+    parser.add_argument('--memory', default='1G',
+                        help='peak resident set size, like 512M or 2G')
+    parser.add_argument('--directory', default='data/interim/blocks')
+    parser.add_argument('--periodicity', default='daily',
+                        choices=['daily', 'weekly'])
+    parser.add_argument('--keywords', default='src/data/keywords.txt',
+                        help='file of the keywords, which are adjusted from '
+                             'the recorded responses')
+    parser.add_argument('--synthetic', type=int, default=None,
+                        help='adjust this amount of synthetic keywords '
+                             'instead, screened against synthetic prices')
+    parser.add_argument('--lengths', nargs='+', type=int, default=[3])
+    parser.add_argument('--lags', nargs='+', type=int,
+                        default=list(range(3, 11)))
+    parser.add_argument('--top', type=int, default=50)
+    parser.add_argument('--dropna', action='store_true',
+                        help='only screen the rows without any NaN feature')
+    parser.add_argument('--until', default=None,
+                        help='last date that is screened, like the end of '
+                             'the training data')
+    args = parser.parse_args()
+
+    monitor = Monitor(parse_size(args.memory))
+    client = Client(cache=None, responses=ResponseCache(offline=True))
+
+    if 'adjust' in args.stages:
+        if args.synthetic is not None:
+            pulled = synthetic.keywords(args.synthetic)
+            start_date = synthetic.START
+        else:
+            with open(args.keywords, 'r') as f:
+                keywords = list(dict.fromkeys(line.strip() for line in f
+                                              if line.strip()))
+
+            pulled = recorded(keywords, client)
+            start_date = datetime.date(2004, 1, 1)
+
+        adjust(pulled, monitor, args.directory, start_date, client)
+
+    if 'features' in args.stages:
+        features(monitor, args.directory, args.periodicity, args.lengths)
+
+    if 'screen' in args.stages:
+        if args.synthetic is not None:
+            close = synthetic.close()
+        else:
+            close = PriceStore().load('DJIA', INTERVALS[args.periodicity]).Close
+
+        dates = ColumnStore(os.path.join(args.directory, args.periodicity,
+                                         'features')).index
+        target = align(target_binary(close), dates, args.periodicity)
+
+        selected = screen(target[:args.until], monitor, args.directory,
+                          args.periodicity, args.lags, args.top,
+                          dropna=args.dropna)
+
+        path = os.path.join(args.directory, args.periodicity, 'selected.csv')
+        selected.rename('correlation').to_csv(f'{path}.tmp',
+                                              index_label='feature')
+        os.replace(f'{path}.tmp', path)
+
+        print(f'Selected {len(selected)} features, written to {path}.')
+
+    print(monitor.report())
@@ -0,0 +1,131 @@
+"""
+Selects the features that correlate most with the target, without
+materializing the whole matrix of candidate features. The candidates are
+screened in chunks of columns on all cores, and only the best ``top`` are
+kept.
+"""
+
+import heapq
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.data import telemetry
+from src.features.build_features import LagMatrix
+
+
+def correlate(values, target):
+    """
+    Pearson correlation of every column with the target. Like
+    ``DataFrame.corrwith``, every column only uses the rows in which neither
+    it nor the target is NaN, such as the warm-up of rolling features.
+
+    Args:
+        values (numpy.ndarray): Array of rows by columns.
+        target (numpy.ndarray): Target of every row.
+
+    Returns:
+        numpy.ndarray: Correlation of every column; NaN for columns with
+            fewer than two rows or no variance.
+
+    """
+
+    valid = ~np.isnan(values) & ~np.isnan(target)[:, None]
+    count = valid.sum(axis=0)
+
+    x = np.where(valid, values, 0.0)
+    y = np.where(valid, target[:, None], 0.0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Sufficient statistics of every column: the count, means, and
+        # centered sums of squares and products of the valid rows.
+        x -= np.where(valid, x.sum(axis=0) / count, 0.0)
+        y -= np.where(valid, y.sum(axis=0) / count, 0.0)
+
+        covariance = np.einsum('ij,ij->j', x, y)
+        variance = np.einsum('ij,ij->j', x, x) * np.einsum('ij,ij->j', y, y)
+        correlation = covariance / np.sqrt(variance)
+
+    correlation[count < 2] = np.nan
+    return np.clip(correlation, -1, 1)
+
+
+@telemetry.timed('screen')
+def screen(features, target, top=50, chunk_size=512, workers=None):
+    """
+    Finds the features with the highest absolute correlation with the
+    target; the same as sorting ``np.abs(features.corrwith(target))``, but
+    only ``chunk_size`` columns are in memory per worker at a time.
+
+    Args:
+        features (pandas.DataFrame or LagMatrix): Candidate features. The
+            columns of a ``LagMatrix`` are only materialized per chunk.
+        target (pandas.Series): Target, like ``target_binary``, indexed like
+            the features. Rows that are not in the target are left out, so
+            passing the training target screens the training rows.
+        top (int, optional): Amount of features to keep. Defaults to 50.
+        chunk_size (int, optional): Amount of columns per chunk. Defaults to
+            512.
+        workers (int, optional): Amount of threads. Defaults to the amount
+            of cores.
+
+    Returns:
+        pandas.Series: Absolute correlations of the best features, from high
+            to low, indexed by their names.
+
+    Raises:
+        ValueError: If ``top`` or ``chunk_size`` is less than 1.
+        TypeError: If `features` is not of pandas.DataFrame or LagMatrix type
+            or `target` is not of pandas.Series type.
+
+    """
+
+    if not isinstance(features, (pd.DataFrame, LagMatrix)):
+        raise TypeError('`features` must be of type pandas.DataFrame or '
+                        'LagMatrix.')
+
+    if not isinstance(target, pd.Series):
+        raise TypeError('`target` must be of type pandas.Series.')
+
+    if top < 1 or chunk_size < 1:
+        raise ValueError('`top` and `chunk_size` may not be less than 1.')
+
+    names = list(features.columns)
+    rows = target.index.intersection(features.index)
+    y = target.loc[rows].to_numpy(dtype='float64')
+
+    positions = features.index.get_indexer(rows)
+
+    if isinstance(features, pd.DataFrame):
+        def chunk(start, stop):
+            block = features.iloc[positions, start:stop]
+            return block.to_numpy(dtype='float64')
+    else:
+        def chunk(start, stop):
+            return np.column_stack([features.column(name)[positions]
+                                    for name in names[start:stop]])
+
+    def job(start):
+        stop = min(start + chunk_size, len(names))
+        return start, correlate(chunk(start, stop), y)
+
+    best = []
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for start, correlations in pool.map(
+                job, range(0, len(names), chunk_size)):
+            for i, correlation in enumerate(np.abs(correlations), start):
+                if np.isnan(correlation):
+                    continue
+
+                # Ties are broken by the position of the column.
+                item = (correlation, -i)
+                if len(best) < top:
+                    heapq.heappush(best, item)
+                elif item > best[0]:
+                    heapq.heapreplace(best, item)
+
+    best.sort(reverse=True)
+    return pd.Series([correlation for correlation, _ in best],
+                     index=[names[-i] for _, i in best], dtype='float64')
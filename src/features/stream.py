@@ -0,0 +1,398 @@
+"""
+Keeps the features of ``build_features.py`` up to date one observation at a
+time, instead of recomputing them over the whole history for every new data
+point. Every update takes constant time.
+
+The rolling means, rolling standard deviations, and exponential moving
+averages follow the same online algorithms as pandas' ``rolling`` and
+``ewm`` (Kahan-compensated sums and Welford's method), so the features are
+identical to those computed in batch.
+"""
+
+import json
+import math
+import os
+import sys
+
+# Relative loss of the sum of squared differences after which pandas
+# recomputes the rolling variance from scratch.
+CANCELLATION = 1000 * sys.float_info.epsilon
+
+
+class RollingMean():
+    """Running mean of the last ``length`` observations."""
+
+    cancelled = False
+
+    def __init__(self, length):
+        self.length = length
+        self.reset()
+
+    def reset(self):
+        self.nobs = 0
+        self.sum = 0.0
+        self.negative = 0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.same = 0
+        self.previous = math.nan
+
+    def add(self, value):
+        if value != value:
+            return
+
+        self.nobs += 1
+
+        y = value - self.compensation_add
+        t = self.sum + y
+        self.compensation_add = t - self.sum - y
+        self.sum = t
+
+        if math.copysign(1, value) < 0:
+            self.negative += 1
+
+        if value == self.previous:
+            self.same += 1
+        else:
+            self.same = 1
+        self.previous = value
+
+    def remove(self, value):
+        if value != value:
+            return
+
+        self.nobs -= 1
+
+        y = -value - self.compensation_remove
+        t = self.sum + y
+        self.compensation_remove = t - self.sum - y
+        self.sum = t
+
+        if math.copysign(1, value) < 0:
+            self.negative -= 1
+
+    def value(self):
+        if self.nobs < self.length or self.nobs == 0:
+            return math.nan
+
+        if self.same >= self.nobs:
+            return self.previous
+
+        result = self.sum / self.nobs
+        if self.negative == 0 and result < 0:
+            return 0.0
+        if self.negative == self.nobs and result > 0:
+            return 0.0
+
+        return result
+
+
+class RollingVariance():
+    """Running sample variance of the last ``length`` observations."""
+
+    def __init__(self, length):
+        self.length = length
+        self.reset()
+
+    def reset(self):
+        self.nobs = 0
+        self.mean = 0.0
+        self.ssqdm = 0.0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.cancelled = False
+
+    def add(self, value):
+        if value != value:
+            return
+
+        self.nobs += 1
+
+        previous_mean = self.mean - self.compensation_add
+        y = value - self.compensation_add
+        t = y - self.mean
+        self.compensation_add = t + self.mean - y
+
+        self.mean = self.mean + t / self.nobs
+        self.ssqdm = self.ssqdm + (value - previous_mean) * (value - self.mean)
+
+    def remove(self, value):
+        if value != value:
+            return
+
+        self.nobs -= 1
+
+        if not self.nobs:
+            self.mean = 0.0
+            self.ssqdm = 0.0
+            return
+
+        ssqdm = self.ssqdm
+
+        previous_mean = self.mean - self.compensation_remove
+        y = value - self.compensation_remove
+        t = y - self.mean
+        self.compensation_remove = t + self.mean - y
+
+        self.mean = self.mean - t / self.nobs
+        self.ssqdm = self.ssqdm - (value - previous_mean) * (value - self.mean)
+
+        # Most of the sum was cancelled out, so it is too imprecise to keep.
+        self.cancelled = self.ssqdm <= 0 or self.ssqdm < ssqdm * CANCELLATION
+
+    def value(self):
+        if self.nobs < self.length or self.nobs <= 1:
+            return math.nan
+
+        return max(self.ssqdm / (self.nobs - 1), 0.0)
+
+
+class ExponentialMean():
+    """Exponential moving average with a span of ``length``."""
+
+    def __init__(self, length):
+        self.length = length
+
+        self.com = (length - 1) / 2.0
+        self.alpha = 1.0 / (1.0 + self.com)
+
+        self.weighted = math.nan
+        self.weight = 1.0
+        self.new_weight = self.alpha
+        self.nobs = 0
+
+    def add(self, value):
+        observed = value == value
+
+        if not self.nobs and self.weighted != self.weighted:
+            # First observation.
+            self.weighted = value
+            self.nobs += observed
+            return
+
+        self.nobs += observed
+
+        if self.weighted == self.weighted:
+            self.weight *= 1.0 - self.alpha
+            if self.com == 1:
+                # Like pandas, which corrects for irregular intervals.
+                self.new_weight = 1.0 - self.weight
+
+            if observed:
+                if self.weighted != value:
+                    self.weighted = self.weight * self.weighted \
+                        + self.new_weight * value
+                    self.weighted /= self.weight + self.new_weight
+
+                self.weight = 1.0
+        elif observed:
+            self.weighted = value
+
+    def value(self):
+        return self.weighted if self.nobs >= 1 else math.nan
+
+
+class FeatureStream():
+    """
+    Features of one keyword, updated one observation at a time.
+
+    Attributes:
+        lengths (list): Lengths of the `SMA_delta`, `delta`, `pct_change`,
+            `SMA`, and `EMA` features.
+        bands (list): (length, amount of standard deviations) of the upper and
+            lower Bollinger bands.
+        count (int): Amount of observations so far.
+
+    """
+
+    def __init__(self, lengths=(3, 7, 14, 30, 90),
+                 bands=((20, 2), (20, 1), (10, 1), (10, 2))):
+        """
+        Args:
+            lengths (iterable, optional): Lengths of the features. Defaults to
+                3, 7, 14, 30, and 90, like in the notebook.
+            bands (iterable, optional): (length, amount of standard
+                deviations) of the Bollinger bands. Defaults to those in the
+                notebook.
+
+        Raises:
+            ValueError: If a length is less than 1.
+
+        """
+
+        self.lengths = [int(length) for length in lengths]
+        self.bands = [(int(length), deviations) for length, deviations in bands]
+
+        windows = self.lengths + [length for length, _ in self.bands]
+        if min(windows, default=1) < 1:
+            raise ValueError('`lengths` may not be less than 1.')
+
+        self.count = 0
+
+        # Last observations, of which the oldest leave the rolling windows.
+        self._size = max(windows, default=0) + 1
+        self._buffer = [math.nan] * self._size
+
+        self._means = {length: RollingMean(length) for length in set(windows)}
+        self._variances = {length: RollingVariance(length)
+                           for length, _ in self.bands}
+        self._emas = {length: ExponentialMean(length)
+                      for length in self.lengths}
+        self._previous_sma = {length: math.nan for length in self.lengths}
+
+    def lagged(self, periods):
+        """Observation ``periods`` updates ago."""
+
+        if periods >= self.count:
+            return math.nan
+
+        return self._buffer[(self.count - 1 - periods) % self._size]
+
+    def roll(self, window, value):
+        """Moves a rolling window forward like pandas does."""
+
+        i = self.count - 1
+        start = max(0, i + 1 - window.length)
+
+        if i == 0 or start >= i:
+            window.reset()
+            for j in range(start, i + 1):
+                window.add(self.lagged(i - j))
+        else:
+            if start > 0:
+                window.remove(self.lagged(window.length))
+
+                if window.cancelled:
+                    window.reset()
+                    for periods in range(window.length - 1, 0, -1):
+                        window.add(self.lagged(periods))
+
+            window.add(value)
+
+    def update(self, value):
+        """
+        Adds one observation.
+
+        Args:
+            value (float): Newest Google Trends data point.
+
+        Returns:
+            dict: Features of the newest observation, named like the columns
+                in the notebook.
+
+        """
+
+        value = float(value)
+
+        self._buffer[self.count % self._size] = value
+        self.count += 1
+
+        for window in self._means.values():
+            self.roll(window, value)
+        for window in self._variances.values():
+            self.roll(window, value)
+        for ema in self._emas.values():
+            ema.add(value)
+
+        features = {}
+        for length in self.lengths:
+            sma = self._means[length].value()
+            previous = self.lagged(length)
+
+            if previous != previous or value != value:
+                change = math.nan
+            elif previous == 0:
+                change = math.nan if value == 0 else \
+                    math.copysign(math.inf, value) - 1
+            else:
+                change = value / previous - 1
+
+            features[f'SMA_delta-{length}'] = value - self._previous_sma[length]
+            features[f'delta-{length}'] = value - previous
+            features[f'pct_change-{length}'] = change
+            features[f'SMA-{length}'] = sma
+            features[f'EMA-{length}'] = self._emas[length].value()
+
+            self._previous_sma[length] = sma
+
+        for length, deviations in self.bands:
+            mean = self._means[length].value()
+            std = math.sqrt(self._variances[length].value())
+
+            features[f'BBAND_U-{length}-{deviations}'] = mean + deviations * std
+            features[f'BBAND_L-{length}-{deviations}'] = mean - deviations * std
+
+        return features
+
+    def state(self):
+        """State of the stream, which can be serialized as JSON."""
+
+        return {
+            'lengths': self.lengths,
+            'bands': self.bands,
+            'count': self.count,
+            'buffer': self._buffer,
+            'means': {length: vars(window)
+                      for length, window in self._means.items()},
+            'variances': {length: vars(window)
+                          for length, window in self._variances.items()},
+            'emas': {length: vars(ema) for length, ema in self._emas.items()},
+            'previous_sma': self._previous_sma,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Restores a stream from its state."""
+
+        stream = cls(state['lengths'], [tuple(band) for band in state['bands']])
+        stream.count = state['count']
+        stream._buffer = list(state['buffer'])
+
+        for name in ['means', 'variances', 'emas']:
+            windows = getattr(stream, f'_{name}')
+            for length, attributes in state[name].items():
+                vars(windows[int(length)]).update(attributes)
+
+        stream._previous_sma = {int(length): value for length, value
+                                in state['previous_sma'].items()}
+
+        return stream
+
+
+def save(streams, path):
+    """
+    Snapshots the streams of all keywords to a JSON-file.
+
+    Args:
+        streams (dict): Dictionary of keywords to their ``FeatureStream``.
+        path (str): Path of the JSON-file.
+
+    """
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump({keyword: stream.state()
+                   for keyword, stream in streams.items()}, f)
+
+    os.replace(temporary, path)
+
+
+def load(path):
+    """
+    Restores the streams of all keywords from a JSON-file.
+
+    Args:
+        path (str): Path of the JSON-file.
+
+    Returns:
+        dict: Dictionary of keywords to their ``FeatureStream``.
+
+    """
+
+    with open(path, 'r') as f:
+        states = json.load(f)
+
+    return {keyword: FeatureStream.from_state(state)
+            for keyword, state in states.items()}
@@ -0,0 +1,187 @@
+"""
+Backtests many trading signals at once. Every column of the signal matrix is
+one strategy (a model, a parameter set, a keyword, ...), which is scored
+against the same returns with cumulative products instead of a loop per
+strategy.
+
+Signals are 1 to go long and 0 to either go "inverse" (divide the position
+by the price change, like ``stock_score`` in the notebooks) or stay flat.
+"""
+
+import numpy as np
+import pandas as pd
+
+MODES = ('inverse', 'flat')
+
+
+def prepare(signals, returns):
+    """
+    Converts signals and returns to arrays.
+
+    Args:
+        signals (array-like): Signals of periods by strategies, or of periods
+            for one strategy.
+        returns (array-like): Relative price change of every period, like
+            ``Close.pct_change()``. A NaN return, like the first one of
+            ``pct_change``, counts as no change.
+
+    Returns:
+        tuple: Boolean array of periods by strategies which is True where a
+            strategy is long, array of the returns, and the names of the
+            strategies.
+
+    Raises:
+        ValueError: If the signals and returns have a different amount of
+            periods.
+
+    """
+
+    names = signals.columns if isinstance(signals, pd.DataFrame) else None
+
+    long = np.asarray(signals) > 0
+    if long.ndim == 1:
+        long = long[:, None]
+
+    returns = np.nan_to_num(np.asarray(returns, dtype='float64'))
+
+    if long.ndim != 2 or returns.ndim != 1 or len(long) != len(returns):
+        raise ValueError('`signals` must have one row per period of '
+                         '`returns`.')
+
+    if names is None:
+        names = pd.RangeIndex(long.shape[1])
+
+    return long, returns, names
+
+
+def equity(signals, returns, mode='inverse', start=100):
+    """
+    Equity curves of the strategies.
+
+    Args:
+        signals (array-like): Signals of periods by strategies; 1 is long.
+        returns (array-like): Relative price change of every period.
+        mode (str, optional): What a strategy does when it isn't long:
+            'inverse' divides the position by the price change, 'flat' keeps
+            it. Defaults to 'inverse'.
+        start (float, optional): Starting position. Defaults to 100.
+
+    Returns:
+        numpy.ndarray: Position after every period, of periods by strategies.
+
+    Raises:
+        ValueError: If the mode is unknown, or the signals and returns have a
+            different amount of periods.
+
+    """
+
+    if mode not in MODES:
+        raise ValueError(f'Unknown mode `{mode}`.')
+
+    long, returns, _ = prepare(signals, returns)
+    change = 1 + returns[:, None]
+
+    growth = np.where(long, change, 1 / change if mode == 'inverse' else 1.0)
+    growth[0] *= start
+
+    return np.cumprod(growth, axis=0, out=growth)
+
+
+def annualized_return(curves, periods_per_year=365, start=100):
+    """
+    Annualized return of equity curves, in percent.
+
+    Args:
+        curves (numpy.ndarray): Equity curves of periods by strategies.
+        periods_per_year (int, optional): Periods in a year. Defaults to 365,
+            like ``stock_score``; use 52 for weekly data.
+        start (float, optional): Starting position. Defaults to 100.
+
+    Returns:
+        numpy.ndarray: Annualized return of every strategy.
+
+    """
+
+    years = len(curves) / periods_per_year
+    return ((curves[-1] / start) ** (1 / years) - 1) * 100
+
+
+def hit_rate(signals, returns):
+    """
+    Percentage of periods in which the signal had the direction right: long
+    before a rise, or not long before a fall.
+
+    Args:
+        signals (array-like): Signals of periods by strategies; 1 is long.
+        returns (array-like): Relative price change of every period.
+
+    Returns:
+        numpy.ndarray: Hit rate of every strategy.
+
+    """
+
+    long, returns, _ = prepare(signals, returns)
+
+    hits = np.where(long, returns[:, None] > 0, returns[:, None] < 0)
+    return hits.mean(axis=0) * 100
+
+
+def max_drawdown(curves, start=100):
+    """
+    Largest fall from a previous peak of equity curves, in percent.
+
+    Args:
+        curves (numpy.ndarray): Equity curves of periods by strategies.
+        start (float, optional): Starting position, which is the first peak.
+            Defaults to 100.
+
+    Returns:
+        numpy.ndarray: Maximum drawdown of every strategy.
+
+    """
+
+    peaks = np.maximum.accumulate(curves, axis=0)
+    np.maximum(peaks, start, out=peaks)
+
+    return (1 - curves / peaks).max(axis=0) * 100
+
+
+def backtest(signals, returns, mode='inverse', periods_per_year=365,
+             start=100):
+    """
+    Backtests all strategies at once.
+
+    Args:
+        signals (array-like): Signals of periods by strategies; 1 is long.
+            The columns of a DataFrame name the strategies.
+        returns (array-like): Relative price change of every period, like
+            ``Close.pct_change()``, of which a NaN counts as no change.
+        mode (str, optional): Either 'inverse' or 'flat'. Defaults to
+            'inverse'.
+        periods_per_year (int, optional): Periods in a year. Defaults to 365.
+        start (float, optional): Starting position. Defaults to 100.
+
+    Returns:
+        tuple: Equity curves of periods by strategies, and a DataFrame with
+            the final position, annualized return, hit rate and maximum
+            drawdown of every strategy.
+
+    Raises:
+        ValueError: If the mode is unknown, or the signals and returns have a
+            different amount of periods.
+
+    """
+
+    _, _, names = prepare(signals, returns)
+
+    curves = equity(signals, returns, mode, start)
+
+    stats = pd.DataFrame({
+        'final': curves[-1],
+        'annualized_return': annualized_return(curves, periods_per_year,
+                                               start),
+        'hit_rate': hit_rate(signals, returns),
+        'max_drawdown': max_drawdown(curves, start),
+    }, index=names)
+
+    return curves, stats
@@ -0,0 +1,299 @@
+"""
+Baseline of random strategies to compare models against, like the random
+simulations in the README. The random signals are drawn and backtested in
+chunks, of which only summary statistics are kept, so the memory used doesn't
+grow with the amount of simulations.
+
+The quantiles are read from a histogram of the log equity of every period,
+which spans the expected log equity plus and minus ``WIDTH`` standard
+deviations of a random strategy in ``BINS`` bins.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.models.backtest import MODES
+
+BINS = 1024
+WIDTH = 8
+
+
+def edges(returns, mode='inverse', probability=0.5):
+    """
+    Lower bound and bin width of the histogram of every period.
+
+    Args:
+        returns (numpy.ndarray): Relative price change of every period.
+        mode (str, optional): Either 'inverse' or 'flat'. Defaults to
+            'inverse'.
+        probability (float, optional): Probability of a long signal. Defaults
+            to 0.5.
+
+    Returns:
+        tuple: Lower bound and bin width of the log equity of every period.
+
+    """
+
+    steps = np.log1p(returns)
+    other = -1.0 if mode == 'inverse' else 0.0
+
+    # A random strategy is a random walk with steps of either the log return,
+    # or its opposite (inverse) or zero (flat).
+    mean = np.cumsum(steps * (probability + other * (1 - probability)))
+    std = np.sqrt(np.cumsum(steps ** 2 * (1 - other) ** 2
+                            * probability * (1 - probability)))
+
+    std = np.maximum(std, 1e-12)
+    return mean - WIDTH * std, 2 * WIDTH * std / BINS
+
+
+def run(returns, seeds, sizes, mode, probability, start):
+    """
+    Backtests chunks of random strategies.
+
+    Args:
+        returns (numpy.ndarray): Relative price change of every period.
+        seeds (list): ``numpy.random.SeedSequence`` of every chunk.
+        sizes (list): Amount of strategies of every chunk.
+        mode (str): Either 'inverse' or 'flat'.
+        probability (float): Probability of a long signal.
+        start (float): Starting position.
+
+    Returns:
+        tuple: Amount of strategies, mean and sum of squared differences of
+            the equity of every period, and the histogram of periods by bins.
+
+    """
+
+    periods = len(returns)
+    lower, width = edges(returns, mode, probability)
+    offsets = np.arange(periods)[:, None] * BINS
+
+    # The log equity grows by the log return when long, and by ``other``
+    # times it otherwise.
+    steps = np.log1p(returns)
+    other = -1.0 if mode == 'inverse' else 0.0
+    long_steps = (steps * (1 - other))[:, None]
+    other_steps = (steps * other)[:, None]
+    threshold = round(probability * 2 ** 16)
+
+    count = 0
+    mean = np.zeros(periods)
+    ssqdm = np.zeros(periods)
+    histogram = np.zeros(periods * BINS, dtype='int64')
+
+    for seed, size in zip(seeds, sizes):
+        generator = np.random.default_rng(seed)
+        signals = generator.integers(0, 2 ** 16, (periods, size),
+                                     dtype='uint16') < threshold
+
+        logs = np.multiply(signals, long_steps)
+        logs += other_steps
+
+        # Row by row, which is much faster than a cumulative sum along the
+        # first axis.
+        for i in range(1, periods):
+            np.add(logs[i], logs[i - 1], out=logs[i])
+
+        curves = np.exp(logs)
+        curves *= start
+
+        # Merges the statistics of the chunk with those so far.
+        chunk_mean = curves.mean(axis=1)
+        chunk_ssqdm = np.einsum('ij,ij->i', curves, curves) \
+            - size * chunk_mean ** 2
+        del curves
+
+        delta = chunk_mean - mean
+        total = count + size
+        mean += delta * size / total
+        ssqdm += chunk_ssqdm + delta ** 2 * count * size / total
+        count = total
+
+        logs -= lower[:, None]
+        logs /= width[:, None]
+        np.clip(logs, 0, BINS - 1, out=logs)
+
+        bins = logs.astype('int64')
+        bins += offsets
+        histogram += np.bincount(bins.ravel(), minlength=periods * BINS)
+
+    return count, mean, ssqdm, histogram.reshape(periods, BINS)
+
+
+class Baseline():
+    """
+    Summary statistics of random strategies.
+
+    Attributes:
+        simulations (int): Amount of random strategies.
+        mean (pandas.Series): Mean equity of every period.
+        std (pandas.Series): Standard deviation of the equity of every period.
+        quantiles (pandas.DataFrame): Quantiles of the equity of every period,
+            of periods by quantiles.
+        periods_per_year (int): Periods in a year.
+        start (float): Starting position.
+
+    """
+
+    def __init__(self, count, mean, ssqdm, histogram, lower, width, index,
+                 quantiles, periods_per_year=365, start=100):
+        self.simulations = count
+        self.periods_per_year = periods_per_year
+        self.start = start
+
+        self._histogram = histogram
+        self._lower = lower
+        self._width = width
+
+        self.mean = pd.Series(mean, index=index, name='mean')
+        self.std = pd.Series(np.sqrt(ssqdm / max(count - 1, 1)),
+                             index=index, name='std')
+
+        cumulative = np.cumsum(histogram, axis=1) / count
+        values = np.empty((len(index), len(quantiles)))
+        for j, quantile in enumerate(quantiles):
+            # Interpolates within the bin in which the quantile falls.
+            position = (cumulative < quantile).sum(axis=1)
+            position = np.minimum(position, BINS - 1)
+
+            rows = np.arange(len(index))
+            below = np.where(position > 0,
+                             cumulative[rows, np.maximum(position - 1, 0)], 0)
+            share = histogram[rows, position] / count
+            fraction = np.where(share > 0, (quantile - below) / share, 0.5)
+
+            values[:, j] = lower + (position + fraction) * width
+
+        self.quantiles = pd.DataFrame(start * np.exp(values), index=index,
+                                      columns=list(quantiles))
+
+    def summary(self):
+        """
+        Statistics of the final equity.
+
+        Returns:
+            pandas.DataFrame: Mean, standard deviation and quantiles of the
+                final position and of the annualized return.
+
+        """
+
+        final = pd.concat([
+            pd.Series({'mean': self.mean.iloc[-1], 'std': self.std.iloc[-1]}),
+            self.quantiles.iloc[-1],
+        ])
+
+        years = len(self.mean) / self.periods_per_year
+        annual = ((final / self.start) ** (1 / years) - 1) * 100
+        annual['std'] = np.nan
+
+        return pd.DataFrame({'final': final, 'annualized_return': annual})
+
+    def rank(self, final):
+        """
+        Percentage of random strategies that ended below a position, e.g. of
+        a model backtested on the same returns.
+
+        Args:
+            final (float or array-like): Final position.
+
+        Returns:
+            float or numpy.ndarray: Percentage of random strategies with a
+                lower final position.
+
+        """
+
+        position = (np.log(np.asarray(final, dtype='float64') / self.start)
+                    - self._lower[-1]) / self._width[-1]
+        position = np.clip(position, 0, BINS)
+
+        cumulative = np.concatenate([[0], np.cumsum(self._histogram[-1])])
+        below = np.interp(position, np.arange(BINS + 1), cumulative)
+
+        return below / self.simulations * 100
+
+
+def simulate(returns, simulations=10000, seed=0, mode='inverse',
+             probability=0.5, chunk_size=4096, workers=None,
+             quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), periods_per_year=365,
+             start=100):
+    """
+    Backtests random strategies against the returns.
+
+    Every chunk has its own seed derived from ``seed``, so the result doesn't
+    depend on the amount of workers.
+
+    Args:
+        returns (array-like): Relative price change of every period, like
+            ``Close.pct_change()``. The index of a Series indexes the result.
+        simulations (int, optional): Amount of random strategies. Defaults to
+            10000.
+        seed (int, optional): Seed of the random signals. Defaults to 0.
+        mode (str, optional): Either 'inverse' or 'flat'. Defaults to
+            'inverse'.
+        probability (float, optional): Probability of a long signal. Defaults
+            to 0.5.
+        chunk_size (int, optional): Amount of strategies backtested at once;
+            a chunk takes about ``32 * periods * chunk_size`` bytes. Defaults
+            to 4096.
+        workers (int, optional): Amount of processes. One process backtests
+            about 40,000 strategies of 860 periods per second. Defaults to
+            running all chunks in this process.
+        quantiles (iterable, optional): Quantiles of the equity to keep.
+            Defaults to 5%, 25%, 50%, 75% and 95%.
+        periods_per_year (int, optional): Periods in a year. Defaults to 365;
+            use 52 for weekly data.
+        start (float, optional): Starting position. Defaults to 100.
+
+    Returns:
+        Baseline: Summary statistics of the random strategies.
+
+    Raises:
+        ValueError: If the mode is unknown, the probability is not between 0
+            and 1, or ``simulations`` or ``chunk_size`` is less than 1.
+
+    """
+
+    if mode not in MODES:
+        raise ValueError(f'Unknown mode `{mode}`.')
+
+    if not 0 < probability < 1:
+        raise ValueError('`probability` must be between 0 and 1.')
+
+    if simulations < 1 or chunk_size < 1:
+        raise ValueError('`simulations` and `chunk_size` may not be less '
+                         'than 1.')
+
+    index = returns.index if isinstance(returns, pd.Series) else None
+    returns = np.nan_to_num(np.asarray(returns, dtype='float64'))
+    if index is None:
+        index = pd.RangeIndex(len(returns))
+
+    sizes = [min(chunk_size, simulations - i)
+             for i in range(0, simulations, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if workers is None or workers <= 1 or len(sizes) == 1:
+        results = [run(returns, seeds, sizes, mode, probability, start)]
+    else:
+        workers = min(workers, len(sizes))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(run, returns, seeds[i::workers],
+                                sizes[i::workers], mode, probability, start)
+                    for i in range(workers)]
+            results = [job.result() for job in jobs]
+
+    count, mean, ssqdm, histogram = results[0]
+    for other_count, other_mean, other_ssqdm, other_histogram in results[1:]:
+        delta = other_mean - mean
+        total = count + other_count
+        mean = mean + delta * other_count / total
+        ssqdm = ssqdm + other_ssqdm + delta ** 2 * count * other_count / total
+        histogram = histogram + other_histogram
+        count = total
+
+    lower, width = edges(returns, mode, probability)
+    return Baseline(count, mean, ssqdm, histogram, lower, width, index,
+                    quantiles, periods_per_year, start)
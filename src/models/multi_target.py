@@ -0,0 +1,349 @@
+"""
+Trains and scores a model per ticker on the same Google Trends features. The
+features are stored once in a memory-mapped file, which the tickers read from
+in parallel processes without copying it; every ticker only aligns its own
+target and returns with the dates of the features, so adding a ticker costs
+one model fit instead of building the features again.
+
+Usage:
+    python -m src.models.multi_target DJIA GSPC IXIC --workers 4
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.features.build_dataset import align
+from src.features.build_features import LagMatrix, target_binary, target_bins
+from src.features.select_features import screen
+from src.models.backtest import backtest
+from src.models.serve import save
+from src.models.walk_forward import scores
+
+KINDS = ('binary', 'bins')
+
+
+def store(features, directory='data/interim/multi_target'):
+    """
+    Writes the rows of the features that have no NaN, like ``dropna``, to a
+    memory-mappable file, with their dates and names.
+
+    Args:
+        features (pandas.DataFrame or LagMatrix): Features of all rows.
+        directory (str, optional): Directory of the stored features.
+            Defaults to data/interim/multi_target.
+
+    Returns:
+        tuple: Index and column names of the stored features.
+
+    Raises:
+        TypeError: If `features` is not of pandas.DataFrame or LagMatrix type.
+
+    """
+
+    if not isinstance(features, (pd.DataFrame, LagMatrix)):
+        raise TypeError('`features` must be of type pandas.DataFrame or '
+                        'LagMatrix.')
+
+    if isinstance(features, LagMatrix):
+        rows = features.valid()
+    else:
+        rows = features.notna().all(axis=1).to_numpy()
+
+    index = features.index[rows]
+    columns = list(features.columns)
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'features.npy')
+
+    values = np.lib.format.open_memmap(
+        f'{path}.tmp', mode='w+', dtype='float64',
+        shape=(len(index), len(columns)))
+
+    if isinstance(features, LagMatrix):
+        width = len(columns) // len(features.lags)
+        for j, lag in enumerate(features.lags):
+            values[:, j * width:(j + 1) * width] = features.view(lag)[rows]
+    else:
+        values[:] = features.to_numpy(dtype='float64')[rows]
+
+    values.flush()
+    del values
+
+    dates = os.path.join(directory, 'index.npy')
+    with open(f'{dates}.tmp', 'wb') as f:
+        np.save(f, np.asarray(index, dtype='datetime64[ns]'))
+
+    names = os.path.join(directory, 'columns.json')
+    with open(f'{names}.tmp', 'w') as f:
+        json.dump(columns, f)
+
+    # The matrix is replaced last, so that an interrupted rebuild doesn't
+    # leave a new matrix next to old dates or names.
+    os.replace(f'{dates}.tmp', dates)
+    os.replace(f'{names}.tmp', names)
+    os.replace(f'{path}.tmp', path)
+
+    return index, columns
+
+
+def load(directory='data/interim/multi_target'):
+    """
+    Reads the dates and names of stored features.
+
+    Returns:
+        tuple: Index and column names of the stored features.
+
+    Raises:
+        ValueError: If the dates and names don't match the stored matrix.
+
+    """
+
+    index = pd.DatetimeIndex(np.load(os.path.join(directory, 'index.npy')))
+    with open(os.path.join(directory, 'columns.json'), 'r') as f:
+        columns = json.load(f)
+
+    shape = np.load(os.path.join(directory, 'features.npy'),
+                    mmap_mode='r').shape
+    if shape != (len(index), len(columns)):
+        raise ValueError(f'The stored features of {shape} don\'t match '
+                         f'{len(index)} dates and {len(columns)} names; '
+                         f'store them again.')
+
+    return index, columns
+
+
+def targets(close, index, kind='binary', bins=6, periodicity='daily'):
+    """
+    Target and returns of a ticker on the dates of the features.
+
+    Args:
+        close (pandas.Series): Closing prices of the ticker.
+        index (pandas.DatetimeIndex): Dates of the features.
+        kind (str, optional): Either 'binary', see ``target_binary``, or
+            'bins', see ``target_bins``. Defaults to 'binary'.
+        bins (int, optional): Amount of bins. Defaults to 6.
+        periodicity (str, optional): Either 'daily' or 'weekly', see
+            ``build_dataset.align``. Defaults to 'daily'.
+
+    Returns:
+        tuple: Arrays of the target and of the returns of every date, which
+            are NaN on the dates without a price.
+
+    Raises:
+        ValueError: If the kind is unknown.
+
+    """
+
+    if kind not in KINDS:
+        raise ValueError(f'Unknown kind `{kind}`.')
+
+    target = target_binary(close) if kind == 'binary' else \
+        target_bins(close, bins)
+
+    return (align(target, index, periodicity).to_numpy(dtype='float64'),
+            align(close.pct_change(), index,
+                  periodicity).to_numpy(dtype='float64'))
+
+
+def fit(directory, target, returns, model, kind, test_size, top, mode,
+        periods_per_year):
+    """
+    Selects features, trains and tests the model of one ticker on the first
+    and last rows that have a target, like ``train_test_split`` without
+    shuffling.
+
+    Returns:
+        tuple: Positions of the test rows, and the selected features, metrics,
+            predictions and fitted model of the ticker.
+
+    """
+
+    values = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+
+    rows = np.flatnonzero(~np.isnan(target))
+    split = len(rows) - int(np.ceil(len(rows) * test_size))
+    train, test = rows[:split], rows[split:]
+
+    y_train = pd.Series(target[train])
+    selection = screen(pd.DataFrame(values[train], copy=False), y_train,
+                       top=top, workers=1)
+    selected = list(selection.index)
+
+    estimator = model()
+    estimator.fit(values[train][:, selected], y_train.to_numpy(dtype='int64'))
+    predictions = np.asarray(estimator.predict(values[test][:, selected]))
+
+    if kind == 'binary':
+        signals = predictions
+        metrics = scores(target[test], predictions)
+    else:
+        # Long on the bins of which the training rows went up on average.
+        mean = pd.Series(returns[train]).groupby(target[train]).mean()
+        signals = pd.Series(predictions).map(mean).fillna(0).to_numpy() > 0
+        metrics = {'accuracy': (predictions == target[test]).mean()}
+
+    _, stats = backtest(signals, np.nan_to_num(returns[test]), mode,
+                        periods_per_year)
+    metrics.update(stats.iloc[0])
+
+    return test, selected, metrics, predictions, estimator
+
+
+def train(prices, model, directory='data/interim/multi_target',
+          kind='binary', bins=6, periodicity='daily', test_size=0.2, top=50,
+          mode='inverse', periods_per_year=365, workers=None, models=None,
+          metadata=None):
+    """
+    Trains and scores a model per ticker on the stored features.
+
+    Args:
+        prices (dict): Dictionary of the tickers to their closing prices.
+        model (callable): Returns a new unfitted model with ``fit`` and
+            ``predict`` methods, like ``XGBClassifier`` or a
+            ``functools.partial`` of it. It must be picklable when
+            ``workers`` is set.
+        directory (str, optional): Directory of the features, see ``store``.
+            Defaults to data/interim/multi_target.
+        kind (str, optional): Either 'binary' or 'bins', see ``targets``.
+            Defaults to 'binary'.
+        bins (int, optional): Amount of bins. Defaults to 6.
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'daily'.
+        test_size (float, optional): Share of the rows of every ticker that
+            are tested on. Defaults to 0.2.
+        top (int, optional): Amount of features selected per ticker, on its
+            training rows. Defaults to 50.
+        mode (str, optional): Backtest mode, either 'inverse' or 'flat'.
+            Defaults to 'inverse'.
+        periods_per_year (int, optional): Periods in a year. Defaults to 365.
+        workers (int, optional): Amount of processes. Defaults to training
+            all tickers in this process.
+        models (str, optional): Directory to which the model of every ticker
+            is saved, as `{ticker}.sav` with its selected features, so that
+            it can be served (see ``serve.py``). Defaults to not saving them.
+        metadata (dict, optional): How the features were computed, like
+            ``{'variant': 'rolling', 'length': 3}``, which is saved with the
+            models. Defaults to the defaults of ``serve.save``.
+
+    Returns:
+        tuple: DataFrame with the dates, metrics, backtest statistics and
+            selected features of every ticker, and a DataFrame with the
+            predictions of dates by tickers.
+
+    Raises:
+        ValueError: If there are no tickers, or the kind is unknown.
+
+    """
+
+    if not prices:
+        raise ValueError('There are no tickers to train.')
+
+    index, columns = load(directory)
+
+    arguments = []
+    for ticker, close in prices.items():
+        target, returns = targets(close, index, kind, bins, periodicity)
+        arguments.append((directory, target, returns, model, kind, test_size,
+                          top, mode, periods_per_year))
+
+    if workers is None or workers <= 1:
+        results = [fit(*argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(fit, *argument) for argument in arguments]
+            results = [job.result() for job in jobs]
+
+    rows = []
+    predictions = {}
+    for ticker, (test, selected, metrics, predicted, estimator) in \
+            zip(prices, results):
+        if models is not None:
+            save(estimator, [columns[i] for i in selected],
+                 os.path.join(models, f'{ticker}.sav'), periodicity,
+                 **(metadata or {}))
+
+        rows.append({
+            'ticker': ticker,
+            'test_start': index[test][0],
+            'test_end': index[test][-1],
+            **metrics,
+            'features': [columns[i] for i in selected],
+        })
+        predictions[ticker] = pd.Series(predicted, index=index[test])
+
+    return (pd.DataFrame(rows).set_index('ticker'),
+            pd.DataFrame(predictions))
+
+
+if __name__ == '__main__':
+    # Only needed here, so that training works with any model and prices.
+    from xgboost import XGBClassifier
+
+    from src.data.prices import PriceStore
+    from src.features.build_dataset import INTERVALS, VARIANTS, load as read
+    from src.features.build_dataset import statistics
+
+    parser = argparse.ArgumentParser(
+        description='Trains and scores a model per ticker on the same '
+                    'features.')
+    parser.add_argument('tickers', nargs='+',
+                        help='tickers of which the prices are stored')
+    parser.add_argument('--source', default='data/interim',
+                        help='directory of the keyword CSV-files')
+    parser.add_argument('--keywords', default='src/data/keywords.txt')
+    parser.add_argument('--variant', default='rolling', choices=VARIANTS,
+                        help='statistic of the keywords that is lagged by 3 '
+                             'through 10 periods into the features')
+    parser.add_argument('--directory', default='data/interim/multi_target')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='build and store the features again')
+    parser.add_argument('--periodicity', default='daily',
+                        choices=['daily', 'weekly'])
+    parser.add_argument('--kind', default='binary', choices=list(KINDS))
+    parser.add_argument('--bins', type=int, default=6)
+    parser.add_argument('--top', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--models', default='models',
+                        help='directory to which the model of every ticker '
+                             'is saved')
+    parser.add_argument('--output', default='reports/multi_target.csv',
+                        help='CSV-file of the scores, of which the rows of '
+                             'other tickers are kept')
+    args = parser.parse_args()
+
+    # The features are only built once, so that adding a ticker only trains
+    # its model.
+    if args.rebuild or not os.path.exists(
+            os.path.join(args.directory, 'features.npy')):
+        with open(args.keywords, 'r') as f:
+            keywords = [line.strip().replace(' ', '_') for line in f
+                        if line.strip()]
+
+        panel = read(args.periodicity, args.source, keywords)
+        store(LagMatrix(statistics(panel, [args.variant])[args.variant]),
+              args.directory)
+
+    prices = PriceStore()
+    results, _ = train(
+        {ticker: prices.load(ticker, INTERVALS[args.periodicity]).Close
+         for ticker in args.tickers},
+        XGBClassifier, args.directory, args.kind, args.bins,
+        args.periodicity, top=args.top, workers=args.workers,
+        periods_per_year=365 if args.periodicity == 'daily' else 52,
+        models=args.models, metadata={'variant': args.variant})
+
+    if os.path.exists(args.output):
+        previous = pd.read_csv(args.output, index_col='ticker')
+        results = pd.concat([previous.drop(results.index, errors='ignore'),
+                             results])
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    results.to_csv(f'{args.output}.tmp')
+    os.replace(f'{args.output}.tmp', args.output)
+
+    print(results.drop('features', axis=1).to_string())
@@ -0,0 +1,383 @@
+"""
+Searches hyperparameters by successive halving: all candidates are first
+trained with a small budget of boosting rounds or epochs, and only the best
+third of them continues to three times the budget, until one remains. Most
+candidates are then only trained briefly, instead of all of them to
+completion like ``RandomizedSearchCV``, and only the winner is trained with
+the full budget. The survivors continue training from where they stopped,
+instead of starting over every rung.
+
+Every score is checkpointed, so an interrupted search resumes where it
+stopped.
+
+Usage:
+    search = SuccessiveHalving(XGBClassifier, XGB_PARAMETERS,
+                               resource='n_estimators', max_resource=1000,
+                               checkpoint='models/search/xgb.json')
+    search.fit(X_train, y_train)
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from src.features.cache import fingerprint
+from src.models.walk_forward import scores
+
+# Parameter spaces of the notebook, without the budget parameters.
+XGB_PARAMETERS = {
+    'learning_rate': [0.1, 0.01, 0.001],
+    'gamma': [0.01, 0.1, 0.3, 0.5, 1, 1.5, 2],
+    'max_depth': [2, 4, 7, 10],
+    'colsample_bytree': [0.3, 0.6, 0.8, 1.0],
+    'subsample': [0.2, 0.4, 0.5, 0.6, 0.7],
+    'reg_alpha': [0, 0.5, 1],
+    'reg_lambda': [1, 1.5, 2, 3, 4.5],
+    'min_child_weight': [1, 3, 5, 7],
+}
+
+MLP_PARAMETERS = {
+    'solver': ['sgd'],
+    'alpha': list(10.0 ** -np.arange(1, 10)),
+    'hidden_layer_sizes': list(range(10, 15)),
+    'random_state': [0],
+    'learning_rate_init': [0.15],
+    'learning_rate': ['constant'],
+    'shuffle': [False],
+    'momentum': list(np.random.RandomState(0).uniform(0.8, 1, 50)),
+}
+
+
+def plain(value):
+    """Converts NumPy scalars to Python ones, so that they are JSON."""
+
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def sample(space, n, seed=0):
+    """
+    Draws distinct candidates from a parameter space.
+
+    Args:
+        space (dict): Dictionary of parameters to lists of their values.
+        n (int): Amount of candidates.
+        seed (int, optional): Seed of the draws. Defaults to 0.
+
+    Returns:
+        list: Dictionaries of parameters; fewer than ``n`` if the space
+            doesn't have that many.
+
+    """
+
+    generator = np.random.RandomState(seed)
+    names = sorted(space)
+    size = math.prod(len(space[name]) for name in names)
+
+    candidates = []
+    seen = set()
+    while len(candidates) < min(n, size):
+        choice = tuple(generator.randint(len(space[name])) for name in names)
+        if choice in seen:
+            continue
+
+        seen.add(choice)
+        candidates.append({name: plain(space[name][i])
+                           for name, i in zip(names, choice)})
+
+    return candidates
+
+
+def resume(estimator, resource, rounds, X, y):
+    """
+    Trains a fitted estimator for more boosting rounds or epochs, from where
+    it stopped instead of from scratch. XGBoost models continue from their
+    booster, and scikit-learn models that can be warm-started, like
+    ``MLPClassifier``, from their weights.
+
+    Args:
+        estimator: Fitted model.
+        resource (str): Parameter that sets the training budget, like
+            'n_estimators' or 'max_iter'.
+        rounds (int): Amount of rounds or epochs to add.
+        X (numpy.ndarray): Features it was trained on.
+        y (numpy.ndarray): Target it was trained on.
+
+    Returns:
+        bool: Whether the estimator could continue; it is unchanged if not.
+
+    """
+
+    if rounds < 1:
+        return False
+
+    if hasattr(estimator, 'get_booster'):
+        booster = estimator.get_booster()
+        estimator.set_params(**{resource: rounds})
+        estimator.fit(X, y, xgb_model=booster)
+    elif 'warm_start' in getattr(estimator, 'get_params', dict)():
+        estimator.set_params(**{resource: rounds, 'warm_start': True})
+        estimator.fit(X, y)
+    else:
+        return False
+
+    return True
+
+
+def splits(rows, cv=5):
+    """
+    Consecutive cross-validation folds, like an unshuffled ``KFold``.
+
+    Returns:
+        list: (train, test) arrays of row positions of every fold.
+
+    """
+
+    positions = np.arange(rows)
+    return [(np.concatenate([positions[:test[0]], positions[test[-1] + 1:]]),
+             test) for test in np.array_split(positions, cv)]
+
+
+class SuccessiveHalving():
+    """
+    Successive-halving search of the hyperparameters of a model.
+
+    Attributes:
+        budgets (list): Budget of every rung, from ``min_resource`` up to at
+            most ``max_resource``.
+        threads (int): Amount of threads of every model that is searched, so
+            that ``workers`` models together use all cores.
+        results (pandas.DataFrame): Score of every candidate in every rung it
+            reached.
+        best_params (dict): Parameters of the best candidate, including the
+            resource.
+        best_score (float): Cross-validated score of the best candidate in
+            the last rung.
+        best_estimator: Best candidate trained on all data with
+            ``max_resource``.
+
+    """
+
+    def __init__(self, model, space, resource='n_estimators',
+                 max_resource=1000, min_resource=10, n_iter=20, eta=3, cv=5,
+                 scoring='recall', seed=0, checkpoint=None, workers=None):
+        """
+        Args:
+            model (callable): Returns a new model with ``fit`` and ``predict``
+                methods from keyword parameters, like ``XGBClassifier``.
+            space (dict): Dictionary of parameters to lists of their values,
+                like ``XGB_PARAMETERS``.
+            resource (str, optional): Parameter that sets the training budget,
+                like 'n_estimators' or 'max_iter'. Defaults to
+                'n_estimators'.
+            max_resource (int, optional): Budget with which the best
+                candidate is trained, and that no rung exceeds. Defaults to
+                1000.
+            min_resource (int, optional): Budget of the first rung. Defaults
+                to 10.
+            n_iter (int, optional): Amount of candidates. Defaults to 20.
+            eta (int, optional): Factor by which the candidates are reduced
+                and the budget is increased every rung. Defaults to 3.
+            cv (int, optional): Amount of cross-validation folds. Defaults to
+                5.
+            scoring (str, optional): Either 'accuracy', 'precision', 'recall'
+                or 'f1'. Defaults to 'recall', like in the notebook.
+            seed (int, optional): Seed of the candidates. Defaults to 0.
+            checkpoint (str, optional): JSON-file in which the scores are
+                kept. Defaults to not checkpointing.
+            workers (int, optional): Amount of candidates trained at once.
+                Defaults to the amount of cores.
+
+        Raises:
+            ValueError: If the scoring is unknown, ``eta`` is less than 2, or
+                ``min_resource`` is not positive.
+
+        """
+
+        if scoring not in ('accuracy', 'precision', 'recall', 'f1'):
+            raise ValueError(f'Unknown scoring `{scoring}`.')
+
+        if eta < 2:
+            raise ValueError('`eta` may not be less than 2.')
+
+        if min_resource < 1:
+            raise ValueError('`min_resource` must be positive.')
+
+        self.model = model
+        self.space = space
+        self.resource = resource
+        self.max_resource = max_resource
+        self.eta = eta
+        self.cv = cv
+        self.scoring = scoring
+        self.checkpoint = checkpoint
+        self.workers = workers or os.cpu_count()
+        self.threads = max(1, (os.cpu_count() or 1) // self.workers)
+
+        self.candidates = sample(space, n_iter, seed)
+
+        # Enough rungs to end with a single candidate, which is then trained
+        # with ``max_resource`` instead of being cross-validated with it.
+        rungs = 1
+        while len(self.candidates) > self.eta ** rungs:
+            rungs += 1
+
+        self.budgets = [min(max_resource, min_resource * eta ** i)
+                        for i in range(rungs)]
+
+        self.results = None
+        self.best_params = None
+        self.best_score = math.nan
+        self.best_estimator = None
+
+        self._scores = {}
+        self._lock = threading.Lock()
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint, 'r') as f:
+                self._scores = json.load(f)
+
+    def key(self, candidate, budget, data):
+        """Hash of a candidate, its budget and the data it is scored on."""
+
+        call = json.dumps([candidate, self.resource, budget, self.cv,
+                           self.scoring, data], sort_keys=True)
+        return hashlib.sha256(call.encode()).hexdigest()
+
+    def save(self):
+        """Writes the scores to the checkpoint."""
+
+        if self.checkpoint is None:
+            return
+
+        os.makedirs(os.path.dirname(self.checkpoint) or '.', exist_ok=True)
+
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self._scores, f)
+
+        os.replace(temporary, self.checkpoint)
+
+    def build(self, candidate, budget):
+        """
+        New model of a candidate with a budget. Models that have ``n_jobs``,
+        like ``XGBClassifier``, get ``threads`` threads, because ``workers``
+        candidates are trained at once.
+        """
+
+        estimator = self.model(**candidate, **{self.resource: budget})
+
+        if ('n_jobs' not in candidate
+                and 'n_jobs' in getattr(estimator, 'get_params', dict)()):
+            estimator.set_params(n_jobs=self.threads)
+
+        return estimator
+
+    def evaluate(self, candidate, budget, X, y, fitted=None):
+        """
+        Cross-validated score of a candidate trained with a budget.
+
+        Args:
+            candidate (dict): Parameters of the candidate.
+            budget (int): Total amount of rounds or epochs.
+            X (numpy.ndarray): Features.
+            y (numpy.ndarray): Binary target.
+            fitted (tuple, optional): Budget and models of every fold of the
+                candidate in the previous rung, which continue training
+                instead of starting over. Defaults to training from scratch.
+
+        Returns:
+            tuple: Mean score over the folds, and the budget and models of
+                every fold, to continue from in the next rung.
+
+        """
+
+        trained, previous = fitted if fitted is not None else (0, None)
+
+        results = []
+        estimators = []
+        for fold, (train, test) in enumerate(splits(len(y), self.cv)):
+            estimator = previous[fold] if previous is not None else None
+
+            if estimator is None or not resume(estimator, self.resource,
+                                               budget - trained, X[train],
+                                               y[train]):
+                estimator = self.build(candidate, budget)
+                estimator.fit(X[train], y[train])
+
+            predictions = np.asarray(estimator.predict(X[test]))
+            results.append(scores(y[test], predictions)[self.scoring])
+            estimators.append(estimator)
+
+        return float(np.mean(results)), (budget, estimators)
+
+    def fit(self, X, y):
+        """
+        Searches the candidates and trains the best on all data.
+
+        Args:
+            X (pandas.DataFrame or numpy.ndarray): Features, e.g. the selected
+                features of the training rows.
+            y (pandas.Series or numpy.ndarray): Binary target.
+
+        Returns:
+            SuccessiveHalving: The fitted search.
+
+        """
+
+        data = [fingerprint(pd.DataFrame(np.asarray(X))),
+                fingerprint(pd.Series(np.asarray(y)))]
+        X = np.asarray(X)
+        y = np.asarray(y)
+
+        survivors = list(range(len(self.candidates)))
+        rows = []
+
+        # Models of the survivors, which continue in the next rung. A
+        # candidate whose score was checkpointed has none, and is trained
+        # from scratch if it survives.
+        fitted = {}
+
+        for rung, budget in enumerate(self.budgets):
+            keys = {i: self.key(self.candidates[i], budget, data)
+                    for i in survivors}
+
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                jobs = {pool.submit(self.evaluate, self.candidates[i], budget,
+                                    X, y, fitted.get(i)): i
+                        for i in survivors if keys[i] not in self._scores}
+
+                for job in as_completed(jobs):
+                    score, fitted[jobs[job]] = job.result()
+
+                    with self._lock:
+                        self._scores[keys[jobs[job]]] = score
+                        self.save()
+
+            for i in survivors:
+                rows.append({'candidate': i, 'rung': rung,
+                             self.resource: budget,
+                             'score': self._scores[keys[i]],
+                             **self.candidates[i]})
+
+            # Ties are broken by the order of the candidates.
+            ranked = sorted(survivors, key=lambda i: -self._scores[keys[i]])
+            survivors = ranked[:max(1, math.ceil(len(survivors) / self.eta))]
+            fitted = {i: fitted[i] for i in survivors if i in fitted}
+
+            if rung == len(self.budgets) - 1:
+                self.best_score = self._scores[keys[survivors[0]]]
+
+        self.results = pd.DataFrame(rows)
+        self.best_params = {**self.candidates[survivors[0]],
+                            self.resource: self.max_resource}
+
+        self.best_estimator = self.model(**self.best_params)
+        self.best_estimator.fit(X, y)
+
+        return self
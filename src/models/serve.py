@@ -0,0 +1,525 @@
+"""
+Serves the predictions of a saved model over a local HTTP API, from features
+that are kept in memory. The statistic of every keyword (like the rolling
+mean of the processed datasets) is kept for the latest rows, already shifted
+by the lags of the selected features, and is updated incrementally when new
+Google Trends rows arrive. A prediction is a lookup of the rows of the
+requested dates and one call of the model.
+
+The latest rows can be predicted one step ahead as well: with lags of at
+least 3, the features of the next 3 dates are already known.
+
+Usage:
+    python -m src.models.serve models/DJIA.sav --port 8765
+    curl 'http://127.0.0.1:8765/predict?date=2020-07-01'
+    curl 'http://127.0.0.1:8765/predict?start=2020-06-01&end=2020-06-30'
+    curl -d '{"Date": ["2020-07-01"], "debt": [0.42]}' \
+        'http://127.0.0.1:8765/update'
+    curl 'http://127.0.0.1:8765/metrics'
+"""
+
+import argparse
+import collections
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.data import telemetry
+from src.features.build_dataset import statistics
+
+STEPS = {'daily': pd.Timedelta(days=1), 'weekly': pd.Timedelta(days=7)}
+
+
+def save(model, features, path, periodicity='daily', variant='rolling',
+         length=3, name='{column}_shifted_by_{lag}'):
+    """
+    Saves a fitted model with the names of its features, in order, and how
+    they are computed from the Google Trends data.
+
+    Args:
+        model (object): Fitted model with a ``predict`` method.
+        features (list): Names of the features the model was fitted on, like
+            `debt_shifted_by_3`.
+        path (str): Path of the model. The features are saved next to it, in
+            ``{path}.json``.
+        periodicity (str, optional): Either 'daily' or 'weekly'. Defaults to
+            'daily'.
+        variant (str, optional): Statistic of the keywords that is lagged,
+            see ``build_dataset.statistics``. Defaults to 'rolling'.
+        length (int, optional): Length of the statistic. Defaults to 3.
+        name (str, optional): Format of the names of the features, with
+            ``column`` and ``lag`` fields, like in ``LagMatrix``. Defaults
+            to '{column}_shifted_by_{lag}'.
+
+    """
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    with open(f'{path}.tmp', 'wb') as f:
+        pickle.dump(model, f)
+    os.replace(f'{path}.tmp', path)
+
+    with open(f'{path}.json.tmp', 'w') as f:
+        json.dump({'features': list(features), 'periodicity': periodicity,
+                   'variant': variant, 'length': length, 'name': name}, f,
+                  indent=2)
+    os.replace(f'{path}.json.tmp', f'{path}.json')
+
+
+def parse(features, name='{column}_shifted_by_{lag}'):
+    """
+    Splits the names of lagged features into their columns and lags.
+
+    Returns:
+        tuple: Column and lag of every feature.
+
+    Raises:
+        ValueError: If a name doesn't match the format.
+
+    """
+
+    pattern = re.compile(re.escape(name)
+                         .replace(r'\{column\}', '(?P<column>.+)')
+                         .replace(r'\{lag\}', '(?P<lag>[0-9]+)') + '$')
+
+    columns, lags = [], []
+    for feature in features:
+        match = pattern.match(feature)
+        if match is None:
+            raise ValueError(f'Feature `{feature}` doesn\'t match `{name}`.')
+
+        columns.append(match.group('column'))
+        lags.append(int(match.group('lag')))
+
+    return columns, lags
+
+
+class Latency():
+    """
+    Latency of the latest requests, of which the quantiles are reported.
+
+    Attributes:
+        count (int): Amount of requests.
+        total (float): Seconds of all requests.
+
+    """
+
+    def __init__(self, name, size=10000):
+        """
+        Args:
+            name (str): Name of the histogram of the telemetry, like
+                'predict_request_seconds'.
+            size (int, optional): Amount of latest requests of which the
+                quantiles are computed. Defaults to 10000.
+        """
+
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+
+        self._latest = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self._latest.append(seconds)
+
+        telemetry.observe(self.name, seconds)
+
+    def quantiles(self, quantiles=(0.5, 0.99)):
+        """Seconds of the quantiles of the latest requests, or NaN."""
+
+        with self._lock:
+            latest = np.array(self._latest)
+
+        if not len(latest):
+            return {quantile: float('nan') for quantile in quantiles}
+
+        return dict(zip(quantiles, np.quantile(latest, quantiles)))
+
+
+class Predictor():
+    """
+    Saved model with the features of the latest rows in memory.
+
+    Attributes:
+        model (object): The model.
+        features (list): Names of the features of the model, in order.
+        keywords (list): Keywords that the features are computed of.
+        dates (pandas.DatetimeIndex): Dates that can be predicted: the kept
+            rows and the next dates of which all features are known.
+        latency (Latency): Latency of the predictions.
+
+    """
+
+    def __init__(self, path, history=None, capacity=512):
+        """
+        Args:
+            path (str): Path of a model saved with ``save``.
+            history (pandas.DataFrame, optional): Google Trends data of dates
+                by keywords to start from, like ``build_dataset.load``.
+                Defaults to starting without rows.
+            capacity (int, optional): Amount of latest rows that are kept and
+                can be predicted. Defaults to 512.
+        """
+
+        with open(path, 'rb') as f:
+            self.model = pickle.load(f)
+
+        with open(f'{path}.json', 'r') as f:
+            metadata = json.load(f)
+
+        self.features = metadata['features']
+        self.periodicity = metadata['periodicity']
+        self.variant = metadata['variant']
+        self.length = metadata['length']
+        self.capacity = capacity
+
+        columns, lags = parse(self.features, metadata['name'])
+        if not lags:
+            raise ValueError('The model has no features.')
+
+        self.keywords = list(dict.fromkeys(columns))
+
+        self._columns = np.array([self.keywords.index(column)
+                                  for column in columns], dtype='int64')
+        self._lags = np.array(lags, dtype='int64')
+        self._ahead = int(self._lags.min())
+        self._depth = int(self._lags.max())
+
+        # The last rows of the data, from which the statistic of new rows is
+        # computed, the statistic of the kept rows, and the features of the
+        # kept rows and the next ones.
+        self._raw = np.empty((0, len(self.keywords)))
+        self._statistics = np.empty((0, len(self.keywords)))
+        self._dates = pd.DatetimeIndex([])
+        self._matrix = np.empty((0, len(self.features)))
+        self.dates = pd.DatetimeIndex([])
+        self._last = None
+
+        self.latency = Latency('predict_model_seconds')
+        self._lock = threading.Lock()
+
+        if history is not None:
+            self.update(history)
+
+    def update(self, rows):
+        """
+        Adds new rows of Google Trends data, and shifts the features of the
+        kept rows. Rows that are not newer than the last row are ignored, and
+        rows of which the lagged rows are before the first row have NaN
+        features.
+
+        Args:
+            rows (pandas.DataFrame): Google Trends data of dates by keywords,
+                with at least the keywords of the features.
+
+        Returns:
+            int: Amount of rows that were added.
+
+        Raises:
+            KeyError: If a keyword of the features is missing.
+
+        """
+
+        rows = rows[self.keywords].sort_index()
+
+        with self._lock:
+            # Filtered under the lock, so that concurrent updates don't both
+            # add the same dates.
+            if self._last is not None:
+                rows = rows[pd.DatetimeIndex(rows.index) > self._last]
+            if not len(rows):
+                return 0
+
+            # The statistic of the new rows only depends on the `length`
+            # rows before them.
+            raw = np.vstack([self._raw, rows.to_numpy(dtype='float64')])
+            statistic = statistics(pd.DataFrame(raw), [self.variant],
+                                   self.length)[self.variant]
+            self._raw = raw[-self.length:]
+
+            # Rows are lagged by up to `depth` rows before them, which are
+            # kept as well.
+            kept = self.capacity + self._depth
+            self._statistics = np.vstack([
+                self._statistics, statistic.to_numpy()[-len(rows):]])[-kept:]
+            self._dates = self._dates.append(
+                pd.DatetimeIndex(rows.index))[-kept:]
+            self._last = self._dates[-1]
+
+            # The features of the kept rows and the next `ahead` ones, of
+            # which the lagged rows are known.
+            positions = np.arange(max(len(self._statistics) - self.capacity,
+                                      0),
+                                  len(self._statistics) + self._ahead)
+            source = positions[:, None] - self._lags[None, :]
+            valid = source >= 0
+
+            self._matrix = np.where(
+                valid, self._statistics[np.where(valid, source, 0),
+                                        self._columns[None, :]], np.nan)
+            self.dates = self._dates[positions[0]:].append(pd.date_range(
+                self._last, periods=self._ahead + 1,
+                freq=STEPS[self.periodicity])[1:])
+
+        telemetry.count('serve_rows_total', len(rows))
+        return len(rows)
+
+    def rows(self, dates):
+        """
+        Features of dates.
+
+        Args:
+            dates (list): Dates to predict.
+
+        Returns:
+            numpy.ndarray: Array of dates by features, in the order of the
+                features of the model.
+
+        Raises:
+            KeyError: If a date is not kept.
+
+        """
+
+        positions = self.dates.get_indexer(pd.to_datetime(dates))
+        if (positions < 0).any():
+            missing = [str(date) for date, position in zip(dates, positions)
+                       if position < 0]
+            raise KeyError(f'Dates {missing} are not kept; the kept dates '
+                           f'are {self.dates[0] if len(self.dates) else None} '
+                           f'to {self.dates[-1] if len(self.dates) else None}.')
+
+        return self._matrix[positions]
+
+    def predict(self, dates):
+        """
+        Predicts dates.
+
+        Args:
+            dates (list): Dates to predict.
+
+        Returns:
+            pandas.Series: Prediction of every date.
+
+        Raises:
+            KeyError: If a date is not kept.
+
+        """
+
+        start = time.perf_counter()
+
+        with self._lock:
+            values = self.rows(dates)
+            predictions = np.asarray(self.model.predict(values))
+
+        self.latency.add(time.perf_counter() - start)
+
+        return pd.Series(predictions, index=pd.to_datetime(dates),
+                         name='prediction')
+
+    def between(self, start=None, end=None):
+        """Kept dates from ``start`` to ``end``."""
+
+        with self._lock:
+            return self.dates[self.dates.slice_indexer(start, end)]
+
+
+class PredictionServer():
+    """
+    Serves the predictions of a ``Predictor`` on localhost in a background
+    thread.
+
+    Endpoints:
+        GET /predict?date=2020-07-01&date=...: Predictions of dates.
+        GET /predict?start=2020-06-01&end=2020-06-30: Predictions of the
+            kept dates in a range.
+        POST /update: JSON object of a `Date` list and a list per keyword
+            of new Google Trends rows.
+        GET /metrics: Latency quantiles and counts in the Prometheus text
+            format.
+        GET /status: The same as JSON, with the kept dates.
+
+    Attributes:
+        predictor (Predictor): Predictor of the requests.
+        url (str): Host of the server.
+        latency (Latency): Latency of the prediction requests, from parsing
+            them to answering them.
+
+    """
+
+    def __init__(self, predictor, host='127.0.0.1', port=0):
+        """
+        Args:
+            predictor (Predictor): Predictor of the requests.
+            host (str, optional): Host to bind to. Defaults to localhost.
+            port (int, optional): Port to bind to. Defaults to a free port.
+        """
+
+        self.predictor = predictor
+        self.latency = Latency('predict_request_seconds')
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.handle(self)
+
+            def do_POST(self):
+                server.handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.url = f'http://{host}:{self._httpd.server_address[1]}'
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, daemon=True)
+
+    def start(self):
+        """Starts serving in a background thread."""
+
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving."""
+
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def handle(self, request):
+        """Answers one request."""
+
+        start = time.perf_counter()
+
+        url = urlparse(request.path)
+        query = parse_qs(url.query)
+
+        try:
+            if url.path == '/predict':
+                dates = query.get('date')
+                if dates is None:
+                    dates = self.predictor.between(
+                        query.get('start', [None])[0],
+                        query.get('end', [None])[0])
+
+                predictions = self.predictor.predict(list(dates))
+                self.respond(request, 200, json.dumps({
+                    'predictions': dict(zip(
+                        predictions.index.strftime('%Y-%m-%d'),
+                        predictions.tolist())),
+                }), 'application/json')
+
+                self.latency.add(time.perf_counter() - start)
+            elif url.path == '/update' and request.command == 'POST':
+                length = int(request.headers.get('Content-Length', 0))
+                rows = pd.DataFrame(json.loads(request.rfile.read(length)))
+                rows = rows.set_index(pd.to_datetime(rows.pop('Date')))
+
+                self.respond(request, 200, json.dumps({
+                    'added': self.predictor.update(rows)}),
+                    'application/json')
+            elif url.path == '/metrics':
+                self.respond(request, 200, self.metrics())
+            elif url.path == '/status':
+                self.respond(request, 200, json.dumps(self.status()),
+                             'application/json')
+            else:
+                self.respond(request, 404, 'Not Found')
+        except (KeyError, ValueError) as exception:
+            # The message of a KeyError is its only argument, unquoted.
+            message = exception.args[0] if exception.args else str(exception)
+            self.respond(request, 400, json.dumps({'error': str(message)}),
+                         'application/json')
+        except Exception as exception:
+            # Like an error of the model, which is still answered.
+            self.respond(request, 500, json.dumps({'error': repr(exception)}),
+                         'application/json')
+
+    def respond(self, request, status, body,
+                content_type='text/plain; charset=utf-8'):
+        body = body.encode()
+
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def status(self):
+        """Latency quantiles, in milliseconds, and the kept dates."""
+
+        dates = self.predictor.between()
+        result = {'requests': self.latency.count}
+        for name, latency in [('request', self.latency),
+                              ('model', self.predictor.latency)]:
+            quantiles = latency.quantiles()
+            result[f'{name}_p50_ms'] = 1000 * quantiles[0.5]
+            result[f'{name}_p99_ms'] = 1000 * quantiles[0.99]
+
+        result['first'] = str(dates[0].date()) if len(dates) else None
+        result['last'] = str(dates[-1].date()) if len(dates) else None
+        return result
+
+    def metrics(self):
+        """Latency quantiles and counts in the Prometheus text format."""
+
+        lines = []
+        for latency in [self.latency, self.predictor.latency]:
+            name = latency.name
+            lines.append(f'# TYPE {name} summary')
+            for quantile, value in latency.quantiles().items():
+                lines.append(f'{name}{{quantile="{quantile}"}} {value}')
+            lines.append(f'{name}_sum {latency.total}')
+            lines.append(f'{name}_count {latency.count}')
+
+        return ''.join(f'{line}\n' for line in lines)
+
+
+if __name__ == '__main__':
+    # Only needed here, so that a predictor can start from any history.
+    from src.features.build_dataset import load
+
+    parser = argparse.ArgumentParser(
+        description='Serves the predictions of a saved model.')
+    parser.add_argument('model', help='path of a model saved with `save`')
+    parser.add_argument('--source', default='data/interim',
+                        help='directory of the keyword CSV-files')
+    parser.add_argument('--capacity', type=int, default=512,
+                        help='amount of latest rows that can be predicted')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    predictor = Predictor(args.model, capacity=args.capacity)
+    predictor.update(load(predictor.periodicity, args.source,
+                          predictor.keywords))
+
+    with PredictionServer(predictor, args.host, args.port) as server:
+        print(f'Serving {len(predictor.features)} features of '
+              f'{len(predictor.keywords)} keywords on {server.url}, '
+              f'{predictor.dates[0].date()} to {predictor.dates[-1].date()}.')
+
+        try:
+            server._thread.join()
+        except KeyboardInterrupt:
+            pass
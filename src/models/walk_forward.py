@@ -0,0 +1,245 @@
+"""
+Evaluates a model with walk-forward (rolling-origin) validation: the model is
+trained on the data before every fold, e.g. every year, and tested on the
+fold, instead of on a single 80/20 split.
+
+The features are written to a memory-mapped file once, which the folds read
+from in parallel processes without copying it. The best features are selected
+again within every fold, using its training rows only.
+
+Usage:
+    results, predictions = walk_forward(LagMatrix(features), y, returns,
+                                        XGBClassifier, workers=8)
+"""
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.features.build_features import LagMatrix
+from src.features.select_features import screen
+from src.models.backtest import backtest
+
+
+def folds(index, frequency='YS', train_periods=None, min_train_periods=250):
+    """
+    Splits rows into walk-forward folds of consecutive periods.
+
+    Args:
+        index (pandas.DatetimeIndex): Dates of the rows, in ascending order.
+        frequency (str, optional): Pandas frequency of the starts of the
+            folds. Defaults to 'YS', a fold per year.
+        train_periods (int, optional): Amount of rows to train on before
+            every fold. Defaults to all rows before the fold.
+        min_train_periods (int, optional): Folds with fewer rows before them
+            are skipped. Defaults to 250.
+
+    Returns:
+        list: (train, test) slices of the row positions of every fold.
+
+    """
+
+    starts = pd.date_range(index[0], index[-1], freq=frequency)
+    bounds = list(index.searchsorted(starts)) + [len(index)]
+
+    splits = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if start < min_train_periods or start == stop:
+            continue
+
+        first = 0 if train_periods is None else max(start - train_periods, 0)
+        splits.append((slice(first, start), slice(start, stop)))
+
+    return splits
+
+
+def scores(y_true, y_pred):
+    """Accuracy, precision, recall and F1 of binary predictions."""
+
+    positives = (y_pred == 1).sum()
+    actual = (y_true == 1).sum()
+    true_positives = ((y_pred == 1) & (y_true == 1)).sum()
+
+    precision = true_positives / positives if positives else 0.0
+    recall = true_positives / actual if actual else 0.0
+    f1 = 2 * precision * recall / (precision + recall) \
+        if precision + recall else 0.0
+
+    return {
+        'accuracy': (y_pred == y_true).mean(),
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+    }
+
+
+def store(features, target, returns, directory):
+    """
+    Writes the features, target and returns of the rows that have all of
+    them to memory-mappable files.
+
+    Returns:
+        tuple: Index and column names of the stored features.
+
+    """
+
+    if isinstance(features, LagMatrix):
+        rows = features.index[features.valid()]
+    else:
+        rows = features.index[features.notna().all(axis=1).to_numpy()]
+
+    index = rows.intersection(target.dropna().index)
+    index = index.intersection(returns.index)
+
+    columns = list(features.columns)
+    positions = features.index.get_indexer(index)
+
+    values = np.lib.format.open_memmap(
+        os.path.join(directory, 'features.npy'), mode='w+', dtype='float64',
+        shape=(len(index), len(columns)))
+
+    if isinstance(features, LagMatrix):
+        width = len(columns) // len(features.lags)
+        for j, lag in enumerate(features.lags):
+            values[:, j * width:(j + 1) * width] = \
+                features.view(lag)[positions]
+    else:
+        values[:] = features.iloc[positions].to_numpy(dtype='float64')
+
+    values.flush()
+    del values
+
+    np.save(os.path.join(directory, 'target.npy'),
+            target.loc[index].to_numpy(dtype='float64'))
+    np.save(os.path.join(directory, 'returns.npy'),
+            np.nan_to_num(returns.loc[index].to_numpy(dtype='float64')))
+
+    return index, columns
+
+
+def evaluate(directory, columns, train, test, model, top, mode,
+             periods_per_year):
+    """
+    Selects features, trains and tests the model on one fold.
+
+    Returns:
+        tuple: Selected features, metrics and predictions of the fold.
+
+    """
+
+    values = np.load(os.path.join(directory, 'features.npy'), mmap_mode='r')
+    target = np.load(os.path.join(directory, 'target.npy'), mmap_mode='r')
+    returns = np.load(os.path.join(directory, 'returns.npy'), mmap_mode='r')
+
+    y_train = pd.Series(target[train])
+    selection = screen(pd.DataFrame(values[train], copy=False), y_train,
+                       top=top, workers=1)
+    selected = list(selection.index)
+
+    estimator = model()
+    estimator.fit(values[train][:, selected], y_train.to_numpy())
+    predictions = np.asarray(estimator.predict(values[test][:, selected]))
+
+    _, stats = backtest(predictions, returns[test], mode, periods_per_year)
+
+    metrics = scores(np.asarray(target[test]), predictions)
+    metrics.update(stats.iloc[0])
+
+    return [columns[i] for i in selected], metrics, predictions
+
+
+def walk_forward(features, target, returns, model, splits=None, top=50,
+                 mode='inverse', periods_per_year=365, workers=None,
+                 directory=None):
+    """
+    Evaluates a model on walk-forward folds.
+
+    Args:
+        features (pandas.DataFrame or LagMatrix): Features of all rows,
+            computed once. Rows with NaN features are left out, like
+            ``dropna``.
+        target (pandas.Series): Binary target, like ``target_binary``, indexed
+            like the features.
+        returns (pandas.Series): Relative price change earned by the
+            prediction of every row, like ``Close.pct_change()``.
+        model (callable): Returns a new unfitted model with ``fit`` and
+            ``predict`` methods, like ``XGBClassifier`` or a
+            ``functools.partial`` of it. It must be picklable when
+            ``workers`` is set.
+        splits (list, optional): (train, test) slices of the row positions of
+            every fold. Defaults to a fold per year, see ``folds``.
+        top (int, optional): Amount of features selected per fold. Defaults
+            to 50.
+        mode (str, optional): Backtest mode, either 'inverse' or 'flat'.
+            Defaults to 'inverse'.
+        periods_per_year (int, optional): Periods in a year. Defaults to 365.
+        workers (int, optional): Amount of processes. Defaults to evaluating
+            all folds in this process.
+        directory (str, optional): Directory in which the features are
+            stored for the workers. Defaults to a temporary directory.
+
+    Returns:
+        tuple: DataFrame with the dates, metrics, backtest statistics and
+            selected features of every fold, and a Series with the
+            predictions of all folds.
+
+    Raises:
+        ValueError: If there are no folds.
+        TypeError: If `features` is not of pandas.DataFrame or LagMatrix type
+            or `target` or `returns` is not of pandas.Series type.
+
+    """
+
+    if not isinstance(features, (pd.DataFrame, LagMatrix)):
+        raise TypeError('`features` must be of type pandas.DataFrame or '
+                        'LagMatrix.')
+
+    if not isinstance(target, pd.Series) or \
+            not isinstance(returns, pd.Series):
+        raise TypeError('`target` and `returns` must be of type '
+                        'pandas.Series.')
+
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        index, columns = store(features, target, returns, temporary)
+
+        if splits is None:
+            splits = folds(index)
+
+        if not splits:
+            raise ValueError('There are no folds to evaluate.')
+
+        arguments = [(temporary, columns, train, test, model, top, mode,
+                      periods_per_year) for train, test in splits]
+
+        if workers is None or workers <= 1:
+            results = [evaluate(*argument) for argument in arguments]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                jobs = [pool.submit(evaluate, *argument)
+                        for argument in arguments]
+                results = [job.result() for job in jobs]
+
+    rows = []
+    for (train, test), (selected, metrics, _) in zip(splits, results):
+        rows.append({
+            'train_start': index[train][0],
+            'train_end': index[train][-1],
+            'test_start': index[test][0],
+            'test_end': index[test][-1],
+            **metrics,
+            'features': selected,
+        })
+
+    predictions = pd.Series(
+        np.concatenate([predictions for _, _, predictions in results]),
+        index=index[np.concatenate([np.arange(len(index))[test]
+                                    for _, test in splits])],
+        name='prediction')
+
+    return pd.DataFrame(rows), predictions
@@ -0,0 +1,137 @@
+"""
+Regression test of ``Trends.adjust_daily`` against the row-by-row
+chain-linking it replaced, on the daily and weekly data in ``data/raw``.
+
+The unadjusted 6-month increments aren't stored, so they are reconstructed
+from every ``data/raw/daily/*.csv``: each increment is scaled back to 0-100
+and rounded, like Google Trends returns it.
+
+Usage:
+    python -m unittest discover tests
+"""
+
+import datetime
+import glob
+import math
+import os
+import unittest
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from src.data.client import Client
+from src.data.make_dataset import Trends
+
+START = datetime.date(2004, 1, 1)
+PERIOD = relativedelta(months=+6)
+
+
+def unadjusted(daily):
+    """Reconstructs the 6-month increments of adjusted daily data."""
+
+    dates = pd.to_datetime(daily['Date']).dt.date
+    values = np.zeros(len(daily))
+
+    start = START
+    while start <= dates.max():
+        mask = ((dates >= start) & (dates < start + PERIOD)).values
+        if mask.any():
+            adjusted = daily['Adjusted'].values[mask]
+            values[mask] = np.round(100 * adjusted / max(adjusted.max(), 1e-9))
+
+        start += PERIOD
+
+    return pd.DataFrame({'Date': daily['Date'], 'relative_frequency': values})
+
+
+def reference(daily, weekly, start_date, end_date):
+    """
+    The chain-linking of ``adjust_daily`` before it was vectorized, on lists:
+    every 6-month increment is anchored on its first day that has weekly
+    data, the days after it follow the percentage change forward, and the
+    days before it backward.
+    """
+
+    values = [value if value != 0 else 1
+              for value in daily['relative_frequency']]
+    change = [math.nan] + [values[i] / values[i - 1]
+                           for i in range(1, len(values))]
+    anchors = dict(zip(weekly['Date'], weekly['Adjusted']))
+
+    adjusted = [None] * len(values)
+
+    start_increment = start_date
+    end_increment = start_date + PERIOD
+    i = 0
+    while True:
+        imported = False
+        while i < len(values):
+            if not imported:
+                if str(start_increment) in anchors:
+                    adjusted[i] = anchors[str(start_increment)]
+                    imported = True
+            else:
+                adjusted[i] = adjusted[i - 1] * change[i]
+
+            start_increment += datetime.timedelta(days=1)
+            i += 1
+
+            if start_increment >= end_increment:
+                break
+
+        start_increment = end_increment
+        end_increment += PERIOD
+
+        if start_increment > end_date:
+            break
+
+    for i in range(len(adjusted) - 1):
+        if adjusted[i] is None:
+            j = 0
+            while True:
+                if adjusted[i + j] is None:
+                    j += 1
+                else:
+                    adjusted[i + j - 1] = adjusted[i + j] / change[i + j]
+                    j -= 1
+
+                if j <= 0:
+                    break
+
+    adjusted = np.array(adjusted, dtype='float64')
+    return np.round(adjusted / adjusted.max(), 2)
+
+
+class TestAdjustDaily(unittest.TestCase):
+
+    def test_raw_daily(self):
+        paths = sorted(glob.glob('data/raw/daily/*.csv'))
+        if not paths:
+            self.skipTest('There is no data in data/raw/daily.')
+
+        for path in paths:
+            keyword = os.path.basename(path)[:-4]
+            with self.subTest(keyword=keyword):
+                daily = unadjusted(pd.read_csv(path))
+                weekly = pd.read_csv(f'data/raw/weekly/{keyword}.csv')
+                end_date = datetime.date.fromisoformat(daily['Date'].iloc[-1])
+
+                trends = Trends(keyword, START, end_date,
+                                client=Client(cache=None))
+                trends.daily = daily.copy()
+                trends.weekly = weekly.copy()
+                trends.adjust_daily()
+
+                self.assertEqual(list(trends.daily.columns),
+                                 ['Date', 'Adjusted'])
+                self.assertTrue((trends.daily['Date'] == daily['Date']).all())
+
+                # Only ties at .005 may round the other way.
+                expected = reference(daily, weekly, START, end_date)
+                np.testing.assert_allclose(trends.daily['Adjusted'].values,
+                                           expected, atol=0.01 + 1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
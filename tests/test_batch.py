@@ -0,0 +1,125 @@
+"""
+Tests of packing keywords into groups that share an anchor, reading "<1",
+and rescaling the groups against the anchor of the first.
+
+Usage:
+    python -m unittest tests.test_batch
+"""
+
+import datetime
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.data.batch import RESOLUTIONS, fetch, groups, split
+from src.data.client import Client
+from src.data.make_dataset import widget_url
+from src.data.responses import ResponseCache
+
+START = datetime.date(2020, 1, 1)
+END = datetime.date(2020, 1, 3)
+DATES = ['2020-01-01', '2020-01-02', '2020-01-03']
+
+# Nothing listens here; the responses are only replayed.
+HOST = 'http://127.0.0.1:9'
+
+
+def fetched(values):
+    """Result of ``fetch`` with the same window in every resolution."""
+
+    frame = pd.DataFrame({'Date': DATES, **values}).astype(
+        {keyword: 'float64' for keyword in values})
+    return {resolution: [(False, frame.copy())] for resolution in RESOLUTIONS}
+
+
+class TestGroups(unittest.TestCase):
+
+    def test_groups(self):
+        keywords = ['debt', 'a', 'b', 'c', 'd', 'e', 'a']
+
+        self.assertEqual(groups(keywords, 'debt'),
+                         [['debt', 'a', 'b', 'c', 'd'], ['debt', 'e']])
+        self.assertEqual(groups(keywords, 'debt', size=3),
+                         [['debt', 'a', 'b'], ['debt', 'c', 'd'],
+                          ['debt', 'e']])
+        self.assertEqual(groups(['debt'], 'debt'), [['debt']])
+        self.assertEqual(groups(['a'], 'debt'), [['debt', 'a']])
+
+        with self.assertRaises(ValueError):
+            groups(keywords, 'debt', size=6)
+
+
+class TestSplit(unittest.TestCase):
+
+    def test_rescale(self):
+        # The anchor is 2.5 times as high in the second group, so the
+        # second group is rescaled by 0.4.
+        reference = fetched({'debt': [10, 20, 30], 'a': [1, 2, 3]})
+        second = fetched({'debt': [25, 50, 75], 'b': [1, 0, 2]})
+
+        frames = split([(['debt', 'a'], reference),
+                        (['debt', 'b'], second)], 'debt')
+
+        self.assertEqual(set(frames), {'debt', 'a', 'b'})
+        for periodicity in RESOLUTIONS.values():
+            np.testing.assert_allclose(
+                frames['debt'][periodicity]['relative_frequency'],
+                [10, 20, 30])
+            np.testing.assert_allclose(
+                frames['a'][periodicity]['relative_frequency'], [1, 2, 3])
+
+            # A zero is rescaled like a 1, so it doesn't rank above a "<1".
+            np.testing.assert_allclose(
+                frames['b'][periodicity]['relative_frequency'],
+                [0.4, 0.4, 0.8])
+
+    def test_unanchored(self):
+        reference = fetched({'debt': [10, 20, 30], 'a': [1, 2, 3]})
+        second = fetched({'debt': [0, 0, 0], 'b': [4, 5, 6]})
+
+        frames = split([(['debt', 'a'], reference),
+                        (['debt', 'b'], second)], 'debt')
+
+        np.testing.assert_allclose(
+            frames['b']['daily']['relative_frequency'], [4, 5, 6])
+
+
+class TestFetch(unittest.TestCase):
+
+    def test_less_than_one(self):
+        group = ['debt', 'a']
+        windows = [(START, END, False)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResponseCache(directory)
+
+            for resolution, column in [('DAY', 'Day'), ('WEEK', 'Week'),
+                                       ('MONTH', 'Month')]:
+                url = widget_url(HOST, group, START, END, resolution, '')
+                text = '\n'.join(
+                    ['Category: All categories', '',
+                     f'{column},debt: (United States),a: (United States)',
+                     '2020-01-01,100,<1', '2020-01-02,50,0',
+                     '2020-01-03,75,3']) + '\n'
+
+                cache.put(cache.path(url), text)
+                cache.record(group, START, resolution, windows)
+
+            client = Client(host=HOST, cache=None,
+                            responses=ResponseCache(directory, offline=True))
+            result = fetch(group, client, START, END)
+
+        self.assertEqual(client.requests, 0)
+        for resolution in RESOLUTIONS:
+            (overlap, frame), = result[resolution]
+
+            self.assertFalse(overlap)
+            self.assertEqual(list(frame.columns), ['Date', 'debt', 'a'])
+            np.testing.assert_array_equal(frame['a'], [1.0, 0.0, 3.0])
+            self.assertEqual(frame['a'].dtype, 'float64')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""
+Tests of the keys, invalidation and size accounting of the feature cache.
+
+Usage:
+    python -m unittest tests.test_cache
+"""
+
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src.features.build_features import sma
+from src.features.cache import FeatureCache
+
+
+class TestFeatureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = FeatureCache(os.path.join(self.directory.name, 'cache'))
+        self.path = os.path.join(self.directory.name, 'debt.csv')
+
+        pd.DataFrame({'Date': pd.date_range('2020-01-01', periods=30),
+                      'Adjusted': [i / 30 for i in range(30)]}).to_csv(
+            self.path, index=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_keys(self):
+        series = pd.Series([float(i) for i in range(10)])
+
+        self.assertEqual(self.cache.key(sma, series),
+                         self.cache.key(sma, series, 6))
+        self.assertEqual(self.cache.key(sma, series),
+                         self.cache.key(sma, series=series.copy(), length=6))
+        self.assertNotEqual(self.cache.key(sma, series),
+                            self.cache.key(sma, series + 1))
+
+    def test_read(self):
+        series = self.cache.read(self.path, 'Adjusted', index_col='Date')
+        pd.testing.assert_series_equal(self.cache(sma, series), sma(series))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+        # A new session finds the result on disk without hashing the file.
+        cache = FeatureCache(self.cache.directory)
+        again = cache.read(self.path, 'Adjusted', index_col='Date')
+        cache(sma, again)
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+        # An edited file gets new keys.
+        frame = pd.read_csv(self.path)
+        frame.loc[29, 'Adjusted'] = 2.0
+        frame.to_csv(self.path, index=False)
+        os.utime(self.path, ns=(0, os.stat(self.path).st_mtime_ns + 1))
+
+        edited = cache.read(self.path, 'Adjusted', index_col='Date')
+        pd.testing.assert_series_equal(cache(sma, edited), sma(edited))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_copy(self):
+        series = self.cache.read(self.path, 'Adjusted', index_col='Date')
+
+        result = self.cache(sma, series)
+        result.iloc[:] = 0
+        pd.testing.assert_series_equal(self.cache(sma, series), sma(series))
+
+    def test_overwrite(self):
+        result = pd.Series(range(1000))
+
+        self.cache.put('key', result)
+        size = self.cache.size
+        self.cache.put('key', result)
+
+        self.assertEqual(self.cache.size, size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Test of recording the raw responses of Google Trends against the stand-in
+server and replaying them offline, after the date has moved on.
+
+Usage:
+    python -m unittest tests.test_responses
+"""
+
+import datetime
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from src.data.client import Client
+from src.data.make_dataset import Trends
+from src.data.responses import ResponseCache
+from src.data.scheduler import RateLimiter
+from src.data.stand_in import StandInServer
+
+START = datetime.date(2019, 1, 1)
+END = datetime.date(2020, 6, 15)
+
+
+def pull(client, end_date, keyword='debt'):
+    """Pulls the unadjusted data of a keyword."""
+
+    trends = Trends(keyword, START, end_date, client=client)
+    trends.pull_daily()
+    trends.pull_weekly()
+    trends.pull_monthly()
+
+    return trends
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.responses = os.path.join(self.directory.name, 'responses')
+
+        with StandInServer(capacity=1000, latency=0) as server:
+            client = Client(host=server.url, cache=None,
+                            limiter=RateLimiter(rate=1000, burst=10),
+                            responses=ResponseCache(self.responses))
+            self.recorded = pull(client, END)
+            self.requests = server.requests
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def replay(self, end_date):
+        client = Client(host='http://127.0.0.1:9', cache=None,
+                        responses=ResponseCache(self.responses, offline=True))
+        return pull(client, end_date), client
+
+    def test_replay(self):
+        self.assertGreater(self.requests, 0)
+
+        # A day later the monthly window ends a day later, and half a year
+        # later there is another daily window.
+        for end_date in [END + datetime.timedelta(days=1),
+                         datetime.date(2021, 1, 15)]:
+            with self.subTest(end_date=end_date):
+                replayed, client = self.replay(end_date)
+
+                self.assertEqual(client.requests, 0)
+                for periodicity in ['daily', 'weekly', 'monthly']:
+                    pd.testing.assert_frame_equal(
+                        getattr(replayed, periodicity),
+                        getattr(self.recorded, periodicity))
+
+    def test_missing(self):
+        client = Client(host='http://127.0.0.1:9', cache=None,
+                        responses=ResponseCache(self.responses, offline=True))
+
+        with self.assertRaises(LookupError):
+            pull(client, END, keyword='bonds')
+
+    def test_overwrite(self):
+        cache = ResponseCache(self.responses)
+        size = cache.size
+        path = cache.paths()[0]
+
+        with open(path, 'r') as f:
+            text = f.read()
+
+        cache.put(path, text)
+        self.assertEqual(cache.size, size)
+
+
+if __name__ == '__main__':
+    unittest.main()
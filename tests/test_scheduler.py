@@ -0,0 +1,126 @@
+"""
+Tests of the shared rate limiter and the retrying scheduler, on their own and
+against the stand-in server, which answers with HTTP 429 above its capacity.
+
+Usage:
+    python -m unittest tests.test_scheduler
+"""
+
+import contextlib
+import datetime
+import io
+import threading
+import time
+import unittest
+
+from src.data.client import Client
+from src.data.make_dataset import Trends
+from src.data.scheduler import RateLimiter, Scheduler
+from src.data.stand_in import StandInServer
+
+
+class Throttled(Exception):
+    """Exception like the one of an HTTP 429 response."""
+
+    code = 429
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_rate(self):
+        limiter = RateLimiter(rate=50, burst=5)
+
+        start = time.monotonic()
+        for _ in range(30):
+            limiter.acquire()
+
+        # The burst is free, the other 25 tokens take 0.5 s.
+        self.assertGreaterEqual(time.monotonic() - start, 0.45)
+
+    def test_backoff(self):
+        limiter = RateLimiter(rate=10, retries=2)
+        attempts = []
+
+        def request():
+            attempts.append(None)
+            if len(attempts) < 3:
+                raise Throttled()
+            return 'ok'
+
+        self.assertEqual(limiter.request(request), 'ok')
+        self.assertEqual(limiter.throttled, 2)
+        self.assertLess(limiter.rate, 10)
+
+        # Other errors aren't retried.
+        with self.assertRaises(ValueError):
+            limiter.request(int, 'x')
+
+    def test_retries(self):
+        limiter = RateLimiter(rate=100, retries=1)
+
+        def request():
+            raise Throttled()
+
+        with self.assertRaises(Throttled):
+            limiter.request(request)
+        self.assertEqual(limiter.throttled, 2)
+
+
+class TestScheduler(unittest.TestCase):
+
+    def test_retry(self):
+        scheduler = Scheduler(workers=3, rate=100, retries=2, backoff=0.01,
+                              max_backoff=0.01)
+        attempts = {}
+        lock = threading.Lock()
+
+        def job(item):
+            with lock:
+                attempts[item] = attempts.get(item, 0) + 1
+                attempt = attempts[item]
+
+            # 'flaky' succeeds on its second attempt, 'broken' never does.
+            if item == 'broken' or (item == 'flaky' and attempt < 2):
+                raise RuntimeError(item)
+
+            return item.upper()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results, failed = scheduler.run(job, ['a', 'flaky', 'broken'])
+
+        self.assertEqual(results, {'a': 'A', 'flaky': 'FLAKY'})
+        self.assertEqual(list(failed), ['broken'])
+        self.assertEqual(attempts, {'a': 1, 'flaky': 2, 'broken': 3})
+
+    def test_stand_in(self):
+        scheduler = Scheduler(workers=4, rate=200, burst=4, backoff=0.1,
+                              max_backoff=0.5)
+        keywords = [f'keyword {i}' for i in range(4)]
+
+        with StandInServer(capacity=10, latency=0) as server:
+            client = Client(host=server.url, limiter=scheduler.limiter,
+                            cache=None, pool_size=4)
+
+            def job(keyword):
+                trends = Trends(keyword, datetime.date(2024, 1, 1),
+                                datetime.date(2025, 1, 1), client=client)
+                trends.fetch()
+                return trends
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                results, failed = scheduler.run(job, keywords)
+
+        self.assertEqual(failed, {})
+        self.assertEqual(sorted(results), keywords)
+
+        # The server throttled, and the limiter backed off.
+        self.assertGreater(server.throttled, 0)
+        self.assertGreater(scheduler.limiter.throttled, 0)
+
+        for trends in results.values():
+            self.assertEqual(list(trends.daily.columns), ['Date', 'Adjusted'])
+            self.assertAlmostEqual(trends.daily['Adjusted'].max(), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()